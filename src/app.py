@@ -1,4 +1,6 @@
-﻿import logging
+﻿import asyncio
+import logging
+import time
 
 from contextlib import asynccontextmanager
 
@@ -6,14 +8,19 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import logging, sys
 
-from .domain import models
-from sqlalchemy import inspect
-from src.infrastructure.infrastructure import engine
+from src.infrastructure.infrastructure import dispose_async_engine, cerrar_publisher
+from src.infrastructure.bootstrap import inicializar_schemas
+from src.infrastructure.http import cerrar_http_session
 from .config import settings
 from .routes.health import router as health_router
 from .routes.planes import router as planes_router
 from .routes.visitas import router as visitas_router
+from .routes.planes_async import router as planes_async_router
+from .routes.visitas_async import router as visitas_async_router
 from .routes.pubsub import router as pubsub_router
+from .routes.metricas import router as metricas_router
+from .routes.jobs import router as jobs_router
+from .services.eventos import cerrar_despachador
 
 
 log = logging.getLogger(__name__)
@@ -24,20 +31,24 @@ logging.basicConfig(
     handlers=[logging.StreamHandler(sys.stdout)],
 )
 
-KNOWN_SCHEMAS = ["co","ec","mx","pe"]  # o desde ENV
-
 @asynccontextmanager
 async def lifespan(app):
-    for schema in KNOWN_SCHEMAS:
-        try:
-            eng = engine.execution_options(schema_translate_map={None: schema})
-            models.Base.metadata.create_all(bind=eng)
-            inspector = inspect(eng)
-            tables = inspector.get_table_names(schema=schema)
-            log.info(f"✅ {len(tables)} tablas creadas/verificadas en schema '{schema}': {tables}")
-        except Exception as e:
-            log.error(f"❌ Error creando tablas en schema {schema}: {e}")
+    inicio = time.perf_counter()
+    # Los schemas se inicializan en paralelo; los que ya tienen la huella vigente se saltan
+    resultados = await asyncio.to_thread(inicializar_schemas, settings.KNOWN_SCHEMAS)
+    for r in resultados:
+        if r["estado"] == "error":
+            log.error(f"❌ Error creando tablas en schema {r['schema']}: {r['error']}")
+        else:
+            log.info(f"✅ Schema '{r['schema']}' {r['estado']} en {r['duracion_ms']} ms")
+    log.info(f"Bootstrap de schemas completado en {(time.perf_counter() - inicio) * 1000:.1f} ms")
+    app.state.bootstrap = resultados
     yield
+    await asyncio.to_thread(cerrar_despachador)
+    # lotes de Pub/Sub abiertos: se envían y se espera su confirmación antes de salir
+    await asyncio.to_thread(cerrar_publisher)
+    await dispose_async_engine()
+    cerrar_http_session()
     log.info("🛑 Finalizando aplicación ms-ventas-crm")
 
 app = FastAPI(
@@ -55,6 +66,13 @@ app.add_middleware(
 )
 
 app.include_router(health_router)
-app.include_router(planes_router)
-app.include_router(visitas_router)
-app.include_router(pubsub_router)
\ No newline at end of file
+if settings.DB_ASYNC:
+    # Handlers async sobre asyncpg: no consumen slots del threadpool de AnyIO
+    app.include_router(planes_async_router)
+    app.include_router(visitas_async_router)
+else:
+    app.include_router(planes_router)
+    app.include_router(visitas_router)
+app.include_router(pubsub_router)
+app.include_router(metricas_router)
+app.include_router(jobs_router)
\ No newline at end of file
@@ -14,16 +14,118 @@ class Settings:
 
     REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
     REDIS_PORT = os.getenv("REDIS_PORT", "6379")
+    REDIS_TIMEOUT = float(os.getenv("REDIS_TIMEOUT", "0.5"))  # segundos; la caché nunca debe frenar al origen
 
     SQLALCHEMY_DATABASE_URI = (
     f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
     )
 
+    # Réplica de lectura opcional para los GET; sin host, todo va al primario
+    DB_REPLICA_HOST = os.getenv("DB_REPLICA_HOST")
+    DB_REPLICA_PORT = int(os.getenv("DB_REPLICA_PORT", str(DB_PORT)))
+    SQLALCHEMY_REPLICA_DATABASE_URI = (
+    f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_REPLICA_HOST}:{DB_REPLICA_PORT}/{DB_NAME}"
+    ) if DB_REPLICA_HOST else None
+    SQLALCHEMY_ASYNC_REPLICA_DATABASE_URI = (
+    f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_REPLICA_HOST}:{DB_REPLICA_PORT}/{DB_NAME}"
+    ) if DB_REPLICA_HOST else None
+    # Tras una escritura, las lecturas del mismo llamante van al primario durante esta ventana (segundos)
+    DB_REPLICA_VENTANA_LECTURA_PROPIA = float(os.getenv("DB_REPLICA_VENTANA_LECTURA_PROPIA", "10"))
+
+    # Pool de conexiones (aplica al engine sync y al async)
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # segundos
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # segundos esperando conexión libre
+    # Pre-ping: "siempre" (cada checkout) | "inactiva" (solo si estuvo ociosa > DB_PRE_PING_INACTIVIDAD) | "nunca"
+    DB_PRE_PING = os.getenv("DB_PRE_PING", "inactiva").lower()
+    DB_PRE_PING_INACTIVIDAD = float(os.getenv("DB_PRE_PING_INACTIVIDAD", "60"))  # segundos
+
+    # Ruta async (asyncpg): routers y servicios async en lugar de los sync con threadpool
+    DB_ASYNC = os.getenv("DB_ASYNC", "false").lower() in ("1", "true", "yes", "si")
+    SQLALCHEMY_ASYNC_DATABASE_URI = (
+    f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+    )
+
     DEFAULT_SCHEMA = os.getenv("DEFAULT_SCHEMA", "co")
+    # Un schema por país; X-Country fuera de esta lista se rechaza (no se crean schemas a demanda)
+    KNOWN_SCHEMAS = [s.strip().lower() for s in os.getenv("KNOWN_SCHEMAS", "co,ec,mx,pe").split(",") if s.strip()]
     COUNTRY_HEADER = os.getenv("COUNTRY_HEADER", "X-Country")
     GATEWAY_BASE_URL = os.getenv("GATEWAY_BASE_URL", "https://medisupply-gw-5k2l9pfv.uc.gateway.dev")
+    # Cliente HTTP hacia el gateway: sesión compartida con pool keep-alive por host
+    HTTP_POOL_CONEXIONES = int(os.getenv("HTTP_POOL_CONEXIONES", "4"))  # hosts con pool propio
+    HTTP_POOL_MAXIMO = int(os.getenv("HTTP_POOL_MAXIMO", "20"))  # conexiones por host
+    HTTP_POOL_BLOQUEANTE = os.getenv("HTTP_POOL_BLOQUEANTE", "true").lower() in ("1", "true", "yes", "si")
+    HTTP_TIMEOUT_CONEXION = float(os.getenv("HTTP_TIMEOUT_CONEXION", "3.05"))  # segundos
+    HTTP_TIMEOUT_LECTURA = float(os.getenv("HTTP_TIMEOUT_LECTURA", "30"))  # segundos
+    # Reintentos (solo GET) ante 429/5xx y fallos de conexión, con backoff exponencial + jitter
+    HTTP_REINTENTOS = int(os.getenv("HTTP_REINTENTOS", "3"))
+    HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", "0.3"))  # segundos, base del backoff
+    HTTP_BACKOFF_JITTER = float(os.getenv("HTTP_BACKOFF_JITTER", "0.3"))  # segundos aleatorios extra
+    # Tope (segundos) a la espera que pide un Retry-After: un upstream no retiene al handler sin límite
+    HTTP_RETRY_AFTER_MAXIMO = float(os.getenv("HTTP_RETRY_AFTER_MAXIMO", "5"))
+
+    # Lectura paginada de ms-pedidos: tamaño de página y páginas en vuelo a la vez
+    PEDIDOS_TAMANO_PAGINA = int(os.getenv("PEDIDOS_TAMANO_PAGINA", "200"))
+    PEDIDOS_PARALELISMO = int(os.getenv("PEDIDOS_PARALELISMO", "4"))
+    # Caché Redis de /v1/pedidos por país/tipo/fecha: fechas pasadas casi no cambian
+    PEDIDOS_CACHE = os.getenv("PEDIDOS_CACHE", "true").lower() in ("1", "true", "yes", "si")
+    PEDIDOS_CACHE_TTL_PASADO = int(os.getenv("PEDIDOS_CACHE_TTL_PASADO", "86400"))  # segundos
+    PEDIDOS_CACHE_TTL_ACTUAL = int(os.getenv("PEDIDOS_CACHE_TTL_ACTUAL", "60"))  # segundos
+    PEDIDOS_CACHE_ESPERA_LOCK = float(os.getenv("PEDIDOS_CACHE_ESPERA_LOCK", "10"))  # segundos
+    # Caché de respuestas de listados (planes, visitas): L1 en proceso + Redis
+    CACHE_RESPUESTAS = os.getenv("CACHE_RESPUESTAS", "true").lower() in ("1", "true", "yes", "si")
+    CACHE_RESPUESTAS_TTL = int(os.getenv("CACHE_RESPUESTAS_TTL", "300"))  # segundos en Redis
+    CACHE_L1_MAX = int(os.getenv("CACHE_L1_MAX", "2000"))  # entradas por instancia
+    CACHE_L1_TTL = float(os.getenv("CACHE_L1_TTL", "30"))  # segundos
+    # Cada cuánto se relee de Redis la generación de un espacio: retraso máximo con
+    # el que una instancia ve la invalidación hecha por otra
+    CACHE_L1_TTL_GENERACION = float(os.getenv("CACHE_L1_TTL_GENERACION", "2"))
+    # De-duplicación de /pubsub: por messageId (reentregas) y por clave lógica del
+    # evento (publicaciones repetidas del mismo recálculo), en Redis o en memoria
+    PUBSUB_DEDUP = os.getenv("PUBSUB_DEDUP", "true").lower() in ("1", "true", "yes", "si")
+    PUBSUB_DEDUP_VENTANA = float(os.getenv("PUBSUB_DEDUP_VENTANA", "3600"))  # segundos por messageId
+    # por (evento, plan, fecha), solo con COALESCER_RECALCULO apagado; por defecto la
+    # misma ventana que el debounce al publicar: lo que se publicó también se procesa
+    PUBSUB_DEDUP_VENTANA_LOGICA = float(
+        os.getenv("PUBSUB_DEDUP_VENTANA_LOGICA", os.getenv("COALESCER_VENTANA_PUBLICACION", "10"))
+    )
+    PUBSUB_DEDUP_MAX_MEMORIA = int(os.getenv("PUBSUB_DEDUP_MAX_MEMORIA", "10000"))  # claves sin Redis
+    # Coalescencia de recálculos por (país, plan, fecha): debounce al publicar y
+    # como mucho uno en vuelo al consumir; lock en Redis o advisory lock de Postgres
+    COALESCER_RECALCULO = os.getenv("COALESCER_RECALCULO", "true").lower() in ("1", "true", "yes", "si")
+    COALESCER_BACKEND = os.getenv("COALESCER_BACKEND", "redis").lower()  # redis | postgres
+    COALESCER_VENTANA_PUBLICACION = float(os.getenv("COALESCER_VENTANA_PUBLICACION", "10"))  # segundos
+    COALESCER_LOCK_TTL = float(os.getenv("COALESCER_LOCK_TTL", "900"))  # segundos; > recálculo más largo
+    COALESCER_MAX_REPETICIONES = int(os.getenv("COALESCER_MAX_REPETICIONES", "3"))
     GCS_BUCKET_PREFIX = os.getenv("GCS_BUCKET_PREFIX", "misw4301-g26-medi")
 
+    # Publicación en Pub/Sub: lotes (lo que se cumpla primero) y control de flujo
+    # de lo pendiente de confirmar; al apagar se espera a lo pendiente hasta PUBSUB_FLUSH_TIMEOUT
+    PUBSUB_BATCH_MAX_MENSAJES = int(os.getenv("PUBSUB_BATCH_MAX_MENSAJES", "100"))
+    PUBSUB_BATCH_MAX_BYTES = int(os.getenv("PUBSUB_BATCH_MAX_BYTES", "1000000"))
+    PUBSUB_BATCH_MAX_LATENCIA = float(os.getenv("PUBSUB_BATCH_MAX_LATENCIA", "0.05"))  # segundos
+    PUBSUB_FLOW_MAX_MENSAJES = int(os.getenv("PUBSUB_FLOW_MAX_MENSAJES", "1000"))
+    PUBSUB_FLOW_MAX_BYTES = int(os.getenv("PUBSUB_FLOW_MAX_BYTES", "10000000"))
+    PUBSUB_FLOW_AL_EXCEDER = os.getenv("PUBSUB_FLOW_AL_EXCEDER", "block").lower()  # block | error | ignore
+    PUBSUB_FLUSH_TIMEOUT = float(os.getenv("PUBSUB_FLUSH_TIMEOUT", "10"))  # segundos
+
+    # Worker de streaming pull (python -m src.worker), alternativa al push a /pubsub
+    PUBSUB_SUSCRIPCION_VENTAS_CRM = os.getenv("PUBSUB_SUSCRIPCION_VENTAS_CRM")  # projects/.../subscriptions/...
+    WORKER_MAX_MENSAJES = int(os.getenv("WORKER_MAX_MENSAJES", "100"))  # sin ack a la vez
+    WORKER_MAX_BYTES = int(os.getenv("WORKER_MAX_BYTES", "104857600"))
+    WORKER_HILOS = int(os.getenv("WORKER_HILOS", "8"))
+
+    # Despacho de eventos (push y worker): máximo de eventos en curso por tipo, para
+    # que una ráfaga de un tipo no acapare a los demás. "tipo=n,tipo=n" sobrescribe
+    # lo declarado por cada handler; los tipos sin límite declarado usan el por defecto
+    EVENTOS_CONCURRENCIA = os.getenv("EVENTOS_CONCURRENCIA", "")
+    EVENTOS_CONCURRENCIA_DEFECTO = int(os.getenv("EVENTOS_CONCURRENCIA_DEFECTO", "4"))
+
+    # Recálculo de fin de día de todos los países (POST /jobs/recalculo-progreso,
+    # python -m src.recalculo): un lote por schema, a lo sumo N schemas a la vez
+    RECALCULO_PAISES_PARALELISMO = int(os.getenv("RECALCULO_PAISES_PARALELISMO", "4"))
+
     TOPIC_PEDIDOS = os.getenv("TOPIC_PEDIDOS")
     TOPIC_INVENTARIO = os.getenv("TOPIC_INVENTARIO")
     TOPIC_LOGISTICA = os.getenv("TOPIC_LOGISTICA")
@@ -1,9 +1,20 @@
 import uuid
+from contextlib import asynccontextmanager, contextmanager
 
-from fastapi import Header, Request
+from fastapi import Depends, Header, Request, HTTPException
 from dataclasses import dataclass
+from sqlalchemy import event
 from src.config import settings
-from src.infrastructure.infrastructure import session_for_schema
+from src.errors import ValidationError
+from src.infrastructure.infrastructure import (
+    session_for_schema,
+    async_session_for_schema,
+    resolver_schema,
+    registro_escrituras,
+    tras_commit,
+)
+
+_INFO_ESCRIBIO = "escribio"
 
 @dataclass
 class AuditContext:
@@ -13,11 +24,109 @@ class AuditContext:
     ip: str | None
 
 
-def get_session(X_Country: str | None = Header(default=None, alias=settings.COUNTRY_HEADER)):
-    schema = (X_Country or settings.DEFAULT_SCHEMA).strip().lower()
+def get_schema(X_Country: str | None = Header(default=None, alias=settings.COUNTRY_HEADER)) -> str:
+    try:
+        return resolver_schema(X_Country)
+    except ValidationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _clave_llamante(request: Request, schema: str) -> str:
+    quien = (
+        request.headers.get("X-User-Id")
+        or (request.headers.get("X-Forwarded-For") or "").split(",")[0].strip()
+        or (request.client.host if request.client else "anon")
+    )
+    return f"{schema}:{quien}"
+
+
+def _lee_de_replica(request: Request, schema: str) -> bool:
+    # read-your-writes: si el llamante escribió hace poco, se lee del primario
+    return not registro_escrituras.escritura_reciente(
+        _clave_llamante(request, schema), settings.DB_REPLICA_VENTANA_LECTURA_PROPIA
+    )
+
+
+def _registrar_si_escribe(session, clave: str) -> None:
+    """
+    Registra al llamante en registro_escrituras solo si la sesión escribe de
+    verdad (flush con cambios o DML explícito, p. ej. los upserts): un POST que
+    solo lee no manda sus lecturas al primario. Se registra al escribir y otra
+    vez tras el commit, que es desde cuando cuenta la ventana de lectura propia.
+    """
+    sesion = getattr(session, "sync_session", session)
+
+    def escribio(s) -> None:
+        if s.info.get(_INFO_ESCRIBIO):
+            return
+        s.info[_INFO_ESCRIBIO] = True
+        registro_escrituras.registrar(clave)
+        tras_commit(s, lambda: registro_escrituras.registrar(clave))
+
+    @event.listens_for(sesion, "after_flush")
+    def _tras_flush(s, _contexto) -> None:
+        escribio(s)
+
+    @event.listens_for(sesion, "do_orm_execute")
+    def _tras_execute(estado) -> None:
+        if estado.is_insert or estado.is_update or estado.is_delete:
+            escribio(estado.session)
+
+
+def get_session(request: Request, X_Country: str | None = Header(default=None, alias=settings.COUNTRY_HEADER)):
+    schema = get_schema(X_Country)
     with session_for_schema(schema) as session:
+        _registrar_si_escribe(session, _clave_llamante(request, schema))
+        yield session
+
+
+def get_read_session(request: Request, X_Country: str | None = Header(default=None, alias=settings.COUNTRY_HEADER)):
+    """Sesión para GETs: réplica si está configurada, salvo escritura reciente del llamante."""
+    schema = get_schema(X_Country)
+    with session_for_schema(schema, solo_lectura=_lee_de_replica(request, schema)) as session:
         yield session
 
+
+async def get_async_session(request: Request, X_Country: str | None = Header(default=None, alias=settings.COUNTRY_HEADER)):
+    schema = get_schema(X_Country)
+    async with async_session_for_schema(schema) as session:
+        _registrar_si_escribe(session, _clave_llamante(request, schema))
+        yield session
+
+
+async def get_async_read_session(request: Request, X_Country: str | None = Header(default=None, alias=settings.COUNTRY_HEADER)):
+    schema = get_schema(X_Country)
+    async with async_session_for_schema(schema, solo_lectura=_lee_de_replica(request, schema)) as session:
+        yield session
+
+
+class Lectura:
+    """
+    Sesión de lectura perezosa para los listados cacheados: la conexión se pide
+    recién al entrar en sesion() / sesion_async(), así que un hit de la caché de
+    respuestas no ocupa ninguna. Réplica salvo escritura reciente del llamante
+    o primario=True.
+    """
+
+    def __init__(self, schema: str, replica: bool):
+        self.schema = schema
+        self.replica = replica
+
+    @contextmanager
+    def sesion(self, primario: bool = False):
+        with session_for_schema(self.schema, solo_lectura=self.replica and not primario) as session:
+            yield session
+
+    @asynccontextmanager
+    async def sesion_async(self, primario: bool = False):
+        async with async_session_for_schema(self.schema, solo_lectura=self.replica and not primario) as session:
+            yield session
+
+
+def get_lectura(request: Request, schema: str = Depends(get_schema)) -> Lectura:
+    return Lectura(schema, _lee_de_replica(request, schema))
+
+
 def audit_context(request: Request) -> AuditContext:
     rid = request.headers.get("X-Request-ID") or uuid.uuid4().hex
     uid = None
@@ -1,8 +1,13 @@
 from __future__ import annotations
-from datetime import date, datetime
+from datetime import date, datetime, timezone
 from typing import Optional
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy import String, Integer, Date, DateTime, Numeric, ForeignKey, UniqueConstraint, Text, func, Boolean
+from sqlalchemy import String, Integer, Date, DateTime, Numeric, ForeignKey, UniqueConstraint, Index, Text, Boolean
+
+
+def ahora_utc() -> datetime:
+    """Timestamp UTC naive con microsegundos (desempate estable para la paginación keyset)."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
 
 
 class Base(DeclarativeBase):
@@ -33,14 +38,18 @@ class PlanDeVentas(Base):
     productos: Mapped[list["PlanDeVentasProducto"]] = relationship(back_populates="plan", cascade="all, delete-orphan")
     progresos: Mapped[list["ProgresoPlanDeVentas"]] = relationship(back_populates="plan", cascade="all, delete-orphan")
 
-    creado_en: Mapped[datetime] = mapped_column(DateTime, default=func.now(), nullable=False)
-    actualizado_en: Mapped[datetime] = mapped_column(DateTime, default=func.now(), onupdate=func.now(), nullable=False)
+    creado_en: Mapped[datetime] = mapped_column(DateTime, default=ahora_utc, nullable=False)
+    actualizado_en: Mapped[datetime] = mapped_column(DateTime, default=ahora_utc, onupdate=ahora_utc, nullable=False)
 
     __table_args__ = (
         UniqueConstraint(
             "id_vendedor", "id_cliente_objetivo", "periodo", "fecha_inicio", "fecha_fin",
             name="uq_plan_unico"
         ),
+        # listados keyset (creado_en, id) con y sin filtro por activo; vigencia por rango de fechas
+        Index("ix_plan_de_ventas_creado_id", "creado_en", "id"),
+        Index("ix_plan_de_ventas_activo_creado_id", "activo", "creado_en", "id"),
+        Index("ix_plan_de_ventas_vigencia", "fecha_inicio", "fecha_fin"),
     )
 
 class PlanDeVentasProducto(Base):
@@ -69,8 +78,42 @@ class ProgresoPlanDeVentas(Base):
     clientes_actuales: Mapped[int] = mapped_column(Integer, default=0)
     pedidos_contados: Mapped[int] = mapped_column(Integer, default=0)
 
+    # versión de la fila (ETag de /progreso); NULL en filas anteriores a la columna
+    actualizado_en: Mapped[Optional[datetime]] = mapped_column(DateTime, default=ahora_utc, onupdate=ahora_utc)
+
     plan: Mapped["PlanDeVentas"] = relationship(back_populates="progresos")
 
+    __table_args__ = (
+        # un registro por plan y día: destino del INSERT ... ON CONFLICT del recálculo
+        Index("uq_progreso_plan_fecha", "id_plan", "fecha", unique=True),
+    )
+
+
+class AporteProgreso(Base):
+    """
+    Lo que cada pedido aporta al progreso de un plan en su fecha_compromiso.
+    Lo escribe el recálculo por lote (reconciliación) y lo ajustan los eventos
+    de pedidos: un evento aplica al progreso la diferencia con lo registrado aquí.
+    """
+    __tablename__ = "aporte_progreso"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    id_pedido: Mapped[str] = mapped_column(String(64), nullable=False)
+    id_plan: Mapped[str] = mapped_column(ForeignKey("plan_de_ventas.id", ondelete="CASCADE"), nullable=False)
+    fecha: Mapped[date] = mapped_column(Date, nullable=False)
+    id_cliente: Mapped[Optional[str]] = mapped_column(String(64))
+
+    # 0 / 0 si el pedido dejó de contar (cancelado): la fila conserva la versión
+    monto: Mapped[Numeric] = mapped_column(Numeric(18, 6), default=0, nullable=False)
+    unidades: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+    # actualizado_en del pedido según el último evento aplicado (descarta eventos viejos)
+    version: Mapped[Optional[str]] = mapped_column(String(40))
+
+    __table_args__ = (
+        UniqueConstraint("id_pedido", "id_plan", name="uq_aporte_pedido_plan"),
+        Index("ix_aporte_plan_fecha", "id_plan", "fecha"),
+    )
+
 
 # --- Visitas --------------------------------------------------------------------
 class Visita(Base):
@@ -87,11 +130,13 @@ class Visita(Base):
 
     detalles: Mapped[list["DetalleVisita"]] = relationship(back_populates="visita", cascade="all, delete-orphan")
 
-    creado_en: Mapped[datetime] = mapped_column(DateTime, default=func.now(), nullable=False)
-    actualizado_en: Mapped[datetime] = mapped_column(DateTime, default=func.now(), onupdate=func.now(), nullable=False)
+    creado_en: Mapped[datetime] = mapped_column(DateTime, default=ahora_utc, nullable=False)
+    actualizado_en: Mapped[datetime] = mapped_column(DateTime, default=ahora_utc, onupdate=ahora_utc, nullable=False)
 
     __table_args__ = (
         UniqueConstraint("id_cliente", "id_vendedor", "fecha", name="uq_visita_cliente_vendedor_fecha"),
+        Index("ix_visita_creado_id", "creado_en", "id"),
+        Index("ix_visita_vendedor_creado_id", "id_vendedor", "creado_en", "id"),
     )
 
 
@@ -107,7 +152,7 @@ class DetalleVisita(Base):
     sugerencias_producto: Mapped[Optional[str]] = mapped_column(Text)
 
     url_foto: Mapped[Optional[str]] = mapped_column(String(512))  # GCS public/signed URL
-    creado_en: Mapped[datetime] = mapped_column(DateTime, default=func.now(), nullable=False)
+    creado_en: Mapped[datetime] = mapped_column(DateTime, default=ahora_utc, nullable=False)
 
     visita: Mapped["Visita"] = relationship(back_populates="detalles")
 
@@ -17,6 +17,15 @@ class PlanDeVentasCrear(BaseModel):
     id_cliente_objetivo: str
 
 
+class FiltrosPlanes(BaseModel):
+    activo: Optional[bool] = None
+    periodo: Optional[str] = None
+    territorio: Optional[str] = None
+    # planes cuya vigencia (fecha_inicio..fecha_fin) se cruza con [desde, hasta]
+    desde: Optional[date] = None
+    hasta: Optional[date] = None
+
+
 class PlanDeVentasSalida(BaseModel):
     id: str
     id_vendedor: str
@@ -56,6 +65,13 @@ class VisitaCrear(BaseModel):
     fecha: date
 
 
+class FiltrosVisitas(BaseModel):
+    id_vendedor: Optional[str] = None
+    d: Optional[date] = None
+    desde: Optional[date] = None
+    hasta: Optional[date] = None
+
+
 class VisitaSalida(BaseModel):
     id: str
     id_vendedor: str
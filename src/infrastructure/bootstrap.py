@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import Column, DateTime, Engine, Integer, MetaData, String, Table, func, inspect, select, text
+from sqlalchemy.exc import DBAPIError
+
+from src.domain import models
+from src.infrastructure.infrastructure import engine_con_schema, inicializar_schema, marcar_schema_listo
+from src.infrastructure.metricas import get_metricas
+
+log = logging.getLogger(__name__)
+_metricas = get_metricas("bootstrap")
+
+# Tabla de control por schema, fuera de Base.metadata para no alterar la huella
+_metadata_control = MetaData()
+esquema_huella = Table(
+    "esquema_huella",
+    _metadata_control,
+    Column("id", Integer, primary_key=True),
+    Column("huella", String(64), nullable=False),
+    Column("actualizado_en", DateTime, server_default=func.now(), nullable=False),
+)
+
+
+def huella_metadata(metadata: MetaData = models.Base.metadata) -> str:
+    """
+    SHA-256 estable de tablas, columnas, constraints e índices del modelo.
+    Cambia cuando cambian los modelos, lo que fuerza un create_all en el siguiente arranque.
+    """
+    partes: list[str] = []
+    for tabla in metadata.sorted_tables:
+        partes.append(f"T:{tabla.name}")
+        for col in tabla.columns:
+            partes.append(f"C:{col.name}:{col.type!r}:{col.nullable}:{col.primary_key}")
+        for cons in sorted(tabla.constraints, key=lambda c: str(c.name)):
+            partes.append(f"K:{type(cons).__name__}:{cons.name}:{sorted(c.name for c in cons.columns)}")
+        for idx in sorted(tabla.indexes, key=lambda i: str(i.name)):
+            partes.append(f"I:{idx.name}:{idx.unique}:{[c.name for c in idx.columns]}")
+    return hashlib.sha256("\n".join(partes).encode("utf-8")).hexdigest()
+
+
+def _huella_guardada(conn) -> str | None:
+    try:
+        # savepoint: en Postgres un error aborta la transacción que sigue usando el DDL
+        with conn.begin_nested():
+            return conn.execute(select(esquema_huella.c.huella).where(esquema_huella.c.id == 1)).scalar()
+    except DBAPIError:
+        # schema o tabla de control inexistentes → hay que inicializar
+        return None
+
+
+def _deduplicar_progreso(conn) -> int:
+    """Deja el último registro por (id_plan, fecha) para poder crear uq_progreso_plan_fecha."""
+    t = models.ProgresoPlanDeVentas.__table__
+    ultimos = select(func.max(t.c.id)).group_by(t.c.id_plan, t.c.fecha)
+    return conn.execute(t.delete().where(t.c.id.not_in(ultimos))).rowcount
+
+
+def _agregar_columnas_faltantes(conn) -> list[str]:
+    """
+    create_all no altera tablas existentes: ALTER TABLE ... ADD COLUMN por cada
+    columna del modelo que falte. Las columnas nuevas deben admitir NULL o tener
+    server_default para poder agregarse sobre filas existentes.
+    """
+    schema = (conn.get_execution_options().get("schema_translate_map") or {}).get(None)
+    inspector = inspect(conn)
+    compilador = conn.dialect.ddl_compiler(conn.dialect, None)
+    preparer = conn.dialect.identifier_preparer
+    agregadas = []
+    for tabla in models.Base.metadata.sorted_tables:
+        existentes = {c["name"] for c in inspector.get_columns(tabla.name, schema=schema)}
+        nombre = preparer.quote(tabla.name)
+        if schema:
+            nombre = f"{preparer.quote_schema(schema)}.{nombre}"
+        for col in tabla.columns:
+            if col.name not in existentes:
+                conn.execute(text(f"ALTER TABLE {nombre} ADD COLUMN {compilador.get_column_specification(col)}"))
+                agregadas.append(f"{tabla.name}.{col.name}")
+    return agregadas
+
+
+def _aplicar_ddl(conn, huella: str) -> None:
+    models.Base.metadata.create_all(bind=conn)
+    agregadas = _agregar_columnas_faltantes(conn)
+    if agregadas:
+        log.warning("bootstrap: columnas agregadas: %s", ", ".join(agregadas))
+    borrados = _deduplicar_progreso(conn)
+    if borrados:
+        log.warning("bootstrap: %s filas de progreso duplicadas eliminadas", borrados)
+    # create_all no crea índices nuevos sobre tablas ya existentes
+    for tabla in models.Base.metadata.sorted_tables:
+        for idx in tabla.indexes:
+            idx.create(conn, checkfirst=True)
+    _metadata_control.create_all(bind=conn)
+    conn.execute(esquema_huella.delete())
+    conn.execute(esquema_huella.insert().values(id=1, huella=huella))
+
+
+def inicializar_tablas_schema(schema: str) -> dict:
+    """
+    Deja el schema al día con los modelos. Si la huella guardada coincide con la
+    actual basta una consulta; si no, CREATE SCHEMA + create_all + índices faltantes.
+    """
+    inicio = time.perf_counter()
+    huella = huella_metadata()
+    eng: Engine = engine_con_schema(schema)
+
+    with eng.connect() as conn:
+        vigente = _huella_guardada(conn) == huella
+
+    if vigente:
+        marcar_schema_listo(schema)
+        estado = "vigente"
+    else:
+        inicializar_schema(schema)
+        with eng.begin() as conn:
+            if conn.dialect.name == "postgresql":
+                # Serializa el DDL entre instancias que arrancan a la vez
+                conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:k))"), {"k": f"bootstrap:{schema}"})
+            if _huella_guardada(conn) != huella:
+                _aplicar_ddl(conn, huella)
+        estado = "actualizado"
+
+    duracion_ms = (time.perf_counter() - inicio) * 1000
+    _metricas.incrementar(estado, schema)
+    _metricas.observar("duracion_ms", duracion_ms, schema)
+    return {"schema": schema, "estado": estado, "duracion_ms": round(duracion_ms, 1)}
+
+
+def inicializar_schemas(schemas: list[str]) -> list[dict]:
+    """Bootstrap de todos los schemas en paralelo (un hilo por schema)."""
+    if not schemas:
+        return []
+
+    def _uno(schema: str) -> dict:
+        try:
+            return inicializar_tablas_schema(schema)
+        except Exception as e:
+            _metricas.incrementar("error", schema)
+            return {"schema": schema, "estado": "error", "error": str(e)}
+
+    with ThreadPoolExecutor(max_workers=len(schemas), thread_name_prefix="bootstrap") as ex:
+        return list(ex.map(_uno, schemas))
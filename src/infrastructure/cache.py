@@ -0,0 +1,319 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Optional
+
+from redis import Redis
+from redis.exceptions import RedisError
+
+from src.config import settings
+from src.infrastructure.infrastructure import get_redis_binario, soltar_lock_redis, tras_commit
+from src.infrastructure.metricas import get_metricas
+
+log = logging.getLogger(__name__)
+_metricas_pedidos = get_metricas("cache_pedidos")
+_metricas_respuestas = get_metricas("cache_respuestas")
+
+# Parámetros de paginación: no forman parte de la clave (se cachea la lista completa)
+_PARAMS_PAGINACION = ("limit", "offset")
+_TTL_LOCK_MS = 30_000
+_INTERVALO_ESPERA = 0.05
+
+
+def comprimir(valor: Any) -> bytes:
+    return zlib.compress(json.dumps(valor, separators=(",", ":"), default=str).encode("utf-8"))
+
+
+def descomprimir(datos: bytes) -> Any:
+    return json.loads(zlib.decompress(datos))
+
+
+class CachePedidos:
+    """
+    Caché read-through de las respuestas completas de /v1/pedidos en Redis.
+    - Clave por país + parámetros de negocio (tipo, fecha o rango).
+    - TTL largo si todas las fechas consultadas ya pasaron, corto si incluye hoy o futuro.
+    - Anti-stampede: en un miss solo quien toma el lock (SET NX) va a ms-pedidos;
+      el resto espera a que aparezca el valor.
+    Cualquier error de Redis se trata como miss: el origen sigue siendo la fuente.
+    """
+
+    def __init__(self, redis: Redis):
+        self.redis = redis
+
+    @staticmethod
+    def clave(pais: str, params: dict) -> str:
+        partes = [f"{k}={params[k]}" for k in sorted(params) if k not in _PARAMS_PAGINACION]
+        return f"pedidos:v1:{pais}:" + ":".join(partes)
+
+    @staticmethod
+    def ttl(params: dict, hoy: date | None = None) -> int:
+        hoy = hoy or date.today()
+        fechas = []
+        for k, v in params.items():
+            if k.startswith("fecha"):
+                try:
+                    fechas.append(date.fromisoformat(str(v)[:10]))
+                except ValueError:
+                    pass
+        if fechas and max(fechas) < hoy:
+            return settings.PEDIDOS_CACHE_TTL_PASADO
+        return settings.PEDIDOS_CACHE_TTL_ACTUAL
+
+    def _error(self, operacion: str, e: Exception) -> None:
+        _metricas_pedidos.incrementar("error", operacion)
+        log.debug("cache_pedidos: %s falló: %s", operacion, e)
+
+    def leer(self, clave: str) -> Optional[list]:
+        try:
+            datos = self.redis.get(clave)
+        except RedisError as e:
+            self._error("leer", e)
+            return None
+        if datos is None:
+            _metricas_pedidos.incrementar("miss")
+            return None
+        _metricas_pedidos.incrementar("hit")
+        return descomprimir(datos)
+
+    def guardar(self, clave: str, pedidos: list, ttl: int) -> None:
+        try:
+            self.redis.set(clave, comprimir(pedidos), ex=ttl)
+        except RedisError as e:
+            self._error("guardar", e)
+
+    def tomar_lock(self, clave: str) -> Optional[str]:
+        """Token del lock si se obtuvo; "" si Redis falló (se carga sin coordinar); None si otro lo tiene."""
+        token = uuid.uuid4().hex
+        try:
+            if self.redis.set(f"{clave}:lock", token, nx=True, px=_TTL_LOCK_MS):
+                return token
+            return None
+        except RedisError as e:
+            self._error("lock", e)
+            return ""
+
+    def soltar_lock(self, clave: str, token: str) -> None:
+        if not token:
+            return
+        try:
+            soltar_lock_redis(self.redis, f"{clave}:lock", token)
+        except RedisError as e:
+            self._error("unlock", e)
+
+    def esperar(self, clave: str) -> Optional[list]:
+        """Sondea hasta que quien tiene el lock publique el valor (o se agote la espera)."""
+        _metricas_pedidos.incrementar("espera_lock")
+        limite = time.monotonic() + settings.PEDIDOS_CACHE_ESPERA_LOCK
+        while time.monotonic() < limite:
+            time.sleep(_INTERVALO_ESPERA)
+            try:
+                datos = self.redis.get(clave)
+                if datos is not None:
+                    return descomprimir(datos)
+                if not self.redis.exists(f"{clave}:lock"):
+                    return None
+            except RedisError as e:
+                self._error("esperar", e)
+                return None
+        return None
+
+
+def get_cache_pedidos() -> Optional[CachePedidos]:
+    if not settings.PEDIDOS_CACHE:
+        return None
+    redis = get_redis_binario()
+    return CachePedidos(redis) if redis is not None else None
+
+
+class LRU:
+    """LRU en memoria con TTL por entrada, thread-safe. Por instancia."""
+
+    def __init__(self, max_items: int, ttl: float):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._datos: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, clave: str) -> Any:
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return None
+            if entrada[0] <= time.monotonic():
+                del self._datos[clave]
+                return None
+            self._datos.move_to_end(clave)
+            return entrada[1]
+
+    def set(self, clave: str, valor: Any) -> None:
+        with self._lock:
+            self._datos[clave] = (time.monotonic() + self.ttl, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_items:
+                self._datos.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._datos)
+
+
+class CacheRespuestas:
+    """
+    Caché de respuestas de lectura (listados de planes y visitas) en dos niveles:
+    L1 (LRU en proceso) delante de Redis (compartido entre instancias).
+    - Clave: ruta + schema + espacio@generación + hash de los parámetros de la query.
+    - Invalidación: cada escritura incrementa la generación de los espacios que
+      afecta ("planes", "planes:vendedor:<id>", "visitas"); las claves viejas
+      dejan de leerse y expiran solas por TTL.
+    - La generación se relee de Redis como mucho cada CACHE_L1_TTL_GENERACION s:
+      la instancia que escribe ve la invalidación al instante; las demás, con ese retraso.
+    - Lo que se guarda se leyó del primario (con_cache): una réplica atrasada no
+      puede dejar filas viejas bajo la generación nueva.
+    Sin Redis (o ante errores) funciona solo con L1 y generaciones locales.
+    """
+
+    def __init__(self):
+        self.l1 = LRU(settings.CACHE_L1_MAX, settings.CACHE_L1_TTL)
+        self._generaciones: dict[str, tuple[int, float]] = {}
+        self._lock = threading.Lock()
+
+    def _error(self, operacion: str, e: Exception) -> None:
+        _metricas_respuestas.incrementar("error", operacion)
+        log.debug("cache_respuestas: %s falló: %s", operacion, e)
+
+    @staticmethod
+    def _clave_generacion(schema: str, espacio: str) -> str:
+        return f"resp:gen:{schema}:{espacio}"
+
+    def _recordar(self, clave: str, generacion: int) -> int:
+        with self._lock:
+            self._generaciones[clave] = (generacion, time.monotonic() + settings.CACHE_L1_TTL_GENERACION)
+        return generacion
+
+    def generacion(self, schema: str, espacio: str) -> int:
+        clave = self._clave_generacion(schema, espacio)
+        with self._lock:
+            conocida = self._generaciones.get(clave)
+        if conocida is not None and conocida[1] > time.monotonic():
+            return conocida[0]
+        generacion = conocida[0] if conocida is not None else 0
+        redis = get_redis_binario()
+        if redis is not None:
+            try:
+                datos = redis.get(clave)
+                generacion = int(datos) if datos is not None else 0
+            except RedisError as e:
+                self._error("generacion", e)
+        return self._recordar(clave, generacion)
+
+    def clave(self, ruta: str, schema: str, espacio: str, params: dict) -> str:
+        """Se calcula antes de consultar la BD: lo leído queda bajo la generación vigente al empezar."""
+        huella = hashlib.sha1(
+            json.dumps(params, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+        ).hexdigest()
+        return f"resp:v1:{schema}:{ruta}:{espacio}@{self.generacion(schema, espacio)}:{huella}"
+
+    def leer(self, ruta: str, clave: str) -> Optional[dict]:
+        valor = self.l1.get(clave)
+        if valor is not None:
+            _metricas_respuestas.incrementar("hit_l1", ruta)
+            return valor
+        redis = get_redis_binario()
+        if redis is not None:
+            try:
+                datos = redis.get(clave)
+            except RedisError as e:
+                self._error("leer", e)
+                datos = None
+            if datos is not None:
+                valor = descomprimir(datos)
+                self.l1.set(clave, valor)
+                _metricas_respuestas.incrementar("hit_l2", ruta)
+                return valor
+        _metricas_respuestas.incrementar("miss", ruta)
+        return None
+
+    def guardar(self, clave: str, valor: dict) -> None:
+        self.l1.set(clave, valor)
+        redis = get_redis_binario()
+        if redis is None:
+            return
+        try:
+            redis.set(clave, comprimir(valor), ex=settings.CACHE_RESPUESTAS_TTL)
+        except RedisError as e:
+            self._error("guardar", e)
+
+    def invalidar(self, schema: str, *espacios: str) -> None:
+        redis = get_redis_binario()
+        for espacio in espacios:
+            clave = self._clave_generacion(schema, espacio)
+            _metricas_respuestas.incrementar("invalidaciones", espacio.split(":")[0])
+            nueva = None
+            if redis is not None:
+                try:
+                    nueva = int(redis.incr(clave))
+                except RedisError as e:
+                    self._error("invalidar", e)
+            if nueva is None:
+                with self._lock:
+                    conocida = self._generaciones.get(clave)
+                nueva = (conocida[0] if conocida is not None else 0) + 1
+            self._recordar(clave, nueva)
+
+
+_cache_respuestas: CacheRespuestas | None = None
+_cache_respuestas_lock = threading.Lock()
+
+
+def get_cache_respuestas() -> Optional[CacheRespuestas]:
+    global _cache_respuestas
+    if not settings.CACHE_RESPUESTAS:
+        return None
+    if _cache_respuestas is None:
+        with _cache_respuestas_lock:
+            if _cache_respuestas is None:
+                _cache_respuestas = CacheRespuestas()
+    return _cache_respuestas
+
+
+def invalidar_respuestas(db, schema: str, *espacios: str) -> None:
+    """
+    Invalida los espacios ya (lecturas concurrentes dejan de ver la generación
+    vieja) y otra vez tras el commit de `db`: lo que otro request cacheó leyendo
+    antes del commit queda bajo una generación que ya no se usa.
+    Acepta Session o AsyncSession.
+    """
+    cache = get_cache_respuestas()
+    if cache is None:
+        return
+    cache.invalidar(schema, *espacios)
+    tras_commit(db, lambda: cache.invalidar(schema, *espacios))
+
+
+def ratios_cache_respuestas() -> dict:
+    """Aciertos L1/L2, misses y ratio de aciertos por ruta."""
+    contadores = _metricas_respuestas.snapshot()["contadores"]
+    rutas = set()
+    for nombre in ("hit_l1", "hit_l2", "miss"):
+        rutas.update(contadores.get(nombre, {}))
+    resultado = {}
+    for ruta in sorted(rutas):
+        hit_l1 = contadores.get("hit_l1", {}).get(ruta, 0)
+        hit_l2 = contadores.get("hit_l2", {}).get(ruta, 0)
+        miss = contadores.get("miss", {}).get(ruta, 0)
+        total = hit_l1 + hit_l2 + miss
+        resultado[ruta] = {
+            "hit_l1": hit_l1,
+            "hit_l2": hit_l2,
+            "miss": miss,
+            "ratio": round((hit_l1 + hit_l2) / total, 4) if total else 0.0,
+        }
+    return resultado
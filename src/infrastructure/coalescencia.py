@@ -0,0 +1,242 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import threading
+import uuid
+from datetime import date
+from typing import Any, Callable, Optional
+
+from redis.exceptions import RedisError
+from sqlalchemy import text
+
+from src.config import settings
+from src.infrastructure import infrastructure
+from src.infrastructure.deduplicacion import RegistroDeduplicacion
+from src.infrastructure.infrastructure import get_redis_binario, soltar_lock_redis
+from src.infrastructure.metricas import get_metricas
+
+log = logging.getLogger(__name__)
+_metricas = get_metricas("coalescencia")
+
+EVENTOS_RECALCULO = ("recalcular_plan_ventas", "recalcular_planes_del_dia")
+
+
+def clave_recalculo(event_type: str, event: dict, country: str) -> str | None:
+    """
+    (país, evento, plan, fecha) de un recálculo; None para otros eventos.
+    El backfill usa "desde..hasta" como fecha y el lote no tiene plan.
+    """
+    if event_type == "recalcular_plan_ventas":
+        if event.get("desde") or event.get("hasta"):
+            dia = f"{event.get('desde')}..{event.get('hasta')}"
+        else:
+            dia = event.get("fecha") or date.today().isoformat()
+        return f"{country}:{event_type}:{event.get('plan_id')}:{dia}"
+    if event_type == "recalcular_planes_del_dia":
+        return f"{country}:{event_type}:{event.get('fecha') or date.today().isoformat()}"
+    return None
+
+
+class LockRedis:
+    """SET NX PX con token; se suelta (compare-and-delete en Lua) solo si el token sigue siendo el propio."""
+
+    def __init__(self, redis):
+        self.redis = redis
+
+    def tomar(self, clave: str) -> Optional[str]:
+        token = uuid.uuid4().hex
+        if self.redis.set(f"coal:lock:{clave}", token, nx=True, px=int(settings.COALESCER_LOCK_TTL * 1000)):
+            return token
+        return None
+
+    def soltar(self, clave: str, token: str) -> None:
+        soltar_lock_redis(self.redis, f"coal:lock:{clave}", token)
+
+
+class LockPostgres:
+    """
+    pg_try_advisory_lock sobre una conexión propia de get_locks_engine() (sin
+    pool, AUTOCOMMIT), retenida mientras dura el trabajo: no le quita conexiones
+    al pool de los handlers y, si la instancia muere, Postgres suelta el lock al
+    cerrarse la conexión.
+    """
+
+    @staticmethod
+    def _id(clave: str) -> int:
+        return int.from_bytes(hashlib.sha1(clave.encode("utf-8")).digest()[:8], "big", signed=True)
+
+    def tomar(self, clave: str) -> Any:
+        conn = infrastructure.get_locks_engine().connect()
+        try:
+            if conn.scalar(text("SELECT pg_try_advisory_lock(:id)"), {"id": self._id(clave)}):
+                return conn
+        except Exception:
+            conn.close()
+            raise
+        conn.close()
+        return None
+
+    def soltar(self, clave: str, conn) -> None:
+        try:
+            conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": self._id(clave)})
+        finally:
+            conn.close()
+
+
+class LockLocal:
+    """Locks en proceso: respaldo sin Redis (solo coordina hilos de esta instancia)."""
+
+    def __init__(self):
+        self._tomadas: set[str] = set()
+        self._lock = threading.Lock()
+
+    def tomar(self, clave: str) -> Optional[str]:
+        with self._lock:
+            if clave in self._tomadas:
+                return None
+            self._tomadas.add(clave)
+            return clave
+
+    def soltar(self, clave: str, token: str) -> None:
+        with self._lock:
+            self._tomadas.discard(clave)
+
+
+class Coalescedor:
+    """
+    Como mucho un recálculo en vuelo por clave (país, plan, fecha).
+    Una entrega que encuentra la clave tomada no espera ni repite el trabajo:
+    marca la clave como "sucia" y termina. Quien tiene el lock, al acabar, vuelve
+    a ejecutar una vez si la encontró sucia (los pedidos pudieron cambiar
+    mientras recalculaba), hasta COALESCER_MAX_REPETICIONES veces.
+    - Lock: Redis (SET NX PX) o advisory lock de Postgres según COALESCER_BACKEND;
+      sin Redis, o ante errores, un lock en proceso.
+    - Marca "sucia": Redis si está disponible, si no en memoria.
+    """
+
+    def __init__(self, backend: str | None = None):
+        self.backend = (backend or settings.COALESCER_BACKEND).lower()
+        self._local = LockLocal()
+        self._sucias: set[str] = set()
+        self._lock = threading.Lock()
+
+    def _error(self, operacion: str, e: Exception) -> None:
+        _metricas.incrementar("error", operacion)
+        log.debug("coalescencia: %s falló: %s", operacion, e)
+
+    def _lock_distribuido(self):
+        if self.backend == "postgres" and infrastructure.engine.dialect.name == "postgresql":
+            return LockPostgres()
+        redis = get_redis_binario()
+        return LockRedis(redis) if redis is not None else None
+
+    def _tomar(self, clave: str) -> tuple[Any, Any]:
+        lock = self._lock_distribuido()
+        if lock is not None:
+            try:
+                return lock, lock.tomar(clave)
+            except Exception as e:
+                self._error("tomar", e)
+        return self._local, self._local.tomar(clave)
+
+    def _soltar(self, lock, clave: str, token) -> None:
+        try:
+            lock.soltar(clave, token)
+        except Exception as e:
+            self._error("soltar", e)
+
+    def _marcar_sucia(self, clave: str) -> None:
+        redis = get_redis_binario()
+        if redis is not None:
+            try:
+                redis.set(f"coal:sucia:{clave}", b"1", px=int(settings.COALESCER_LOCK_TTL * 1000))
+                return
+            except RedisError as e:
+                self._error("marcar", e)
+        with self._lock:
+            self._sucias.add(clave)
+
+    def _limpiar_sucia(self, clave: str) -> bool:
+        """Quita la marca; True si estaba puesta."""
+        with self._lock:
+            sucia = clave in self._sucias
+            self._sucias.discard(clave)
+        redis = get_redis_binario()
+        if redis is not None:
+            try:
+                sucia = bool(redis.delete(f"coal:sucia:{clave}")) or sucia
+            except RedisError as e:
+                self._error("limpiar", e)
+        return sucia
+
+    def ejecutar(self, clave: str, trabajo: Callable[[], Any]) -> bool:
+        """True si esta llamada ejecutó el trabajo; False si se fusionó con uno en vuelo."""
+        for intento in range(settings.COALESCER_MAX_REPETICIONES + 1):
+            lock, token = self._tomar(clave)
+            if token is None:
+                self._marcar_sucia(clave)
+                # quien lo tenía pudo soltarlo y hacer su última comprobación antes
+                # de la marca: si quedó libre, nadie más la va a ver; la atiende esta llamada
+                lock, token = self._tomar(clave)
+                if token is None:
+                    _metricas.incrementar("fusionados")
+                    return intento > 0
+            try:
+                # lo que llegue desde aquí vuelve a marcarla y provoca otra pasada
+                self._limpiar_sucia(clave)
+                # el evento publicado ya se está atendiendo: un pedido nuevo vuelve a publicar
+                _liberar_publicacion(clave)
+                trabajo()
+            finally:
+                self._soltar(lock, clave, token)
+            _metricas.incrementar("ejecuciones" if intento == 0 else "repeticiones")
+            if not self._limpiar_sucia(clave):
+                break
+        return True
+
+
+_coalescedor: Coalescedor | None = None
+_ventanas: RegistroDeduplicacion | None = None
+_singleton_lock = threading.Lock()
+
+
+def get_coalescedor() -> Optional[Coalescedor]:
+    global _coalescedor
+    if not settings.COALESCER_RECALCULO:
+        return None
+    if _coalescedor is None:
+        with _singleton_lock:
+            if _coalescedor is None:
+                _coalescedor = Coalescedor()
+    return _coalescedor
+
+
+def _get_ventanas() -> RegistroDeduplicacion:
+    global _ventanas
+    if _ventanas is None:
+        with _singleton_lock:
+            if _ventanas is None:
+                _ventanas = RegistroDeduplicacion()
+    return _ventanas
+
+
+def _liberar_publicacion(clave: str) -> None:
+    _get_ventanas().liberar(f"pub:{clave}")
+
+
+def reclamar_publicacion(event: dict) -> bool:
+    """
+    Debounce del lado que publica: el primer pedido de recálculo de una clave
+    publica y los siguientes se omiten mientras ese evento sigue en camino
+    (hará el mismo trabajo). La ventana se libera cuando el coalescedor empieza
+    a atenderlo; COALESCER_VENTANA_PUBLICACION solo acota cuánto dura si el
+    evento no llega a procesarse.
+    """
+    clave = clave_recalculo(event.get("event"), event, (event.get("ctx") or {}).get("country"))
+    if not settings.COALESCER_RECALCULO or clave is None:
+        return True
+    if _get_ventanas().reclamar(f"pub:{clave}", settings.COALESCER_VENTANA_PUBLICACION):
+        return True
+    _metricas.incrementar("publicaciones_omitidas", event.get("event"))
+    return False
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from redis.exceptions import RedisError
+
+from src.config import settings
+from src.infrastructure.infrastructure import get_redis_binario
+from src.infrastructure.metricas import get_metricas
+
+log = logging.getLogger(__name__)
+_metricas = get_metricas("pubsub")
+
+
+class RegistroDeduplicacion:
+    """
+    Marca claves (messageId de Pub/Sub, clave lógica del evento) como vistas
+    durante una ventana: la primera entrega las reclama y las siguientes dentro
+    de la ventana se saltan.
+    - Redis (SET NX EX) comparte las marcas entre instancias.
+    - Sin Redis, o ante errores, se usa una ventana en memoria por instancia
+      (acotada a PUBSUB_DEDUP_MAX_MEMORIA claves): protege contra reentregas a
+      la misma instancia, no entre instancias.
+    """
+
+    def __init__(self, max_memoria: int | None = None):
+        self.max_memoria = max_memoria or settings.PUBSUB_DEDUP_MAX_MEMORIA
+        self._memoria: OrderedDict[str, float] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _error(self, operacion: str, e: Exception) -> None:
+        _metricas.incrementar("error_dedup", operacion)
+        log.debug("dedup: %s falló: %s", operacion, e)
+
+    def _reclamar_en_memoria(self, clave: str, ventana: float) -> bool:
+        ahora = time.monotonic()
+        with self._lock:
+            vence = self._memoria.get(clave)
+            if vence is not None and vence > ahora:
+                return False
+            self._memoria[clave] = ahora + ventana
+            self._memoria.move_to_end(clave)
+            while len(self._memoria) > self.max_memoria:
+                self._memoria.popitem(last=False)
+            return True
+
+    def reclamar(self, clave: str, ventana: float) -> bool:
+        """True si es la primera vez que se ve `clave` en la ventana (hay que procesar)."""
+        redis = get_redis_binario()
+        if redis is not None:
+            try:
+                return bool(redis.set(f"dedup:{clave}", b"1", nx=True, px=int(ventana * 1000)))
+            except RedisError as e:
+                self._error("reclamar", e)
+        return self._reclamar_en_memoria(clave, ventana)
+
+    def liberar(self, clave: str) -> None:
+        """Olvida la marca (el procesamiento falló: una nueva entrega debe poder reintentar)."""
+        with self._lock:
+            self._memoria.pop(clave, None)
+        redis = get_redis_binario()
+        if redis is None:
+            return
+        try:
+            redis.delete(f"dedup:{clave}")
+        except RedisError as e:
+            self._error("liberar", e)
+
+
+_registro: RegistroDeduplicacion | None = None
+_registro_lock = threading.Lock()
+
+
+def get_registro_deduplicacion() -> Optional[RegistroDeduplicacion]:
+    global _registro
+    if not settings.PUBSUB_DEDUP:
+        return None
+    if _registro is None:
+        with _registro_lock:
+            if _registro is None:
+                _registro = RegistroDeduplicacion()
+    return _registro
@@ -1,20 +1,115 @@
 # src/infra/http.py
-import os, requests
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
 from src.config import settings
 
+_STATUS_REINTENTABLES = (429, 500, 502, 503, 504)
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+
+
+class _Retry(Retry):
+    """Retry de urllib3 con Retry-After acotado a HTTP_RETRY_AFTER_MAXIMO."""
+
+    def get_retry_after(self, response):
+        espera = super().get_retry_after(response)
+        return None if espera is None else min(espera, settings.HTTP_RETRY_AFTER_MAXIMO)
+
+
+def _retry() -> Retry:
+    return _Retry(
+        total=settings.HTTP_REINTENTOS,
+        backoff_factor=settings.HTTP_BACKOFF,
+        backoff_jitter=settings.HTTP_BACKOFF_JITTER,
+        status_forcelist=_STATUS_REINTENTABLES,
+        # POST no es idempotente: solo se reintenta si ni siquiera llegó a conectar
+        allowed_methods=frozenset({"GET"}),
+        respect_retry_after_header=True,
+        # agotados los reintentos se devuelve la última respuesta y MsClient._raise decide
+        raise_on_status=False,
+    )
+
+
+def get_http_session() -> requests.Session:
+    """
+    Sesión requests compartida por el proceso (thread-safe para peticiones):
+    conexiones keep-alive reutilizadas por host, con tope por host y reintentos.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                s = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=settings.HTTP_POOL_CONEXIONES,
+                    pool_maxsize=settings.HTTP_POOL_MAXIMO,
+                    pool_block=settings.HTTP_POOL_BLOQUEANTE,
+                    max_retries=_retry(),
+                )
+                s.mount("https://", adapter)
+                s.mount("http://", adapter)
+                _session = s
+    return _session
+
+
+def cerrar_http_session() -> None:
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def estado_http() -> dict:
+    """
+    Conexiones abiertas vs. peticiones servidas por host, leídas de los pools de
+    urllib3: lo que no abrió conexión nueva reutilizó una keep-alive.
+    """
+    if _session is None:
+        return {"hosts": {}, "conexiones_nuevas": 0, "peticiones": 0, "reutilizadas": 0}
+    hosts = {}
+    vistos = set()
+    for adapter in _session.adapters.values():
+        if id(adapter) in vistos:
+            continue
+        vistos.add(id(adapter))
+        for clave in list(adapter.poolmanager.pools.keys()):
+            pool = adapter.poolmanager.pools.get(clave)
+            if pool is None:
+                continue
+            hosts[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+                "conexiones_nuevas": pool.num_connections,
+                "peticiones": pool.num_requests,
+                "reutilizadas": max(0, pool.num_requests - pool.num_connections),
+                "libres": pool.pool.qsize() if pool.pool is not None else 0,
+            }
+    totales = {
+        k: sum(h[k] for h in hosts.values()) for k in ("conexiones_nuevas", "peticiones", "reutilizadas")
+    }
+    return {"hosts": hosts, **totales}
+
+
 class MsClient:
     def __init__(self, x_country: str):
         self.base = settings.GATEWAY_BASE_URL.rstrip("/")
+        self.pais = x_country
         self.h = {"Content-Type": "application/json", settings.COUNTRY_HEADER: x_country}
+        self.timeout = (settings.HTTP_TIMEOUT_CONEXION, settings.HTTP_TIMEOUT_LECTURA)
 
     def post(self, path: str, json=None, params=None):
-        r = requests.post(f"{self.base}{path}", headers=self.h, json=json, params=params, timeout=30)
+        r = get_http_session().post(f"{self.base}{path}", headers=self.h, json=json, params=params, timeout=self.timeout)
         self._raise(r); return r.json() if r.content else None
 
     def get(self, path: str, params=None):
-        r = requests.get(f"{self.base}{path}", headers=self.h, params=params, timeout=30)
+        r = get_http_session().get(f"{self.base}{path}", headers=self.h, params=params, timeout=self.timeout)
         self._raise(r); return r.json() if r.content else None
 
     def _raise(self, r):
         if r.status_code >= 400:
             raise ValueError(f"HTTP {r.status_code} calling {r.request.method} {r.url}: {r.text}")
+
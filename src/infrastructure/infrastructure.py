@@ -1,15 +1,85 @@
+import asyncio
 import json
-from contextlib import contextmanager
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, wait
+from contextlib import contextmanager, asynccontextmanager
+from sqlalchemy import create_engine, event, exc, text, Engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import NullPool
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 from src.config import settings
+from src.errors import ValidationError
+from src.infrastructure.metricas import get_metricas
 from google.cloud import pubsub_v1
 from typing import Optional
 from redis import Redis
 
-engine = create_engine(settings.SQLALCHEMY_DATABASE_URI, pool_pre_ping=True)
+log = logging.getLogger(__name__)
+_metricas_pool = get_metricas("pool")
+_metricas_publicacion = get_metricas("publicacion")
+
+
+def _opciones_pool() -> dict:
+    """kwargs de create_engine/create_async_engine según Settings."""
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_pre_ping": settings.DB_PRE_PING == "siempre",
+    }
+
+
+def _instalar_pre_ping_por_inactividad(eng: Engine) -> None:
+    """
+    Estrategia DB_PRE_PING=inactiva: solo se hace ping (SELECT 1) al sacar del
+    pool una conexión que estuvo ociosa más de DB_PRE_PING_INACTIVIDAD segundos.
+    Si el ping falla, DisconnectionError hace que el pool la descarte y abra otra.
+    """
+    if settings.DB_PRE_PING != "inactiva":
+        return
+
+    @event.listens_for(eng, "checkin")
+    def _al_devolver(dbapi_conn, record):
+        record.info["devuelta_en"] = time.monotonic()
+
+    @event.listens_for(eng, "checkout")
+    def _al_sacar(dbapi_conn, record, proxy):
+        devuelta_en = record.info.get("devuelta_en")
+        if devuelta_en is None or time.monotonic() - devuelta_en < settings.DB_PRE_PING_INACTIVIDAD:
+            return
+        try:
+            cursor = dbapi_conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+        except Exception:
+            _metricas_pool.incrementar("pre_ping_fallidos")
+            raise exc.DisconnectionError()
+
+
+engine = create_engine(settings.SQLALCHEMY_DATABASE_URI, **_opciones_pool())
+_instalar_pre_ping_por_inactividad(engine)
+_async_engine: Optional[AsyncEngine] = None
+_replica_engine: Optional[Engine] = None
+_locks_engine: Optional[Engine] = None
+_async_replica_engine: Optional[AsyncEngine] = None
 _redis_client: Optional[Redis] = None
+_redis_binario: Optional[Redis] = None
 _publisher: Optional[pubsub_v1.PublisherClient] = None
+_publisher_lock = threading.Lock()
+_publicaciones_pendientes: set[Future] = set()
+
+# Registro de schemas: engines con schema_translate_map cacheados por schema y
+# schemas ya inicializados (CREATE SCHEMA se ejecuta una vez por proceso)
+_engines_por_schema: dict[str, Engine] = {}
+_async_engines_por_schema: dict[str, AsyncEngine] = {}
+_replica_engines_por_schema: dict[str, Engine] = {}
+_async_replica_engines_por_schema: dict[str, AsyncEngine] = {}
+_schemas_listos: set[str] = set()
+_schemas_lock = threading.Lock()
 
 SessionLocal = sessionmaker(
     bind=engine,
@@ -18,13 +88,301 @@ SessionLocal = sessionmaker(
     expire_on_commit=False,
 )
 
-@contextmanager
-def session_for_schema(schema: str):
-    with engine.connect().execution_options(schema_translate_map={None: schema}) as conn:
-        with conn.begin() as transaction:
+AsyncSessionLocal = async_sessionmaker(
+    autoflush=False,
+    expire_on_commit=False,
+)
+
+def resolver_schema(x_country: str | None) -> str:
+    """
+    Normaliza el país (X-Country) al nombre de schema y valida que sea conocido.
+    Lanza ValidationError si el país no está en settings.KNOWN_SCHEMAS.
+    """
+    schema = (x_country or settings.DEFAULT_SCHEMA).strip().lower()
+    if schema not in settings.KNOWN_SCHEMAS:
+        raise ValidationError(f"País no soportado: {x_country!r}")
+    return schema
+
+
+def inicializar_schema(schema: str) -> None:
+    """CREATE SCHEMA IF NOT EXISTS una sola vez por proceso (startup o primer uso)."""
+    if schema in _schemas_listos:
+        return
+    with _schemas_lock:
+        if schema in _schemas_listos:
+            return
+        with engine.begin() as conn:
             conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{schema}"'))
+        _schemas_listos.add(schema)
+
+
+def marcar_schema_listo(schema: str) -> None:
+    """Registra un schema que ya existe (p. ej. verificado por el bootstrap)."""
+    _schemas_listos.add(schema)
+
+
+def engine_con_schema(schema: str) -> Engine:
+    """
+    Engine con schema_translate_map para `schema`, cacheado. Comparte el pool
+    del engine base; solo cambian las execution options. No ejecuta DDL.
+    """
+    eng = _engines_por_schema.get(schema)
+    if eng is None:
+        schema = resolver_schema(schema)
+        eng = engine.execution_options(schema_translate_map={None: schema})
+        _engines_por_schema[schema] = eng
+    return eng
+
+
+def engine_para_schema(schema: str) -> Engine:
+    """engine_con_schema asegurando que el schema exista (CREATE SCHEMA una vez)."""
+    eng = engine_con_schema(schema)
+    if schema not in _schemas_listos:
+        inicializar_schema(resolver_schema(schema))
+    return eng
+
+
+def get_replica_engine() -> Optional[Engine]:
+    """Engine de la réplica de lectura (lazy). None si DB_REPLICA_HOST no está configurado."""
+    global _replica_engine
+    if not settings.SQLALCHEMY_REPLICA_DATABASE_URI:
+        return None
+    if _replica_engine is None:
+        _replica_engine = create_engine(settings.SQLALCHEMY_REPLICA_DATABASE_URI, **_opciones_pool())
+        _instalar_pre_ping_por_inactividad(_replica_engine)
+    return _replica_engine
+
+
+def get_locks_engine() -> Engine:
+    """
+    Engine para advisory locks de sesión (lazy): sin pool (NullPool) y en
+    AUTOCOMMIT. La conexión que retiene un lock no ocupa un slot del pool de
+    trabajo ni queda "idle in transaction"; al soltarlo se cierra de verdad.
+    """
+    global _locks_engine
+    if _locks_engine is None:
+        _locks_engine = create_engine(settings.SQLALCHEMY_DATABASE_URI, poolclass=NullPool).execution_options(
+            isolation_level="AUTOCOMMIT"
+        )
+    return _locks_engine
+
+
+def replica_para_schema(schema: str) -> Optional[Engine]:
+    """Como engine_con_schema pero sobre la réplica. Los schemas los crea el primario."""
+    eng = _replica_engines_por_schema.get(schema)
+    if eng is None:
+        base = get_replica_engine()
+        if base is None:
+            return None
+        schema = resolver_schema(schema)
+        eng = base.execution_options(schema_translate_map={None: schema})
+        _replica_engines_por_schema[schema] = eng
+    return eng
+
+
+class RegistroEscrituras:
+    """
+    Momento de la última escritura por llamante, para read-your-writes: tras
+    escribir, sus lecturas van al primario mientras la réplica se pone al día.
+    En memoria y por instancia; acotado a `max_claves` (LRU).
+    """
+
+    def __init__(self, max_claves: int = 50_000):
+        self.max_claves = max_claves
+        self._ultimas: OrderedDict[str, float] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def registrar(self, clave: str) -> None:
+        with self._lock:
+            self._ultimas[clave] = time.monotonic()
+            self._ultimas.move_to_end(clave)
+            while len(self._ultimas) > self.max_claves:
+                self._ultimas.popitem(last=False)
+
+    def escritura_reciente(self, clave: str, ventana: float) -> bool:
+        with self._lock:
+            ultima = self._ultimas.get(clave)
+        return ultima is not None and time.monotonic() - ultima < ventana
+
+
+registro_escrituras = RegistroEscrituras()
+
+
+def _registrar_checkout(schema: str, inicio: float) -> None:
+    _metricas_pool.incrementar("checkouts", schema)
+    _metricas_pool.observar("espera_checkout_ms", (time.perf_counter() - inicio) * 1000, schema)
+
+
+_INFO_TRAS_COMMIT = "tras_commit"
+
+
+def tras_commit(session, funcion) -> None:
+    """
+    Ejecuta `funcion` cuando la transacción de `session` (Session o AsyncSession)
+    quede confirmada; si hace rollback, se descarta.
+    """
+    sesion = getattr(session, "sync_session", session)
+    sesion.info.setdefault(_INFO_TRAS_COMMIT, []).append(funcion)
+
+
+def ejecutar_tras_commit(info: dict) -> None:
+    for funcion in info.pop(_INFO_TRAS_COMMIT, ()):
+        try:
+            funcion()
+        except Exception as e:
+            log.warning("tras_commit: %s falló: %s", getattr(funcion, "__name__", funcion), e)
+
+
+@event.listens_for(Session, "after_commit")
+def _tras_commit_sesion(session: Session) -> None:
+    # sesiones que sí confirman con commit() (scripts, pruebas)
+    ejecutar_tras_commit(session.info)
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_tras_commit(session: Session) -> None:
+    session.info.pop(_INFO_TRAS_COMMIT, None)
+
+
+@contextmanager
+def _conexion_medida(eng: Engine, schema: str):
+    """connect() registrando espera de checkout y fallos (p. ej. pool agotado) por schema."""
+    inicio = time.perf_counter()
+    try:
+        conn = eng.connect()
+    except Exception:
+        _metricas_pool.incrementar("fallos_checkout", schema)
+        raise
+    _registrar_checkout(schema, inicio)
+    with conn:
+        yield conn
+
+
+def estado_pool(eng) -> dict | None:
+    """Estado en vivo del pool (QueuePool) de un engine sync o async."""
+    if eng is None:
+        return None
+    pool = getattr(eng, "sync_engine", eng).pool
+    estado = {"tipo": type(pool).__name__}
+    for attr in ("size", "checkedin", "checkedout", "overflow"):
+        if hasattr(pool, attr):
+            estado[attr] = getattr(pool, attr)()
+    return estado
+
+
+def estado_pools() -> dict:
+    return {
+        "sync": estado_pool(engine),
+        "async": estado_pool(_async_engine),
+        "replica": estado_pool(_replica_engine),
+        "async_replica": estado_pool(_async_replica_engine),
+    }
+
+
+@contextmanager
+def session_for_schema(schema: str, solo_lectura: bool = False):
+    """
+    Sesión transaccional sobre `schema`. Con solo_lectura=True usa la réplica
+    si está configurada (los checkouts se etiquetan '<schema>:replica').
+    El commit lo hace conn.begin() (la sesión nunca llama a commit()): lo
+    registrado con tras_commit() se ejecuta después de él.
+    """
+    eng, etiqueta = None, schema
+    if solo_lectura:
+        eng, etiqueta = replica_para_schema(schema), f"{schema}:replica"
+    if eng is None:
+        eng, etiqueta = engine_para_schema(schema), schema
+    with _conexion_medida(eng, etiqueta) as conn:
+        with conn.begin():
             with SessionLocal(bind=conn) as session:
+                info = session.info
                 yield session
+        ejecutar_tras_commit(info)
+
+
+def get_async_engine() -> AsyncEngine:
+    """
+    Engine asyncpg singleton, inicializado de forma lazy.
+    Solo se crea si se usa la ruta async (DB_ASYNC=true).
+    """
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = create_async_engine(settings.SQLALCHEMY_ASYNC_DATABASE_URI, **_opciones_pool())
+        _instalar_pre_ping_por_inactividad(_async_engine.sync_engine)
+    return _async_engine
+
+
+def get_async_replica_engine() -> Optional[AsyncEngine]:
+    """Engine asyncpg de la réplica de lectura (lazy). None si no está configurada."""
+    global _async_replica_engine
+    if not settings.SQLALCHEMY_ASYNC_REPLICA_DATABASE_URI:
+        return None
+    if _async_replica_engine is None:
+        _async_replica_engine = create_async_engine(settings.SQLALCHEMY_ASYNC_REPLICA_DATABASE_URI, **_opciones_pool())
+        _instalar_pre_ping_por_inactividad(_async_replica_engine.sync_engine)
+    return _async_replica_engine
+
+
+async def dispose_async_engine() -> None:
+    """Cierra los pools async (lifespan shutdown)."""
+    global _async_engine, _async_replica_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+        _async_engines_por_schema.clear()
+    if _async_replica_engine is not None:
+        await _async_replica_engine.dispose()
+        _async_replica_engine = None
+        _async_replica_engines_por_schema.clear()
+
+
+async def async_engine_para_schema(schema: str) -> AsyncEngine:
+    """Equivalente async de engine_para_schema (mismo registro de schemas listos)."""
+    eng = _async_engines_por_schema.get(schema)
+    if eng is None:
+        schema = resolver_schema(schema)
+        base = get_async_engine()
+        if schema not in _schemas_listos:
+            async with base.begin() as conn:
+                await conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{schema}"'))
+            _schemas_listos.add(schema)
+        eng = base.execution_options(schema_translate_map={None: schema})
+        _async_engines_por_schema[schema] = eng
+    return eng
+
+
+def async_replica_para_schema(schema: str) -> Optional[AsyncEngine]:
+    eng = _async_replica_engines_por_schema.get(schema)
+    if eng is None:
+        base = get_async_replica_engine()
+        if base is None:
+            return None
+        schema = resolver_schema(schema)
+        eng = base.execution_options(schema_translate_map={None: schema})
+        _async_replica_engines_por_schema[schema] = eng
+    return eng
+
+
+@asynccontextmanager
+async def async_session_for_schema(schema: str, solo_lectura: bool = False):
+    eng, etiqueta = None, schema
+    if solo_lectura:
+        eng, etiqueta = async_replica_para_schema(schema), f"{schema}:replica"
+    if eng is None:
+        eng, etiqueta = await async_engine_para_schema(schema), schema
+    inicio = time.perf_counter()
+    try:
+        conn = await eng.connect()
+    except Exception:
+        _metricas_pool.incrementar("fallos_checkout", etiqueta)
+        raise
+    _registrar_checkout(etiqueta, inicio)
+    async with conn:
+        async with conn.begin():
+            async with AsyncSessionLocal(bind=conn) as session:
+                info = session.sync_session.info
+                yield session
+        await asyncio.to_thread(ejecutar_tras_commit, info)
 
 
 def get_redis() -> Optional[Redis]:
@@ -36,23 +394,140 @@ def get_redis() -> Optional[Redis]:
         _redis_client = Redis(host=settings.REDIS_HOST, port=int(settings.REDIS_PORT), decode_responses=True)
     return _redis_client
 
+
+def get_redis_binario() -> Optional[Redis]:
+    """
+    Singleton Redis sync sin decode_responses (valores comprimidos) y con
+    timeouts cortos: usado por las cachés, que degradan a origen si Redis falla.
+    """
+    global _redis_binario
+    if not settings.REDIS_HOST or not settings.REDIS_PORT:
+        return None
+    if _redis_binario is None:
+        _redis_binario = Redis(
+            host=settings.REDIS_HOST,
+            port=int(settings.REDIS_PORT),
+            socket_timeout=settings.REDIS_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_TIMEOUT,
+        )
+    return _redis_binario
+
+
+# Compare-and-delete atómico: GET + DELETE por separado podría borrar el lock
+# que otro tomó después de que el propio expiró
+SOLTAR_LOCK_SI_ES_PROPIO = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+def soltar_lock_redis(redis: Redis, clave: str, token: str) -> bool:
+    """Borra `clave` solo si todavía guarda `token`; True si lo borró."""
+    return bool(redis.eval(SOLTAR_LOCK_SI_ES_PROPIO, 1, clave, token))
+
+
+_AL_EXCEDER = {
+    "block": pubsub_v1.types.LimitExceededBehavior.BLOCK,
+    "error": pubsub_v1.types.LimitExceededBehavior.ERROR,
+    "ignore": pubsub_v1.types.LimitExceededBehavior.IGNORE,
+}
+
+
 def get_publisher() -> pubsub_v1.PublisherClient:
     """
     Devuelve un PublisherClient singleton, inicializado de forma lazy.
     Esto evita que se creen credenciales en import time (útil para tests).
+    Los mensajes se agrupan en lotes (cantidad, bytes o latencia, lo primero
+    que se cumpla) y el control de flujo acota lo pendiente de confirmar.
     """
     global _publisher
     if _publisher is None:
-        _publisher = pubsub_v1.PublisherClient()
+        with _publisher_lock:
+            if _publisher is None:
+                _publisher = pubsub_v1.PublisherClient(
+                    batch_settings=pubsub_v1.types.BatchSettings(
+                        max_messages=settings.PUBSUB_BATCH_MAX_MENSAJES,
+                        max_bytes=settings.PUBSUB_BATCH_MAX_BYTES,
+                        max_latency=settings.PUBSUB_BATCH_MAX_LATENCIA,
+                    ),
+                    publisher_options=pubsub_v1.types.PublisherOptions(
+                        flow_control=pubsub_v1.types.PublishFlowControl(
+                            message_limit=settings.PUBSUB_FLOW_MAX_MENSAJES,
+                            byte_limit=settings.PUBSUB_FLOW_MAX_BYTES,
+                            limit_exceeded_behavior=_AL_EXCEDER.get(
+                                settings.PUBSUB_FLOW_AL_EXCEDER, pubsub_v1.types.LimitExceededBehavior.BLOCK
+                            ),
+                        ),
+                    ),
+                )
     return _publisher
 
 
-def publish_event(data: dict, topic_path: str) -> None:
+def _registrar_publicacion(topic: str, inicio: float, futuro: Future) -> None:
+    with _publisher_lock:
+        _publicaciones_pendientes.discard(futuro)
+    etiqueta = topic.rsplit("/", 1)[-1]
+    _metricas_publicacion.observar("publicacion_ms", (time.perf_counter() - inicio) * 1000, etiqueta)
+    error = futuro.exception() if not futuro.cancelled() else None
+    if futuro.cancelled() or error is not None:
+        _metricas_publicacion.incrementar("fallidos", etiqueta)
+        log.error("Pub/Sub: publicación en %s falló: %s", etiqueta, error or "cancelada")
+    else:
+        _metricas_publicacion.incrementar("publicados", etiqueta)
+
+
+def publish_event(data: dict, topic_path: str) -> Future:
     """
-    Publica un evento en Pub/Sub.
+    Publica un evento en Pub/Sub sin esperar la confirmación.
 
     :param data: dict serializable a JSON
     :param topic_path: 'projects/.../topics/...'
+    :return: future con el message id; quien necesite confirmación puede
+        esperarlo (publicar_confirmado / publicar_confirmado_async). Latencia y
+        fallos quedan en las métricas "publicacion" aunque nadie lo espere.
     """
     payload = json.dumps(data, ensure_ascii=False, default=str).encode("utf-8")
-    get_publisher().publish(topic_path, payload)
\ No newline at end of file
+    inicio = time.perf_counter()
+    futuro = get_publisher().publish(topic_path, payload)
+    with _publisher_lock:
+        _publicaciones_pendientes.add(futuro)
+    futuro.add_done_callback(lambda f: _registrar_publicacion(topic_path, inicio, f))
+    return futuro
+
+
+def publicar_confirmado(data: dict, topic_path: str, timeout: float | None = None) -> str:
+    """Publica y bloquea hasta que Pub/Sub confirme; devuelve el message id (o lanza el error)."""
+    return publish_event(data, topic_path).result(timeout=timeout)
+
+
+async def publicar_confirmado_async(data: dict, topic_path: str, timeout: float | None = None) -> str:
+    """Como publicar_confirmado sin bloquear el event loop (publish() tampoco bloquea salvo control de flujo)."""
+    futuro = asyncio.wrap_future(publish_event(data, topic_path))
+    return await asyncio.wait_for(futuro, timeout)
+
+
+def publicaciones_pendientes() -> int:
+    with _publisher_lock:
+        return len(_publicaciones_pendientes)
+
+
+def cerrar_publisher(timeout: float | None = None) -> int:
+    """
+    Envía los lotes abiertos y espera las confirmaciones pendientes (hasta
+    `timeout`, por defecto PUBSUB_FLUSH_TIMEOUT). Devuelve cuántas quedaron sin
+    confirmar. Se llama al apagar: Cloud Run puede bajar la instancia con
+    mensajes todavía en el lote.
+    """
+    global _publisher
+    with _publisher_lock:
+        publisher, _publisher = _publisher, None
+        pendientes = set(_publicaciones_pendientes)
+    if publisher is None:
+        return 0
+    publisher.stop()
+    _, sin_confirmar = wait(pendientes, timeout=settings.PUBSUB_FLUSH_TIMEOUT if timeout is None else timeout)
+    if sin_confirmar:
+        log.warning("Pub/Sub: %s publicaciones sin confirmar al cerrar", len(sin_confirmar))
+    return len(sin_confirmar)
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+# Límites (ms) de los buckets de los histogramas de latencia/espera
+LIMITES_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class Histograma:
+    """Histograma acumulativo en memoria (por proceso) con buckets fijos en ms."""
+
+    def __init__(self, limites: tuple[float, ...] = LIMITES_MS):
+        self.limites = limites
+        self.cuentas = [0] * (len(limites) + 1)
+        self.total = 0
+        self.suma_ms = 0.0
+        self.max_ms = 0.0
+
+    def observar(self, valor_ms: float) -> None:
+        self.cuentas[bisect_left(self.limites, valor_ms)] += 1
+        self.total += 1
+        self.suma_ms += valor_ms
+        self.max_ms = max(self.max_ms, valor_ms)
+
+    def snapshot(self) -> dict:
+        buckets = {f"le_{lim}": n for lim, n in zip(self.limites, self.cuentas)}
+        buckets["inf"] = self.cuentas[-1]
+        return {
+            "total": self.total,
+            "promedio_ms": round(self.suma_ms / self.total, 3) if self.total else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "buckets": buckets,
+        }
+
+
+class Metricas:
+    """
+    Contadores e histogramas de un subsistema (pool, http, cache, ...),
+    agrupados por nombre y etiqueta (schema, ruta, tipo de evento...).
+    """
+
+    def __init__(self, grupo: str):
+        self.grupo = grupo
+        self._lock = threading.Lock()
+        self._contadores: dict[str, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self._histogramas: dict[str, dict[str, Histograma]] = defaultdict(dict)
+
+    def incrementar(self, nombre: str, etiqueta: str = "total", n: int = 1) -> None:
+        with self._lock:
+            self._contadores[nombre][etiqueta] += n
+
+    def observar(self, nombre: str, valor_ms: float, etiqueta: str = "total") -> None:
+        with self._lock:
+            hist = self._histogramas[nombre].get(etiqueta)
+            if hist is None:
+                hist = self._histogramas[nombre][etiqueta] = Histograma()
+            hist.observar(valor_ms)
+
+    def contador(self, nombre: str, etiqueta: str = "total") -> int:
+        with self._lock:
+            return self._contadores.get(nombre, {}).get(etiqueta, 0)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "contadores": {n: dict(por_etq) for n, por_etq in self._contadores.items()},
+                "histogramas": {
+                    n: {etq: h.snapshot() for etq, h in por_etq.items()}
+                    for n, por_etq in self._histogramas.items()
+                },
+            }
+
+    def reiniciar(self) -> None:
+        with self._lock:
+            self._contadores.clear()
+            self._histogramas.clear()
+
+
+_registro: dict[str, Metricas] = {}
+_registro_lock = threading.Lock()
+
+
+def get_metricas(grupo: str) -> Metricas:
+    """Devuelve (creando si hace falta) las métricas del grupo, singleton por proceso."""
+    with _registro_lock:
+        if grupo not in _registro:
+            _registro[grupo] = Metricas(grupo)
+        return _registro[grupo]
+
+
+def snapshot_metricas() -> dict[str, dict]:
+    with _registro_lock:
+        grupos = list(_registro.values())
+    return {m.grupo: m.snapshot() for m in grupos}
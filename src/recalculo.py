@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import sys
+from dataclasses import asdict
+from datetime import date
+
+from src.config import settings
+from src.errors import ValidationError
+from src.infrastructure.bootstrap import inicializar_schemas
+from src.infrastructure.http import cerrar_http_session
+from src.infrastructure.infrastructure import resolver_schema
+from src.services.servicio_recalculo_paises import recalcular_paises
+
+log = logging.getLogger(__name__)
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    Recálculo de fin de día de todos los planes activos (Cloud Run Job / cron):
+    imprime el reporte en JSON y sale con 1 si algún país falló.
+    """
+    parser = argparse.ArgumentParser(description="Recálculo del progreso de todos los planes activos por país")
+    parser.add_argument("--fecha", type=date.fromisoformat, default=None, help="YYYY-MM-DD; por defecto hoy")
+    parser.add_argument("--paises", default=None, help="schemas separados por coma; por defecto KNOWN_SCHEMAS")
+    parser.add_argument("--paralelismo", type=int, default=settings.RECALCULO_PAISES_PARALELISMO)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+        handlers=[logging.StreamHandler(sys.stdout)],
+    )
+    try:
+        paises = [resolver_schema(p) for p in (args.paises or "").split(",") if p.strip()] or None
+    except ValidationError as e:
+        parser.error(str(e))
+    for r in inicializar_schemas(paises or settings.KNOWN_SCHEMAS):
+        if r["estado"] == "error":
+            log.error(f"❌ Error creando tablas en schema {r['schema']}: {r['error']}")
+
+    try:
+        res = recalcular_paises(args.fecha, paises, args.paralelismo)
+    finally:
+        cerrar_http_session()
+    print(json.dumps({**asdict(res), "errores": res.errores}, default=str, ensure_ascii=False))
+    return 1 if res.errores else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
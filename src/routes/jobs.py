@@ -0,0 +1,29 @@
+from dataclasses import asdict
+from datetime import date
+
+from fastapi import APIRouter, HTTPException, Query
+from src.errors import ValidationError
+from src.services.servicio_recalculo_paises import recalcular_paises
+
+
+# Trabajos programados (Cloud Scheduler): corren dentro del request y devuelven el reporte
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+
+@router.post("/recalculo-progreso")
+def recalculo_progreso(
+    d: date | None = Query(default=None),
+    paises: str | None = Query(default=None, description="Schemas separados por coma; por defecto todos"),
+    paralelismo: int | None = Query(default=None, ge=1),
+):
+    """
+    Refresca el progreso de todos los planes activos vigentes en `d` (por
+    defecto hoy), un lote por país con una sola descarga de pedidos cada uno.
+    Responde 200 aunque falle algún país: su estado queda en el reporte.
+    """
+    lista = [p for p in (paises or "").split(",") if p.strip()] or None
+    try:
+        res = recalcular_paises(d, lista, paralelismo)
+    except ValidationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {**asdict(res), "errores": res.errores}
@@ -0,0 +1,39 @@
+from fastapi import APIRouter
+from src.infrastructure.infrastructure import estado_pools, publicaciones_pendientes
+from src.infrastructure.http import estado_http
+from src.infrastructure.cache import ratios_cache_respuestas
+from src.infrastructure.metricas import get_metricas, snapshot_metricas
+from src.services.eventos import get_despachador
+
+# Superficie interna de métricas en memoria (por instancia de Cloud Run)
+router = APIRouter(prefix="/metrics", tags=["meta"])
+
+
+@router.get("")
+def metricas():
+    return snapshot_metricas()
+
+
+@router.get("/pool")
+def metricas_pool():
+    return {"pools": estado_pools(), **get_metricas("pool").snapshot()}
+
+
+@router.get("/http")
+def metricas_http():
+    return estado_http()
+
+
+@router.get("/cache")
+def metricas_cache():
+    return {"rutas": ratios_cache_respuestas(), **get_metricas("cache_respuestas").snapshot()}
+
+
+@router.get("/publicacion")
+def metricas_publicacion():
+    return {"pendientes": publicaciones_pendientes(), **get_metricas("publicacion").snapshot()}
+
+
+@router.get("/eventos")
+def metricas_eventos():
+    return {"handlers": get_despachador().estado(), **get_metricas("pubsub").snapshot()}
@@ -1,25 +1,151 @@
 from __future__ import annotations
+import asyncio
 from datetime import date
-from fastapi import APIRouter, Depends, Header, Query, HTTPException
+from typing import Awaitable, Callable, Iterable, AsyncIterable, Literal
+from fastapi import APIRouter, Depends, Header, Query, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
-from src.dependencies import get_session
-from src.domain.schemas import PlanDeVentasCrear, PlanDeVentasSalida, ProgresoSalida
-from src.services.servicio_plan_ventas import ServicioPlanDeVentas
+from src.dependencies import Lectura, get_lectura, get_session, get_read_session, get_schema
+from src.domain.schemas import PlanDeVentasCrear, PlanDeVentasSalida, ProgresoSalida, FiltrosPlanes
+from src.errors import ValidationError
+from src.services.paginacion import LIMITE_POR_DEFECTO, LIMITE_MAXIMO, HEADER_SIGUIENTE_CURSOR
+from src.services.etags import HEADER_ETAG, HEADER_IF_NONE_MATCH, coincide_etag
+from src.services.servicio_plan_ventas import (
+    ServicioPlanDeVentas,
+    validar_rango,
+    ESPACIO_PLANES,
+    espacio_planes_vendedor,
+)
+from src.services.exportacion import MEDIA_TYPES, exportar
 from src.config import settings
 from src.infrastructure.infrastructure import publish_event
+from src.infrastructure.coalescencia import reclamar_publicacion
+from src.infrastructure.cache import get_cache_respuestas
 
 
 router = APIRouter(prefix="/v1/ventas/planes", tags=["ventas"])
 
+_LISTA_PLANES = TypeAdapter(list[PlanDeVentasSalida])
+
+
+def respuesta_planes(filas: list[dict], siguiente_cursor: str | None = None) -> Response:
+    """
+    Serializa los planes una sola vez. Al devolver un Response, FastAPI no
+    vuelve a validar contra response_model (que queda para OpenAPI).
+    """
+    headers = {HEADER_SIGUIENTE_CURSOR: siguiente_cursor} if siguiente_cursor else None
+    contenido = _LISTA_PLANES.dump_json(_LISTA_PLANES.validate_python(filas))
+    return Response(content=contenido, media_type="application/json", headers=headers)
+
+
+def _a_cache(respuesta: Response) -> dict:
+    return {"cuerpo": respuesta.body.decode("utf-8"), "cursor": respuesta.headers.get(HEADER_SIGUIENTE_CURSOR)}
+
+
+def _desde_cache(guardada: dict) -> Response:
+    headers = {HEADER_SIGUIENTE_CURSOR: guardada["cursor"]} if guardada.get("cursor") else None
+    return Response(content=guardada["cuerpo"], media_type="application/json", headers=headers)
+
+
+def con_cache(ruta: str, schema: str, espacio: str, params: dict, producir: Callable[[bool], Response]) -> Response:
+    """
+    Sirve un listado desde la caché de respuestas (L1/Redis) o lo produce y lo
+    guarda. Solo se cachean respuestas exitosas: los errores salen como excepción.
+    `producir(primario)` abre la sesión recién ahí (un hit no toca la BD). Lo que
+    se guarda se lee siempre del primario: una réplica atrasada dejaría filas
+    viejas bajo la generación nueva durante CACHE_RESPUESTAS_TTL, y el que acaba
+    de escribir las recibiría desde la caché. Sin caché, producir(False) usa la réplica.
+    """
+    cache = get_cache_respuestas()
+    if cache is None:
+        return producir(False)
+    clave = cache.clave(ruta, schema, espacio, params)
+    guardada = cache.leer(ruta, clave)
+    if guardada is not None:
+        return _desde_cache(guardada)
+    respuesta = producir(True)
+    cache.guardar(clave, _a_cache(respuesta))
+    return respuesta
+
+
+async def con_cache_async(
+    ruta: str, schema: str, espacio: str, params: dict, producir: Callable[[bool], Awaitable[Response]]
+) -> Response:
+    cache = get_cache_respuestas()
+    if cache is None:
+        return await producir(False)
+    # el cliente Redis es sync: sus llamadas van al threadpool
+    clave = await asyncio.to_thread(cache.clave, ruta, schema, espacio, params)
+    guardada = await asyncio.to_thread(cache.leer, ruta, clave)
+    if guardada is not None:
+        return _desde_cache(guardada)
+    respuesta = await producir(True)
+    await asyncio.to_thread(cache.guardar, clave, _a_cache(respuesta))
+    return respuesta
+
+
+def respuesta_no_modificada(etag: str) -> Response:
+    """304 sin cuerpo: el cliente conserva la representación que ya tiene."""
+    return Response(status_code=304, headers={HEADER_ETAG: etag})
+
+
+def respuesta_exportacion(
+    cuerpo: Iterable[bytes] | AsyncIterable[bytes], entidad: str, formato: str, schema: str
+) -> StreamingResponse:
+    nombre = f"{entidad}-{schema}.{formato}"
+    return StreamingResponse(
+        cuerpo,
+        media_type=MEDIA_TYPES[formato],
+        headers={"Content-Disposition": f'attachment; filename="{nombre}"'},
+    )
+
+
+def rango_de_recalculo(d: date | None, desde: date | None, hasta: date | None) -> tuple[date, date] | None:
+    if desde is None and hasta is None:
+        return None
+    if desde is None or hasta is None:
+        raise ValidationError("desde y hasta deben enviarse juntos")
+    if d is not None:
+        raise ValidationError("Use d para un día o desde/hasta para un rango, no ambos")
+    validar_rango(desde, hasta)
+    return desde, hasta
+
+
+def evento_recalculo(
+    id_plan: str, d: date | None, rango: tuple[date, date] | None, country: str
+) -> tuple[dict, dict]:
+    """Evento recalcular_plan_ventas y cuerpo de la respuesta 202 (día o backfill)."""
+    if rango:
+        fechas = {"desde": rango[0].isoformat(), "hasta": rango[1].isoformat()}
+        detail = "Backfill de progreso encolado para procesamiento asíncrono"
+    else:
+        fechas = {"fecha": (d or date.today()).isoformat()}
+        detail = "Recalculo de plan encolado para procesamiento asíncrono"
+    event = {
+        "event": "recalcular_plan_ventas",
+        "plan_id": id_plan,
+        **fechas,
+        "ctx": {"country": country},
+    }
+    return event, {"detail": detail, "plan_id": id_plan, **fechas}
+
+
+def evento_recalculo_lote(d: date | None, country: str) -> tuple[dict, dict]:
+    fecha = (d or date.today()).isoformat()
+    event = {"event": "recalcular_planes_del_dia", "fecha": fecha, "ctx": {"country": country}}
+    respuesta = {"detail": "Recalculo de planes activos encolado para procesamiento asíncrono", "fecha": fecha}
+    return event, respuesta
+
 
 @router.post("", response_model=PlanDeVentasSalida)
 def crear_plan(
     payload: PlanDeVentasCrear,
     db: Session = Depends(get_session),
-    x_country: str | None = Header(default=None, alias=settings.COUNTRY_HEADER),
+    schema: str = Depends(get_schema),
 ):
-    svc = ServicioPlanDeVentas(db, x_country or settings.DEFAULT_SCHEMA)
+    svc = ServicioPlanDeVentas(db, schema)
     try:
         plan = svc.crear(payload)
     except IntegrityError:
@@ -43,85 +169,105 @@ def crear_plan(
 
 @router.get("", response_model=list[PlanDeVentasSalida])
 def obtener_planes(
-    db: Session = Depends(get_session),
-    x_country: str | None = Header(default=None, alias=settings.COUNTRY_HEADER),
+    filtros: FiltrosPlanes = Depends(),
+    limite: int = Query(default=LIMITE_POR_DEFECTO, ge=1, le=LIMITE_MAXIMO),
+    cursor: str | None = Query(default=None),
+    lectura: Lectura = Depends(get_lectura),
+    schema: str = Depends(get_schema),
 ):
-    svc = ServicioPlanDeVentas(db, x_country or settings.DEFAULT_SCHEMA)
-    planes = svc.obtener_todos()
-    return [
-        PlanDeVentasSalida(
-            id=plan.id,
-            id_vendedor=plan.id_vendedor,
-            periodo=plan.periodo,
-            territorio=plan.territorio,
-            meta_monto=float(plan.meta_monto or 0),
-            meta_unidades=plan.meta_unidades,
-            meta_clientes=plan.meta_clientes,
-            fecha_inicio=plan.fecha_inicio,
-            fecha_fin=plan.fecha_fin,
-            activo=plan.activo,
-            ids_productos=[p.id_producto for p in plan.productos],
-            id_cliente_objetivo=plan.id_cliente_objetivo,
-        )
-        for plan in planes
-    ]
+    def producir(primario: bool) -> Response:
+        with lectura.sesion(primario) as db:
+            svc = ServicioPlanDeVentas(db, schema)
+            try:
+                pagina = svc.listar(filtros, cursor=cursor, limite=limite)
+            except ValidationError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            return respuesta_planes(pagina.items, pagina.siguiente_cursor)
+
+    params = {**filtros.model_dump(mode="json"), "limite": limite, "cursor": cursor}
+    return con_cache("planes", schema, ESPACIO_PLANES, params, producir)
+
+
+@router.get("/exportar")
+def exportar_planes(
+    entidad: Literal["planes", "progreso"] = Query(default="planes"),
+    formato: Literal["ndjson", "csv"] = Query(default="ndjson"),
+    schema: str = Depends(get_schema),
+):
+    # Sin Depends(get_session): la sesión de un yield-dependency se cierra
+    # antes de que empiece el streaming; exportar() abre la suya.
+    return respuesta_exportacion(exportar(schema, entidad, formato), entidad, formato, schema)
 
 
 @router.get("/vendedor/{id_vendedor}", response_model=list[PlanDeVentasSalida])
 def obtener_planes_por_vendedor(
     id_vendedor: str,
-    db: Session = Depends(get_session),
-    x_country: str | None = Header(default=None, alias=settings.COUNTRY_HEADER),
+    lectura: Lectura = Depends(get_lectura),
+    schema: str = Depends(get_schema),
 ):
-    svc = ServicioPlanDeVentas(db, x_country or settings.DEFAULT_SCHEMA)
-    planes = svc.obtener_por_vendedor(id_vendedor)
-    return [
-        PlanDeVentasSalida(
-            id=plan.id,
-            id_vendedor=plan.id_vendedor,
-            periodo=plan.periodo,
-            territorio=plan.territorio,
-            meta_monto=float(plan.meta_monto or 0),
-            meta_unidades=plan.meta_unidades,
-            meta_clientes=plan.meta_clientes,
-            fecha_inicio=plan.fecha_inicio,
-            fecha_fin=plan.fecha_fin,
-            activo=plan.activo,
-            ids_productos=[p.id_producto for p in plan.productos],
-            id_cliente_objetivo=plan.id_cliente_objetivo,
-        )
-        for plan in planes
-    ]
+    def producir(primario: bool) -> Response:
+        with lectura.sesion(primario) as db:
+            return respuesta_planes(ServicioPlanDeVentas(db, schema).listar_por_vendedor(id_vendedor))
+
+    return con_cache("planes_vendedor", schema, espacio_planes_vendedor(id_vendedor), {}, producir)
 
 
 @router.get("/{id_plan}/progreso", response_model=list[ProgresoSalida])
-def obtener_progreso(id_plan: str, db: Session = Depends(get_session)):
-    from sqlalchemy import select
-    from src.domain.models import ProgresoPlanDeVentas
-    filas = db.execute(
-        select(ProgresoPlanDeVentas)
-        .where(ProgresoPlanDeVentas.id_plan == id_plan)
-        .order_by(ProgresoPlanDeVentas.fecha)
-    ).scalars()
-    return list(filas)
+def obtener_progreso(
+    id_plan: str,
+    response: Response,
+    db: Session = Depends(get_read_session),
+    schema: str = Depends(get_schema),
+    if_none_match: str | None = Header(default=None, alias=HEADER_IF_NONE_MATCH),
+):
+    svc = ServicioPlanDeVentas(db, schema)
+    etag = svc.etag_progreso(id_plan)
+    if coincide_etag(if_none_match, etag):
+        return respuesta_no_modificada(etag)
+    response.headers[HEADER_ETAG] = etag
+    return svc.obtener_progreso(id_plan)
+
+
+@router.post("/recalcular", status_code=202)
+def recalcular_todos(
+    d: date | None = Query(default=None),
+    schema: str = Depends(get_schema),
+):
+    if not settings.TOPIC_VENTAS_CRM:
+        raise HTTPException(
+            status_code=500,
+            detail="TOPIC_VENTAS_CRM no configurado en variables de entorno",
+        )
+
+    # Un solo evento por país y día: el worker descarga los pedidos una vez para todos los planes
+    event, respuesta = evento_recalculo_lote(d, schema)
+    if not reclamar_publicacion(event):
+        return {**respuesta, "coalescido": True}
+    publish_event(event, settings.TOPIC_VENTAS_CRM)
+    return respuesta
 
 
 @router.post("/{id_plan}/recalcular", status_code=202)
 def recalcular(
     id_plan: str,
     d: date | None = Query(default=None),
+    desde: date | None = Query(default=None),
+    hasta: date | None = Query(default=None),
     db: Session = Depends(get_session),
-    x_country: str | None = Header(default=None, alias=settings.COUNTRY_HEADER),
+    schema: str = Depends(get_schema),
 ):
-    # 1) Validar que el plan exista
-    svc = ServicioPlanDeVentas(db, x_country or settings.DEFAULT_SCHEMA)
+    # 1) Validar parámetros: un día (d) o un rango de backfill (desde/hasta)
+    try:
+        rango = rango_de_recalculo(d, desde, hasta)
+    except ValidationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # 2) Validar que el plan exista
+    svc = ServicioPlanDeVentas(db, schema)
     plan = svc.obtener(id_plan)
     if not plan:
         raise HTTPException(status_code=404, detail="Plan de ventas no encontrado")
 
-    # 2) Determinar fecha a recalcular
-    fecha = d or date.today()
-
     # 3) Asegurar que el topic esté configurado
     if not settings.TOPIC_VENTAS_CRM:
         raise HTTPException(
@@ -129,23 +275,12 @@ def recalcular(
             detail="TOPIC_VENTAS_CRM no configurado en variables de entorno",
         )
 
-    # 4) Construir evento
-    event = {
-        "event": "recalcular_plan_ventas",
-        "plan_id": id_plan,
-        "fecha": fecha.isoformat(),
-        "ctx": {
-            "country": (x_country or settings.DEFAULT_SCHEMA),
-            # aquí podrías agregar trace_id / user_id si quieres
-        },
-    }
-
-    # 5) Publicar en Pub/Sub (fire-and-forget)
+    # 4) Construir y publicar el evento (fire-and-forget); clics repetidos dentro
+    #    de la ventana se fusionan con el evento ya publicado
+    event, respuesta = evento_recalculo(id_plan, d, rango, schema)
+    if not reclamar_publicacion(event):
+        return {**respuesta, "coalescido": True}
     publish_event(event, settings.TOPIC_VENTAS_CRM)
 
-    # 6) Respuesta inmediata (async a nivel arquitectura)
-    return {
-        "detail": "Recalculo de plan encolado para procesamiento asíncrono",
-        "plan_id": id_plan,
-        "fecha": fecha.isoformat(),
-    }
+    # 5) Respuesta inmediata (async a nivel arquitectura)
+    return respuesta
@@ -0,0 +1,173 @@
+from __future__ import annotations
+import asyncio
+from datetime import date
+from typing import Literal
+from fastapi import APIRouter, Depends, Header, Query, HTTPException, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import IntegrityError
+from src.dependencies import Lectura, get_lectura, get_async_session, get_async_read_session, get_schema
+from src.domain import models
+from src.domain.schemas import PlanDeVentasCrear, PlanDeVentasSalida, ProgresoSalida, FiltrosPlanes
+from src.errors import ValidationError
+from src.services.paginacion import LIMITE_POR_DEFECTO, LIMITE_MAXIMO
+from src.routes.planes import (
+    respuesta_planes,
+    respuesta_exportacion,
+    rango_de_recalculo,
+    evento_recalculo,
+    evento_recalculo_lote,
+    con_cache_async,
+    respuesta_no_modificada,
+)
+from src.services.etags import HEADER_ETAG, HEADER_IF_NONE_MATCH, coincide_etag
+from src.services.servicio_plan_ventas import ESPACIO_PLANES, espacio_planes_vendedor
+from src.services.exportacion import exportar_async
+from src.services.servicio_plan_ventas_async import ServicioPlanDeVentasAsync
+from src.config import settings
+from src.infrastructure.infrastructure import publish_event
+from src.infrastructure.coalescencia import reclamar_publicacion
+
+# Mismas rutas que src.routes.planes, montadas en su lugar cuando DB_ASYNC=true
+router = APIRouter(prefix="/v1/ventas/planes", tags=["ventas"])
+
+
+def _plan_a_salida(plan: models.PlanDeVentas) -> PlanDeVentasSalida:
+    return PlanDeVentasSalida(
+        id=plan.id,
+        id_vendedor=plan.id_vendedor,
+        periodo=plan.periodo,
+        territorio=plan.territorio,
+        meta_monto=float(plan.meta_monto or 0),
+        meta_unidades=plan.meta_unidades,
+        meta_clientes=plan.meta_clientes,
+        fecha_inicio=plan.fecha_inicio,
+        fecha_fin=plan.fecha_fin,
+        activo=plan.activo,
+        ids_productos=[p.id_producto for p in plan.productos],
+        id_cliente_objetivo=plan.id_cliente_objetivo,
+    )
+
+
+@router.post("", response_model=PlanDeVentasSalida)
+async def crear_plan(
+    payload: PlanDeVentasCrear,
+    db: AsyncSession = Depends(get_async_session),
+    schema: str = Depends(get_schema),
+):
+    svc = ServicioPlanDeVentasAsync(db, schema)
+    try:
+        plan = await svc.crear(payload)
+    except IntegrityError:
+        raise HTTPException(status_code=400, detail="Ya existe un plan de ventas con ese vendedor, cliente y rango/periodo")
+    return _plan_a_salida(plan)
+
+
+@router.get("", response_model=list[PlanDeVentasSalida])
+async def obtener_planes(
+    filtros: FiltrosPlanes = Depends(),
+    limite: int = Query(default=LIMITE_POR_DEFECTO, ge=1, le=LIMITE_MAXIMO),
+    cursor: str | None = Query(default=None),
+    lectura: Lectura = Depends(get_lectura),
+    schema: str = Depends(get_schema),
+):
+    async def producir(primario: bool) -> Response:
+        async with lectura.sesion_async(primario) as db:
+            svc = ServicioPlanDeVentasAsync(db, schema)
+            try:
+                pagina = await svc.listar(filtros, cursor=cursor, limite=limite)
+            except ValidationError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            return respuesta_planes(pagina.items, pagina.siguiente_cursor)
+
+    params = {**filtros.model_dump(mode="json"), "limite": limite, "cursor": cursor}
+    return await con_cache_async("planes", schema, ESPACIO_PLANES, params, producir)
+
+
+@router.get("/exportar")
+async def exportar_planes(
+    entidad: Literal["planes", "progreso"] = Query(default="planes"),
+    formato: Literal["ndjson", "csv"] = Query(default="ndjson"),
+    schema: str = Depends(get_schema),
+):
+    return respuesta_exportacion(exportar_async(schema, entidad, formato), entidad, formato, schema)
+
+
+@router.get("/vendedor/{id_vendedor}", response_model=list[PlanDeVentasSalida])
+async def obtener_planes_por_vendedor(
+    id_vendedor: str,
+    lectura: Lectura = Depends(get_lectura),
+    schema: str = Depends(get_schema),
+):
+    async def producir(primario: bool) -> Response:
+        async with lectura.sesion_async(primario) as db:
+            return respuesta_planes(await ServicioPlanDeVentasAsync(db, schema).listar_por_vendedor(id_vendedor))
+
+    return await con_cache_async("planes_vendedor", schema, espacio_planes_vendedor(id_vendedor), {}, producir)
+
+
+@router.get("/{id_plan}/progreso", response_model=list[ProgresoSalida])
+async def obtener_progreso(
+    id_plan: str,
+    response: Response,
+    db: AsyncSession = Depends(get_async_read_session),
+    schema: str = Depends(get_schema),
+    if_none_match: str | None = Header(default=None, alias=HEADER_IF_NONE_MATCH),
+):
+    svc = ServicioPlanDeVentasAsync(db, schema)
+    etag = await svc.etag_progreso(id_plan)
+    if coincide_etag(if_none_match, etag):
+        return respuesta_no_modificada(etag)
+    response.headers[HEADER_ETAG] = etag
+    return await svc.obtener_progreso(id_plan)
+
+
+@router.post("/recalcular", status_code=202)
+async def recalcular_todos(
+    d: date | None = Query(default=None),
+    schema: str = Depends(get_schema),
+):
+    if not settings.TOPIC_VENTAS_CRM:
+        raise HTTPException(
+            status_code=500,
+            detail="TOPIC_VENTAS_CRM no configurado en variables de entorno",
+        )
+
+    event, respuesta = evento_recalculo_lote(d, schema)
+    # el cliente Redis es sync: va al threadpool
+    if not await asyncio.to_thread(reclamar_publicacion, event):
+        return {**respuesta, "coalescido": True}
+    await asyncio.to_thread(publish_event, event, settings.TOPIC_VENTAS_CRM)
+    return respuesta
+
+
+@router.post("/{id_plan}/recalcular", status_code=202)
+async def recalcular(
+    id_plan: str,
+    d: date | None = Query(default=None),
+    desde: date | None = Query(default=None),
+    hasta: date | None = Query(default=None),
+    db: AsyncSession = Depends(get_async_session),
+    schema: str = Depends(get_schema),
+):
+    try:
+        rango = rango_de_recalculo(d, desde, hasta)
+    except ValidationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    svc = ServicioPlanDeVentasAsync(db, schema)
+    if not await svc.obtener(id_plan):
+        raise HTTPException(status_code=404, detail="Plan de ventas no encontrado")
+
+    if not settings.TOPIC_VENTAS_CRM:
+        raise HTTPException(
+            status_code=500,
+            detail="TOPIC_VENTAS_CRM no configurado en variables de entorno",
+        )
+
+    event, respuesta = evento_recalculo(id_plan, d, rango, schema)
+    if not await asyncio.to_thread(reclamar_publicacion, event):
+        return {**respuesta, "coalescido": True}
+    # publish() no espera la confirmación, pero puede bloquear: el primer uso crea
+    # el PublisherClient (credenciales, canal gRPC) y el control de flujo retiene
+    await asyncio.to_thread(publish_event, event, settings.TOPIC_VENTAS_CRM)
+    return respuesta
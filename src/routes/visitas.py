@@ -1,37 +1,69 @@
 from __future__ import annotations
-from datetime import date
-from fastapi import APIRouter, Depends, UploadFile, File, Form, Header, HTTPException
+from typing import Literal
+from fastapi import APIRouter, Depends, UploadFile, File, Form, Header, HTTPException, Query, Response
 from sqlalchemy.exc import IntegrityError
+from pydantic import TypeAdapter
 from sqlalchemy.orm import Session
-from src.dependencies import get_session
-from src.domain.schemas import VisitaCrear, VisitaSalida, DetalleVisitaCrear, DetalleVisitaSalida, VisitaConDetalleSalida
-from src.services.servicio_visitas import ServicioVisitas
-from src.config import settings
-from src.errors import NotFoundError
+from src.dependencies import Lectura, get_lectura, get_session, get_read_session, get_schema
+from src.domain.schemas import VisitaCrear, VisitaSalida, DetalleVisitaCrear, DetalleVisitaSalida, VisitaConDetalleSalida, FiltrosVisitas
+from src.services.servicio_visitas import ServicioVisitas, ESPACIO_VISITAS
+from src.services.exportacion import exportar
+from src.routes.planes import respuesta_exportacion, con_cache, respuesta_no_modificada
+from src.services.etags import HEADER_ETAG, HEADER_IF_NONE_MATCH, coincide_etag
+from src.errors import NotFoundError, ValidationError
+from src.services.paginacion import LIMITE_POR_DEFECTO, LIMITE_MAXIMO, HEADER_SIGUIENTE_CURSOR
 router = APIRouter(prefix="/v1/visitas", tags=["visitas"])
 
+_LISTA_VISITAS = TypeAdapter(list[VisitaSalida])
+
+
+def respuesta_visitas(visitas: list, siguiente_cursor: str | None = None) -> Response:
+    """Como respuesta_planes: se serializa una vez y el cuerpo puede ir a la caché."""
+    headers = {HEADER_SIGUIENTE_CURSOR: siguiente_cursor} if siguiente_cursor else None
+    contenido = _LISTA_VISITAS.dump_json(_LISTA_VISITAS.validate_python(visitas, from_attributes=True))
+    return Response(content=contenido, media_type="application/json", headers=headers)
+
+
 @router.post("", response_model=VisitaSalida)
 def crear_visita(
     payload: VisitaCrear,
-    x_country: str | None = Header(default=None, alias=settings.COUNTRY_HEADER),
+    schema: str = Depends(get_schema),
     db: Session = Depends(get_session),
 ):
-    pais = (x_country or settings.DEFAULT_SCHEMA).lower()
     try:
-        v = ServicioVisitas(db, pais).crear_visita(payload)
+        v = ServicioVisitas(db, schema).crear_visita(payload)
     except IntegrityError:
         raise HTTPException(status_code=400, detail="Ya existe una visita para ese cliente, vendedor y fecha")
     return v
 
 @router.get("", response_model=list[VisitaSalida])
 def listar_visitas(
-    id_vendedor: str | None = None,
-    d: date | None = None,
-    x_country: str | None = Header(default=None, alias=settings.COUNTRY_HEADER),
-    db: Session = Depends(get_session),
+    filtros: FiltrosVisitas = Depends(),
+    limite: int = Query(default=LIMITE_POR_DEFECTO, ge=1, le=LIMITE_MAXIMO),
+    cursor: str | None = Query(default=None),
+    lectura: Lectura = Depends(get_lectura),
+    schema: str = Depends(get_schema),
+):
+    def producir(primario: bool) -> Response:
+        with lectura.sesion(primario) as db:
+            try:
+                pagina = ServicioVisitas(db, schema).listar_visitas(filtros, cursor=cursor, limite=limite)
+            except ValidationError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            return respuesta_visitas(pagina.items, pagina.siguiente_cursor)
+
+    params = {**filtros.model_dump(mode="json"), "limite": limite, "cursor": cursor}
+    return con_cache("visitas", schema, ESPACIO_VISITAS, params, producir)
+
+@router.get("/exportar")
+def exportar_visitas(
+    entidad: Literal["visitas", "detalles"] = Query(default="visitas"),
+    formato: Literal["ndjson", "csv"] = Query(default="ndjson"),
+    schema: str = Depends(get_schema),
 ):
-    pais = (x_country or settings.DEFAULT_SCHEMA).lower()
-    return ServicioVisitas(db, pais).listar_visitas(id_vendedor=id_vendedor, d=d)
+    # Declarada antes de /{id_visita} para que "exportar" no se tome como id
+    return respuesta_exportacion(exportar(schema, entidad, formato), entidad, formato, schema)
+
 
 @router.post("/{id_visita}/detalle", response_model=DetalleVisitaSalida)
 async def agregar_detalle(
@@ -41,11 +73,9 @@ async def agregar_detalle(
     hallazgos: str | None = Form(None),
     sugerencias_producto: str | None = Form(None),
     foto: UploadFile | None = File(None),
-    x_country: str | None = Header(default=None, alias=settings.COUNTRY_HEADER),
+    schema: str = Depends(get_schema),
     db: Session = Depends(get_session),
 ):
-    pais = (x_country or settings.DEFAULT_SCHEMA).lower()
-
     payload = DetalleVisitaCrear(
         id_cliente=id_cliente,
         atendido_por=atendido_por,
@@ -57,7 +87,7 @@ async def agregar_detalle(
     nombre = foto.filename if foto else None
     ctype = foto.content_type if foto else None
     try:
-        detalle = ServicioVisitas(db, pais).agregar_detalle(
+        detalle = ServicioVisitas(db, schema).agregar_detalle(
             id_visita,
             payload,
             foto_bytes=contenido,
@@ -74,15 +104,25 @@ async def agregar_detalle(
 @router.get("/{id_visita}", response_model=VisitaConDetalleSalida)
 def obtener_visita(
     id_visita: str,
+    response: Response,
     incluir_foto_ios: bool = True,
-    x_country: str | None = Header(default=None, alias=settings.COUNTRY_HEADER),
-    db: Session = Depends(get_session),
+    schema: str = Depends(get_schema),
+    if_none_match: str | None = Header(default=None, alias=HEADER_IF_NONE_MATCH),
+    db: Session = Depends(get_read_session),
 ):
-    pais = (x_country or settings.DEFAULT_SCHEMA).lower()
+    svc = ServicioVisitas(db, schema)
     try:
-        visita, detalle, foto_ios = ServicioVisitas(db, pais).obtener_visita_con_detalle(id_visita)
-    except ValueError as e:
+        # el 304 sale antes de leer el detalle, descargar la foto y serializar
+        etag = svc.etag_visita(id_visita, incluir_foto_ios)
+        if coincide_etag(if_none_match, etag):
+            return respuesta_no_modificada(etag)
+        visita, detalle, foto_ios = svc.obtener_visita_con_detalle(id_visita, incluir_foto=incluir_foto_ios)
+    except NotFoundError as e:
         raise HTTPException(status_code=404, detail=str(e))
+    # si la foto se pidió pero no se pudo descargar la respuesta es parcial: sin ETag,
+    # para que un 304 posterior no la dé por buena cuando GCS vuelva a responder
+    if not (incluir_foto_ios and detalle and detalle.url_foto and foto_ios is None):
+        response.headers[HEADER_ETAG] = etag
 
     # construir respuesta
     from src.domain.schemas import VisitaConDetalleSalida, DetalleVisitaSalida
@@ -0,0 +1,129 @@
+from __future__ import annotations
+from typing import Literal
+from fastapi import APIRouter, Depends, UploadFile, File, Form, Header, HTTPException, Query, Response
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.dependencies import Lectura, get_lectura, get_async_session, get_async_read_session, get_schema
+from src.domain.schemas import VisitaCrear, VisitaSalida, DetalleVisitaCrear, DetalleVisitaSalida, VisitaConDetalleSalida, FiltrosVisitas
+from src.services.servicio_visitas_async import ServicioVisitasAsync
+from src.services.servicio_visitas import ESPACIO_VISITAS
+from src.services.exportacion import exportar_async
+from src.routes.planes import respuesta_exportacion, con_cache_async, respuesta_no_modificada
+from src.services.etags import HEADER_ETAG, HEADER_IF_NONE_MATCH, coincide_etag
+from src.routes.visitas import respuesta_visitas
+from src.errors import NotFoundError, ValidationError
+from src.services.paginacion import LIMITE_POR_DEFECTO, LIMITE_MAXIMO
+
+# Mismas rutas que src.routes.visitas, montadas en su lugar cuando DB_ASYNC=true
+router = APIRouter(prefix="/v1/visitas", tags=["visitas"])
+
+
+@router.post("", response_model=VisitaSalida)
+async def crear_visita(
+    payload: VisitaCrear,
+    schema: str = Depends(get_schema),
+    db: AsyncSession = Depends(get_async_session),
+):
+    try:
+        return await ServicioVisitasAsync(db, schema).crear_visita(payload)
+    except IntegrityError:
+        raise HTTPException(status_code=400, detail="Ya existe una visita para ese cliente, vendedor y fecha")
+
+
+@router.get("", response_model=list[VisitaSalida])
+async def listar_visitas(
+    filtros: FiltrosVisitas = Depends(),
+    limite: int = Query(default=LIMITE_POR_DEFECTO, ge=1, le=LIMITE_MAXIMO),
+    cursor: str | None = Query(default=None),
+    lectura: Lectura = Depends(get_lectura),
+    schema: str = Depends(get_schema),
+):
+    async def producir(primario: bool) -> Response:
+        async with lectura.sesion_async(primario) as db:
+            try:
+                pagina = await ServicioVisitasAsync(db, schema).listar_visitas(filtros, cursor=cursor, limite=limite)
+            except ValidationError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            return respuesta_visitas(pagina.items, pagina.siguiente_cursor)
+
+    params = {**filtros.model_dump(mode="json"), "limite": limite, "cursor": cursor}
+    return await con_cache_async("visitas", schema, ESPACIO_VISITAS, params, producir)
+
+
+@router.get("/exportar")
+async def exportar_visitas(
+    entidad: Literal["visitas", "detalles"] = Query(default="visitas"),
+    formato: Literal["ndjson", "csv"] = Query(default="ndjson"),
+    schema: str = Depends(get_schema),
+):
+    # Declarada antes de /{id_visita} para que "exportar" no se tome como id
+    return respuesta_exportacion(exportar_async(schema, entidad, formato), entidad, formato, schema)
+
+
+@router.post("/{id_visita}/detalle", response_model=DetalleVisitaSalida)
+async def agregar_detalle(
+    id_visita: str,
+    id_cliente: str = Form(...),
+    atendido_por: str | None = Form(None),
+    hallazgos: str | None = Form(None),
+    sugerencias_producto: str | None = Form(None),
+    foto: UploadFile | None = File(None),
+    schema: str = Depends(get_schema),
+    db: AsyncSession = Depends(get_async_session),
+):
+    payload = DetalleVisitaCrear(
+        id_cliente=id_cliente,
+        atendido_por=atendido_por,
+        hallazgos=hallazgos,
+        sugerencias_producto=sugerencias_producto,
+    )
+
+    contenido = await foto.read() if foto else None
+    try:
+        return await ServicioVisitasAsync(db, schema).agregar_detalle(
+            id_visita,
+            payload,
+            foto_bytes=contenido,
+            nombre_archivo=foto.filename if foto else None,
+            content_type=foto.content_type if foto else None,
+        )
+    except IntegrityError:
+        raise HTTPException(status_code=400, detail="Ya existe un detalle para esa visita")
+    except NotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.get("/{id_visita}", response_model=VisitaConDetalleSalida)
+async def obtener_visita(
+    id_visita: str,
+    response: Response,
+    incluir_foto_ios: bool = True,
+    schema: str = Depends(get_schema),
+    if_none_match: str | None = Header(default=None, alias=HEADER_IF_NONE_MATCH),
+    db: AsyncSession = Depends(get_async_read_session),
+):
+    svc = ServicioVisitasAsync(db, schema)
+    try:
+        etag = await svc.etag_visita(id_visita, incluir_foto_ios)
+        if coincide_etag(if_none_match, etag):
+            return respuesta_no_modificada(etag)
+        visita, detalle, foto_ios = await svc.obtener_visita_con_detalle(id_visita, incluir_foto=incluir_foto_ios)
+    except NotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    # si la foto se pidió pero no se pudo descargar la respuesta es parcial: sin ETag,
+    # para que un 304 posterior no la dé por buena cuando GCS vuelva a responder
+    if not (incluir_foto_ios and detalle and detalle.url_foto and foto_ios is None):
+        response.headers[HEADER_ETAG] = etag
+
+    return VisitaConDetalleSalida(
+        id=visita.id,
+        id_vendedor=visita.id_vendedor,
+        id_cliente=visita.id_cliente,
+        direccion=visita.direccion,
+        ciudad=visita.ciudad,
+        contacto=visita.contacto,
+        fecha=visita.fecha,
+        estado=visita.estado,
+        detalle=DetalleVisitaSalida.model_validate(detalle) if detalle else None,
+        foto_ios=foto_ios if incluir_foto_ios else None,
+    )
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+from array import array
+from collections import defaultdict
+from decimal import Decimal
+from typing import Any, Iterable
+
+
+def _fijo(v) -> tuple[int, int]:
+    """
+    (mantisa, decimales) exactos del número que daría Decimal(str(v)), sin crear
+    el Decimal: "12.50" → (1250, 2). Notación científica y otras formas raras
+    van por Decimal (camino lento, mismo resultado).
+    """
+    if v is None:
+        return 0, 0
+    tipo = type(v)
+    if tipo is int:
+        return v, 0
+    ent, _, frac = (v if tipo is str else str(v)).partition(".")
+    if not frac or frac.isdigit():
+        try:
+            return int(ent + frac), len(frac)
+        except ValueError:
+            pass
+    neg, cifras, exp = Decimal(str(v).strip()).as_tuple()
+    mantisa = int("".join(map(str, cifras)) or "0") * (-1 if neg else 1)
+    return (mantisa * 10 ** exp, 0) if exp >= 0 else (mantisa, -exp)
+
+
+def _alinear(valores: list[tuple[int, int]]) -> tuple[list[int], int]:
+    """Lleva una columna de (mantisa, decimales) a la misma escala (la mayor)."""
+    escala = max((k for _, k in valores), default=0)
+    return [m if k == escala else m * 10 ** (escala - k) for m, k in valores], escala
+
+
+class ColumnasPedidos:
+    """
+    Motor de agregación del progreso sobre un lote de pedidos.
+    Los ítems se cargan en columnas paralelas (pedido, cantidad, total de línea)
+    y el total de cada línea se calcula una sola vez en punto fijo entero:
+
+        precio * cantidad * (100 - descuento_pct) * (100 + impuesto_pct)
+
+    con cada columna escalada a sus decimales máximos. La suma es exacta: igual
+    al Decimal del recorrido ítem por ítem, y por lo tanto al centavo al guardarla
+    en Numeric(14, 2). Un índice por (vendedor, producto) agrupa por plan sin
+    volver a recorrer los pedidos.
+    `vendedores` / `productos` descartan al cargar lo que ningún plan va a leer.
+    """
+
+    def __init__(
+        self,
+        pedidos: Iterable[dict],
+        *,
+        vendedores: set[str] | None = None,
+        productos: set[str] | None = None,
+    ):
+        # por pedido cargado
+        self.ids: list = []
+        self.versiones: list = []
+        self.clientes: list = []
+        self._clientes_str: list[str] = []
+        # por ítem
+        self.pedido = array("l")
+        self.cantidad: list[int] = []
+        self.total: list[int] = []
+        self.escala = 0
+        self._por_vendedor_producto: dict[tuple[str, str], list[int]] = defaultdict(list)
+
+        # precios y porcentajes se repiten mucho entre ítems: se parsean una vez
+        fijos: dict = {}
+        precios: list[tuple[int, int]] = []
+        descuentos: list[tuple[int, int]] = []
+        impuestos: list[tuple[int, int]] = []
+        indice = self._por_vendedor_producto
+        for p in pedidos:
+            vendedor = str(p.get("vendedor_id"))
+            if vendedores is not None and vendedor not in vendedores:
+                continue
+            n = len(self.clientes)
+            cargado = False
+            for item in p.get("items", []):
+                producto = str(item.get("producto_id"))
+                if productos is not None and producto not in productos:
+                    continue
+                pu, dsc, imp = item.get("precio_unitario"), item.get("descuento_pct"), item.get("impuesto_pct")
+                precios.append(fijos[pu] if pu in fijos else fijos.setdefault(pu, _fijo(pu)))
+                descuentos.append(fijos[dsc] if dsc in fijos else fijos.setdefault(dsc, _fijo(dsc)))
+                impuestos.append(fijos[imp] if imp in fijos else fijos.setdefault(imp, _fijo(imp)))
+                indice[(vendedor, producto)].append(len(self.cantidad))
+                self.pedido.append(n)
+                self.cantidad.append(int(item.get("cantidad", 0)))
+                cargado = True
+            if cargado:
+                self.ids.append(p.get("id"))
+                self.versiones.append(p.get("actualizado_en"))
+                self.clientes.append(p.get("cliente_id"))
+                self._clientes_str.append(str(p.get("cliente_id")))
+
+        precio, ep = _alinear(precios)
+        descuento, ed = _alinear(descuentos)
+        impuesto, ei = _alinear(impuestos)
+        cien_d = 100 * 10 ** ed
+        cien_i = 100 * 10 ** ei
+        self.total = [
+            pu * cant * (cien_d - dsc) * (cien_i + imp)
+            for pu, cant, dsc, imp in zip(precio, self.cantidad, descuento, impuesto)
+        ]
+        # decimales del total: los de cada factor + 2 por cada porcentaje
+        self.escala = ep + ed + ei + 4
+
+    def _decimal(self, monto: int) -> Decimal:
+        # el constructor desde str es exacto (scaleb redondearía al contexto)
+        return Decimal(f"{monto}E-{self.escala}")
+
+    def _por_pedido(
+        self, id_vendedor: str, cliente_obj: str | None, productos_set: set[str]
+    ) -> dict[int, tuple[int, int]]:
+        """{pedido: (monto en punto fijo, unidades)} de los pedidos que cuentan para el plan."""
+        unidades_por_pedido: dict[int, int] = defaultdict(int)
+        monto_por_pedido: dict[int, int] = defaultdict(int)
+        for pid in productos_set:
+            for i in self._por_vendedor_producto.get((id_vendedor, pid), ()):
+                n = self.pedido[i]
+                if cliente_obj and self._clientes_str[n] != cliente_obj:
+                    continue
+                unidades_por_pedido[n] += self.cantidad[i]
+                monto_por_pedido[n] += self.total[i]
+        return {n: (monto_por_pedido[n], u) for n, u in unidades_por_pedido.items() if u > 0}
+
+    def agregar(
+        self, id_vendedor: str, cliente_obj: str | None, productos_set: set[str]
+    ) -> tuple[Decimal, int, int, int]:
+        """(monto, unidades, clientes, pedidos_contados) de un plan, como calcular_progreso."""
+        por_pedido = self._por_pedido(id_vendedor, cliente_obj, productos_set)
+        monto = sum(m for m, _ in por_pedido.values())
+        unidades = sum(u for _, u in por_pedido.values())
+        clientes = {self.clientes[n] for n in por_pedido}
+        return self._decimal(monto), unidades, len(clientes), len(por_pedido)
+
+    def aportes(
+        self, id_vendedor: str, cliente_obj: str | None, productos_set: set[str]
+    ) -> list[tuple[Any, Any, Decimal, int, Any]]:
+        """(id_pedido, cliente_id, monto, unidades, actualizado_en) de cada pedido que cuenta para el plan."""
+        return [
+            (self.ids[n], self.clientes[n], self._decimal(m), u, self.versiones[n])
+            for n, (m, u) in self._por_pedido(id_vendedor, cliente_obj, productos_set).items()
+        ]
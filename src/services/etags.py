@@ -0,0 +1,27 @@
+from __future__ import annotations
+
+import hashlib
+from typing import Any
+
+HEADER_ETAG = "ETag"
+HEADER_IF_NONE_MATCH = "If-None-Match"
+
+# Sube si cambia la forma de las respuestas: invalida los ETags que tengan los clientes
+_VERSION_REPRESENTACION = "1"
+
+
+def calcular_etag(*partes: Any) -> str:
+    """
+    ETag fuerte a partir de la versión del recurso (actualizado_en, ids, flags de
+    la representación), no del cuerpo: se calcula sin serializar ni descargar la foto.
+    """
+    texto = "|".join([_VERSION_REPRESENTACION, *("" if p is None else str(p) for p in partes)])
+    return '"' + hashlib.sha256(texto.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def coincide_etag(if_none_match: str | None, etag: str) -> bool:
+    """If-None-Match: lista de ETags separados por coma o "*"; compara ignorando W/ (RFC 9110)."""
+    if not if_none_match:
+        return False
+    candidatos = [c.strip() for c in if_none_match.split(",")]
+    return "*" in candidatos or any(c.removeprefix("W/") == etag for c in candidatos)
@@ -0,0 +1,429 @@
+from __future__ import annotations
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Callable
+
+from src.config import settings
+from src.errors import ValidationError
+from src.infrastructure.coalescencia import clave_recalculo, get_coalescedor
+from src.infrastructure.deduplicacion import RegistroDeduplicacion, get_registro_deduplicacion
+from src.infrastructure.infrastructure import session_for_schema
+from src.infrastructure.metricas import get_metricas
+from src.services.servicio_plan_ventas import ServicioPlanDeVentas
+from src.services.servicio_recalculo_lote import ServicioRecalculoLote
+from src.services.servicio_progreso_incremental import EVENTOS_PEDIDO, ServicioProgresoIncremental
+
+
+log = logging.getLogger(__name__)
+_metricas = get_metricas("pubsub")
+
+
+@dataclass(frozen=True)
+class Handler:
+    """
+    Handler síncrono de un tipo de evento (sesión SQLAlchemy + MsClient
+    bloqueantes): se ejecuta en el threadpool. `max_concurrencia`: eventos de
+    este tipo en curso a la vez.
+    """
+
+    tipo: str
+    funcion: Callable[[str, dict, str, str], Any]
+    max_concurrencia: int | None = None
+
+
+_HANDLERS: dict[str, Handler] = {}
+
+
+def registrar_handler(*tipos: str, max_concurrencia: int | None = None):
+    """Decorador: registra la función como handler de `tipos` (event_type, event, country, log_prefix)."""
+
+    def decorar(funcion):
+        for tipo in tipos:
+            _HANDLERS[tipo] = Handler(tipo, funcion, max_concurrencia)
+        return funcion
+
+    return decorar
+
+
+def _fecha_evento(event: dict, campo: str) -> date:
+    valor = event.get(campo)
+    try:
+        return date.fromisoformat(valor)
+    except Exception:
+        raise ValueError(f"Fecha inválida en evento recalcular_plan_ventas: {campo}={valor!r}")
+
+
+# =====================================================================
+# Recálculo de un plan de ventas (un día o backfill de un rango)
+# =====================================================================
+@registrar_handler("recalcular_plan_ventas", max_concurrencia=4)
+def _recalcular_plan(event_type: str, event: dict, country: str, log_prefix: str) -> None:
+    plan_id = event.get("plan_id")
+    if not plan_id:
+        raise ValueError("plan_id es obligatorio en recalcular_plan_ventas")
+
+    if event.get("desde") or event.get("hasta"):
+        desde = _fecha_evento(event, "desde")
+        hasta = _fecha_evento(event, "hasta")
+        log.info(
+            "%s Iniciando backfill de plan de ventas. plan_id=%s desde=%s hasta=%s",
+            log_prefix,
+            plan_id,
+            desde,
+            hasta,
+        )
+        with session_for_schema(country) as session:
+            svc = ServicioPlanDeVentas(session, country)
+            plan = svc.obtener(plan_id)
+            if not plan:
+                raise ValueError(f"Plan de ventas no encontrado. id={plan_id}")
+
+            res = svc.recalcular_rango(plan, desde, hasta)
+
+            log.info(
+                "%s Backfill completado. plan_id=%s desde=%s hasta=%s filas=%s pedidos=%s paginas=%s duracion_ms=%s",
+                log_prefix,
+                plan_id,
+                desde,
+                hasta,
+                res.filas_escritas,
+                res.pedidos_leidos,
+                res.paginas,
+                res.duracion_ms,
+            )
+    else:
+        fecha_str = event.get("fecha")
+        try:
+            fecha = date.fromisoformat(fecha_str) if fecha_str else date.today()
+        except Exception:
+            raise ValueError(f"Fecha inválida en evento recalcular_plan_ventas: {fecha_str!r}")
+
+        log.info(
+            "%s Iniciando recálculo de plan de ventas. plan_id=%s fecha=%s",
+            log_prefix,
+            plan_id,
+            fecha,
+        )
+
+        # Abrimos sesión con el schema adecuado y llamamos al servicio
+        with session_for_schema(country) as session:
+            svc = ServicioPlanDeVentas(session, country)
+            plan = svc.obtener(plan_id)
+            if not plan:
+                raise ValueError(f"Plan de ventas no encontrado. id={plan_id}")
+
+            prog = svc.recalcular_para_fecha(plan, fecha)
+
+            log.info(
+                "%s Recalculo completado. plan_id=%s fecha=%s monto=%s unidades=%s clientes=%s pedidos=%s lectura=%s",
+                log_prefix,
+                plan_id,
+                fecha,
+                prog.monto_actual,
+                prog.unidades_actuales,
+                prog.clientes_actuales,
+                prog.pedidos_contados,
+                svc.ultima_lectura,
+            )
+
+
+# =====================================================================
+# Recálculo de todos los planes activos de un día (una descarga por país)
+# =====================================================================
+@registrar_handler("recalcular_planes_del_dia", max_concurrencia=2)
+def _recalcular_planes_del_dia(event_type: str, event: dict, country: str, log_prefix: str) -> None:
+    fecha_str = event.get("fecha")
+    fecha = _fecha_evento(event, "fecha") if fecha_str else date.today()
+
+    with session_for_schema(country) as session:
+        res = ServicioRecalculoLote(session, country).recalcular_fecha(fecha)
+
+    log.info(
+        "%s Recalculo por lote completado. fecha=%s planes=%s filas=%s pedidos=%s paginas=%s duracion_ms=%s",
+        log_prefix,
+        fecha,
+        res.planes,
+        res.filas_escritas,
+        res.pedidos_leidos,
+        res.paginas,
+        res.duracion_ms,
+    )
+
+
+# =====================================================================
+# Eventos de pedidos: deltas sobre el progreso, sin leer ms-pedidos
+# =====================================================================
+@registrar_handler(*EVENTOS_PEDIDO, max_concurrencia=8)
+def _evento_pedido(event_type: str, event: dict, country: str, log_prefix: str) -> None:
+    pedido = event.get("pedido") or {}
+    if pedido.get("id") is None and event.get("pedido_id"):
+        pedido = {**pedido, "id": event["pedido_id"]}
+
+    with session_for_schema(country) as session:
+        res = ServicioProgresoIncremental(session).aplicar(event_type, pedido)
+
+    log.info(
+        "%s Evento de pedido aplicado. pedido_id=%s planes=%s filas=%s descartado=%s",
+        log_prefix,
+        res.id_pedido,
+        res.planes,
+        res.filas_ajustadas,
+        res.descartado,
+    )
+
+
+def procesar_evento(
+    event_type: str, event: dict, country: str, log_prefix: str, handler: Handler | None = None
+) -> None:
+    """
+    Ejecuta el handler (por defecto, el registrado para `event_type`) en el hilo
+    actual, sin límite de concurrencia: eso lo pone el Despachador. Tipos sin
+    handler se ignoran.
+    """
+    handler = handler or _HANDLERS.get(event_type)
+    if handler is None:
+        log.info("%s Evento %s ignorado (no hay handler definido)", log_prefix, event_type)
+        return
+    handler.funcion(event_type, event, country, log_prefix)
+
+
+def _reclamar(
+    registro: RegistroDeduplicacion | None,
+    message_id: str | None,
+    clave: str | None,
+    event_type: str,
+    log_prefix: str,
+) -> list[str] | None:
+    """
+    Marcas de de-duplicación reclamadas; None si el mensaje o el evento ya se vieron.
+    `clave` (lógica) llega None cuando el coalescedor se encarga del recálculo.
+    """
+    reclamadas: list[str] = []
+    if registro is None:
+        return reclamadas
+    claves = (
+        ("message_id", f"msg:{message_id}" if message_id else None, settings.PUBSUB_DEDUP_VENTANA),
+        ("clave_logica", f"evt:{clave}" if clave else None, settings.PUBSUB_DEDUP_VENTANA_LOGICA),
+    )
+    for tipo, marca, ventana in claves:
+        if marca is None:
+            continue
+        if not registro.reclamar(marca, ventana):
+            _metricas.incrementar("duplicados", tipo)
+            log.info("%s Evento %s duplicado por %s (%s): se omite", log_prefix, event_type, tipo, marca)
+            return None
+        reclamadas.append(marca)
+    return reclamadas
+
+
+def _liberar(registro: RegistroDeduplicacion | None, reclamadas: list[str]) -> None:
+    for marca in reclamadas:
+        registro.liberar(marca)
+
+
+def procesar_mensaje(
+    message_id: str | None,
+    event_type: str,
+    event: dict,
+    country: str,
+    log_prefix: str,
+    handler: Handler | None = None,
+) -> None:
+    """
+    procesar_evento salvo que el mensaje (messageId) o el evento (clave lógica)
+    ya se hayan visto dentro de su ventana. Si el procesamiento falla, las
+    marcas se liberan para que una nueva entrega pueda reintentar.
+    Los recálculos pasan además por el coalescedor: uno en vuelo por clave. Con
+    coalescedor no se de-duplica por clave lógica: un pedido repetido mientras
+    hay uno en vuelo debe marcar la clave como sucia (provoca otra pasada), y
+    uno que llega después de terminar debe recalcular (pudo haber pedidos nuevos).
+    """
+    clave = clave_recalculo(event_type, event, country)
+    coalescedor = get_coalescedor() if clave else None
+    registro = get_registro_deduplicacion()
+    reclamadas = _reclamar(
+        registro, message_id, clave if coalescedor is None else None, event_type, log_prefix
+    )
+    if reclamadas is None:
+        return
+
+    try:
+        if coalescedor is None:
+            procesar_evento(event_type, event, country, log_prefix, handler)
+        elif not coalescedor.ejecutar(clave, lambda: procesar_evento(event_type, event, country, log_prefix, handler)):
+            log.info("%s Recálculo %s ya en curso: se repetirá al terminar", log_prefix, clave)
+            return
+    except Exception:
+        _liberar(registro, reclamadas)
+        raise
+    _metricas.incrementar("procesados", event_type)
+
+
+def decodificar_evento(datos: bytes | str) -> dict:
+    """JSON del mensaje; ValueError si no es un objeto JSON."""
+    event = json.loads(datos)
+    if not isinstance(event, dict):
+        raise ValueError("el evento no es un objeto JSON")
+    return event
+
+
+def _limites_configurados() -> dict[str, int]:
+    """EVENTOS_CONCURRENCIA="recalcular_plan_ventas=2,pedido_creado=16" → {tipo: n}."""
+    limites = {}
+    for par in settings.EVENTOS_CONCURRENCIA.split(","):
+        tipo, _, n = par.partition("=")
+        if tipo.strip() and n.strip():
+            limites[tipo.strip()] = max(1, int(n))
+    return limites
+
+
+class Despachador:
+    """
+    Despacho de eventos ya decodificados, común al handler push (/pubsub) y al
+    worker de streaming pull (src/worker.py):
+    - Cada tipo tiene su semáforo (max_concurrencia del handler, EVENTOS_CONCURRENCIA
+      o EVENTOS_CONCURRENCIA_DEFECTO) y su propio ThreadPoolExecutor del mismo
+      tamaño: una ráfaga de recalcular_plan_ventas espera su turno sin ocupar los
+      hilos que necesitan los eventos de pedido (el executor por defecto del loop,
+      el de asyncio.to_thread, es compartido y en una instancia de 1 vCPU tiene 5).
+    - Los handlers síncronos corren en esos hilos; el event loop nunca se bloquea.
+    - Métricas por tipo en el grupo "pubsub": duracion_ms, espera_ms (en cola por
+      el semáforo), errores y errores_negocio.
+    Los semáforos son por event loop (el de uvicorn, el del worker, los de pruebas).
+    """
+
+    def __init__(self, handlers: dict[str, Handler] | None = None):
+        self.handlers = _HANDLERS if handlers is None else handlers
+        self._limites = _limites_configurados()
+        self._semaforos: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._executors: dict[str, ThreadPoolExecutor] = {}
+        self._en_curso: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def limite(self, tipo: str) -> int:
+        handler = self.handlers.get(tipo)
+        return (
+            self._limites.get(tipo)
+            or (handler.max_concurrencia if handler is not None else None)
+            or settings.EVENTOS_CONCURRENCIA_DEFECTO
+        )
+
+    def _semaforo(self, tipo: str) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            por_tipo = self._semaforos.setdefault(loop, {})
+            if tipo not in por_tipo:
+                por_tipo[tipo] = asyncio.Semaphore(self.limite(tipo))
+            return por_tipo[tipo]
+
+    def _executor(self, tipo: str) -> ThreadPoolExecutor:
+        with self._lock:
+            if tipo not in self._executors:
+                self._executors[tipo] = ThreadPoolExecutor(
+                    max_workers=self.limite(tipo), thread_name_prefix=f"evento-{tipo}"
+                )
+            return self._executors[tipo]
+
+    def cerrar(self) -> None:
+        """Apaga los executors (espera a los handlers en curso)."""
+        with self._lock:
+            executors, self._executors = list(self._executors.values()), {}
+        for ex in executors:
+            ex.shutdown(wait=True)
+
+    def _sumar_en_curso(self, tipo: str, n: int) -> None:
+        with self._lock:
+            self._en_curso[tipo] = self._en_curso.get(tipo, 0) + n
+
+    def estado(self) -> dict:
+        with self._lock:
+            en_curso = dict(self._en_curso)
+        return {
+            tipo: {
+                "max_concurrencia": self.limite(tipo),
+                "en_curso": en_curso.get(tipo, 0),
+            }
+            for tipo in self.handlers
+        }
+
+    async def despachar(self, event: dict, message_id: str | None, origen: str) -> None:
+        """
+        Procesa el evento sin propagar errores: los de negocio y los inesperados
+        se registran en logs y el mensaje se da por atendido (204 en push, ack
+        en pull) para evitar reintentos infinitos.
+        """
+        log_prefix = f"[{origen}]"
+        event_type = event.get("event")
+        if not event_type:
+            log.warning("%s Evento sin campo 'event': %s", log_prefix, event)
+            return
+
+        ctx = event.get("ctx") or {}
+        trace_id = ctx.get("trace_id")
+        country = ctx.get("country") or settings.DEFAULT_SCHEMA
+
+        if trace_id:
+            log_prefix = f"[{origen} trace_id={trace_id}]"
+
+        log.info("%s Evento recibido: %s (country=%s)", log_prefix, event_type, country)
+
+        handler = self.handlers.get(event_type)
+        if handler is None:
+            _metricas.incrementar("ignorados", event_type)
+            log.info("%s Evento %s ignorado (no hay handler definido)", log_prefix, event_type)
+            return
+
+        llegada = time.perf_counter()
+        async with self._semaforo(event_type):
+            inicio = time.perf_counter()
+            _metricas.observar("espera_ms", (inicio - llegada) * 1000, event_type)
+            self._sumar_en_curso(event_type, 1)
+            try:
+                # como asyncio.to_thread: el handler ve el contexto (contextvars) del despacho
+                llamada = functools.partial(
+                    contextvars.copy_context().run,
+                    procesar_mensaje, message_id, event_type, event, country, log_prefix, handler,
+                )
+                await asyncio.get_running_loop().run_in_executor(self._executor(event_type), llamada)
+
+            except (ValueError, ValidationError) as e:
+                # Error de negocio (incluye país no soportado) → NO reintentar
+                _metricas.incrementar("errores_negocio", event_type)
+                log.warning("%s Error de negocio en %s: %s", log_prefix, event_type, e)
+
+            except Exception as e:
+                # Error inesperado → igual se da por atendido para evitar loops infinitos
+                _metricas.incrementar("errores", event_type)
+                log.error("%s Error procesando %s: %s", log_prefix, event_type, e)
+
+            finally:
+                self._sumar_en_curso(event_type, -1)
+                _metricas.observar("duracion_ms", (time.perf_counter() - inicio) * 1000, event_type)
+
+
+_despachador: Despachador | None = None
+_despachador_lock = threading.Lock()
+
+
+def get_despachador() -> Despachador:
+    global _despachador
+    if _despachador is None:
+        with _despachador_lock:
+            if _despachador is None:
+                _despachador = Despachador()
+    return _despachador
+
+
+def cerrar_despachador() -> None:
+    """Al apagar (lifespan / worker): espera a los handlers en curso y libera sus hilos."""
+    if _despachador is not None:
+        _despachador.cerrar()
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import csv
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import AsyncIterator, Iterable, Iterator
+
+from sqlalchemy import Select, select
+
+from src.domain import models
+from src.infrastructure.infrastructure import session_for_schema, async_session_for_schema
+
+# Filas por lote leídas del cursor de servidor (yield_per) y escritas por chunk
+TAMANO_LOTE = 1000
+
+ENTIDADES = {
+    "planes": models.PlanDeVentas,
+    "progreso": models.ProgresoPlanDeVentas,
+    "visitas": models.Visita,
+    "detalles": models.DetalleVisita,
+}
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def columnas(entidad: str) -> list[str]:
+    return [c.name for c in ENTIDADES[entidad].__table__.columns]
+
+
+def stmt_exportacion(entidad: str) -> Select:
+    modelo = ENTIDADES[entidad]
+    tabla = modelo.__table__
+    return (
+        select(*tabla.columns)
+        .order_by(*tabla.primary_key.columns)
+        .execution_options(yield_per=TAMANO_LOTE)
+    )
+
+
+def _valor(v):
+    if isinstance(v, (date, datetime)):
+        return v.isoformat()
+    if isinstance(v, Decimal):
+        return str(v)
+    return v
+
+
+def _lote_ndjson(nombres: list[str], filas: Iterable) -> bytes:
+    lineas = (
+        json.dumps({n: _valor(v) for n, v in zip(nombres, fila)}, ensure_ascii=False)
+        for fila in filas
+    )
+    return ("\n".join(lineas) + "\n").encode("utf-8")
+
+
+def _lote_csv(filas: Iterable) -> bytes:
+    buf = io.StringIO()
+    csv.writer(buf).writerows([_valor(v) for v in fila] for fila in filas)
+    return buf.getvalue().encode("utf-8")
+
+
+def _encabezado_csv(nombres: list[str]) -> bytes:
+    buf = io.StringIO()
+    csv.writer(buf).writerow(nombres)
+    return buf.getvalue().encode("utf-8")
+
+
+def _codificar(formato: str, nombres: list[str], lote) -> bytes:
+    return _lote_ndjson(nombres, lote) if formato == "ndjson" else _lote_csv(lote)
+
+
+def exportar(schema: str, entidad: str, formato: str) -> Iterator[bytes]:
+    """
+    Genera el export por lotes con un cursor de servidor: memoria constante sin
+    importar el número de filas. La sesión se abre dentro del generador porque
+    debe vivir mientras StreamingResponse consume el stream.
+    """
+    nombres = columnas(entidad)
+    if formato == "csv":
+        yield _encabezado_csv(nombres)
+    with session_for_schema(schema, solo_lectura=True) as session:
+        resultado = session.execute(stmt_exportacion(entidad))
+        for lote in resultado.partitions():
+            yield _codificar(formato, nombres, lote)
+
+
+async def exportar_async(schema: str, entidad: str, formato: str) -> AsyncIterator[bytes]:
+    """Versión async de exportar (AsyncSession.stream sobre asyncpg)."""
+    nombres = columnas(entidad)
+    if formato == "csv":
+        yield _encabezado_csv(nombres)
+    async with async_session_for_schema(schema, solo_lectura=True) as session:
+        resultado = await session.stream(stmt_exportacion(entidad))
+        async for lote in resultado.partitions():
+            yield _codificar(formato, nombres, lote)
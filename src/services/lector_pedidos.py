@@ -0,0 +1,121 @@
+from __future__ import annotations
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterator
+from src.config import settings
+from src.infrastructure.cache import get_cache_pedidos
+from src.infrastructure.http import MsClient
+from src.infrastructure.metricas import get_metricas
+
+_metricas = get_metricas("pedidos")
+
+
+class LectorPedidos:
+    """
+    Lee /v1/pedidos completo con limit/offset. La primera página va sola (la
+    mayoría de los días cabe en una); si llega llena, el resto se pide en paralelo
+    con a lo sumo `paralelismo` páginas en vuelo, hasta recibir una página corta.
+    Los pedidos se entregan a medida que llegan las páginas, sin orden garantizado.
+    Con caché (CachePedidos) la lista completa se sirve desde Redis y solo un
+    lector por clave va a ms-pedidos en un miss.
+    """
+
+    def __init__(
+        self,
+        client: MsClient,
+        *,
+        tamano_pagina: int | None = None,
+        paralelismo: int | None = None,
+    ):
+        self.client = client
+        self.tamano_pagina = tamano_pagina or settings.PEDIDOS_TAMANO_PAGINA
+        self.paralelismo = max(1, paralelismo or settings.PEDIDOS_PARALELISMO)
+        self.paginas = 0
+        self.pedidos = 0
+        self.duracion_ms = 0.0
+        self.desde_cache = False
+
+    def _pagina(self, params: dict, offset: int) -> list[dict]:
+        inicio = time.perf_counter()
+        pagina = self.client.get("/v1/pedidos", params={**params, "limit": self.tamano_pagina, "offset": offset}) or []
+        _metricas.observar("pagina_ms", (time.perf_counter() - inicio) * 1000)
+        return pagina
+
+    def _contar(self, pagina: list[dict]) -> list[dict]:
+        self.paginas += 1
+        self.pedidos += len(pagina)
+        return pagina
+
+    def leer(self, params: dict) -> Iterator[dict]:
+        inicio = time.perf_counter()
+        try:
+            cache = get_cache_pedidos()
+            if cache is None:
+                yield from self._leer_origen(params)
+                return
+
+            clave = cache.clave(self.client.pais, params)
+            pedidos = cache.leer(clave)
+            if pedidos is None:
+                token = cache.tomar_lock(clave)
+                if token is None:
+                    # otro lector está cargando la misma clave
+                    pedidos = cache.esperar(clave)
+                if pedidos is None:
+                    recolectados = []
+                    try:
+                        for p in self._leer_origen(params):
+                            recolectados.append(p)
+                            yield p
+                        cache.guardar(clave, recolectados, cache.ttl(params))
+                    finally:
+                        cache.soltar_lock(clave, token)
+                    return
+
+            self.desde_cache = True
+            self.pedidos += len(pedidos)
+            yield from pedidos
+        finally:
+            self.duracion_ms = round((time.perf_counter() - inicio) * 1000, 1)
+            _metricas.incrementar("lecturas")
+            _metricas.incrementar("paginas", n=self.paginas)
+            _metricas.observar("lectura_ms", self.duracion_ms)
+
+    def _leer_origen(self, params: dict) -> Iterator[dict]:
+        primera = self._contar(self._pagina(params, 0))
+        yield from primera
+        if len(primera) >= self.tamano_pagina:
+            yield from self._leer_resto(params)
+
+    def _leer_resto(self, params: dict) -> Iterator[dict]:
+        ex = ThreadPoolExecutor(max_workers=self.paralelismo, thread_name_prefix="pedidos")
+        siguiente = self.tamano_pagina
+        completo = False
+        try:
+            pendientes = set()
+            for _ in range(self.paralelismo):
+                pendientes.add(ex.submit(self._pagina, params, siguiente))
+                siguiente += self.tamano_pagina
+
+            while pendientes:
+                hechos, pendientes = wait(pendientes, return_when=FIRST_COMPLETED)
+                for fut in hechos:
+                    pagina = self._contar(fut.result())
+                    if len(pagina) < self.tamano_pagina:
+                        # página corta: no hay más allá de este offset
+                        completo = True
+                    elif not completo:
+                        pendientes.add(ex.submit(self._pagina, params, siguiente))
+                        siguiente += self.tamano_pagina
+                    yield from pagina
+        finally:
+            ex.shutdown(wait=True, cancel_futures=True)
+
+    def estadisticas(self) -> dict:
+        return {
+            "paginas": self.paginas,
+            "pedidos": self.pedidos,
+            "duracion_ms": self.duracion_ms,
+            "desde_cache": self.desde_cache,
+        }
+
@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import base64
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import Select, and_, or_
+
+from src.errors import ValidationError
+
+LIMITE_POR_DEFECTO = 100
+LIMITE_MAXIMO = 500
+HEADER_SIGUIENTE_CURSOR = "X-Next-Cursor"
+
+
+@dataclass
+class Pagina:
+    items: list[Any] = field(default_factory=list)
+    siguiente_cursor: str | None = None
+
+
+def codificar_cursor(creado_en: datetime, id_: str) -> str:
+    raw = json.dumps([creado_en.isoformat(), id_]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decodificar_cursor(cursor: str) -> tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        creado_en, id_ = json.loads(raw)
+        return datetime.fromisoformat(creado_en), str(id_)
+    except Exception:
+        raise ValidationError("Cursor de paginación inválido")
+
+
+def aplicar_keyset(stmt: Select, modelo, cursor: str | None, limite: int) -> Select:
+    """
+    Paginación keyset sobre (creado_en, id), del más reciente al más antiguo.
+    Pide limite + 1 filas para saber si hay página siguiente sin un COUNT.
+    """
+    if cursor:
+        creado_en, id_ = decodificar_cursor(cursor)
+        stmt = stmt.where(
+            or_(
+                modelo.creado_en < creado_en,
+                and_(modelo.creado_en == creado_en, modelo.id < id_),
+            )
+        )
+    return stmt.order_by(modelo.creado_en.desc(), modelo.id.desc()).limit(limite + 1)
+
+
+def armar_pagina(filas: list, limite: int) -> Pagina:
+    if len(filas) <= limite:
+        return Pagina(items=list(filas))
+    ultima = filas[limite - 1]
+    return Pagina(items=list(filas[:limite]), siguiente_cursor=codificar_cursor(ultima.creado_en, ultima.id))
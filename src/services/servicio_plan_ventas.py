@@ -1,24 +1,480 @@
 from __future__ import annotations
+import logging
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Iterable
 from uuid import uuid4
-from datetime import date
-from sqlalchemy import select
+from datetime import date, datetime, timedelta, timezone
+from sqlalchemy import Delete, Insert, Select, delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
 from src.domain import models
-from src.domain.schemas import PlanDeVentasCrear
+from src.domain.schemas import PlanDeVentasCrear, FiltrosPlanes
+from src.services.paginacion import Pagina, LIMITE_POR_DEFECTO, aplicar_keyset, armar_pagina
+from src.infrastructure.cache import invalidar_respuestas
 from src.infrastructure.http import MsClient
+from src.infrastructure.metricas import get_metricas
+from src.services.lector_pedidos import LectorPedidos
+from src.services.agregacion import ColumnasPedidos
+from src.services.etags import calcular_etag
+from src.errors import ValidationError
 from decimal import Decimal
 
-_MAX_LIMIT = 200
+# Tope de días por backfill: acota el volumen pedido a ms-pedidos y el tamaño del upsert
+MAX_DIAS_BACKFILL = 366
 
+# Filas por sentencia de los upserts masivos (≈7 parámetros por fila)
+FILAS_POR_UPSERT = 1000
 
-def _dec(v, d="0"):
-    return Decimal(str(v if v is not None else d))
+log = logging.getLogger(__name__)
+_metricas = get_metricas("recalculo")
+
+# Espacios de la caché de respuestas que invalida crear un plan
+ESPACIO_PLANES = "planes"
+
+
+def espacio_planes_vendedor(id_vendedor: str) -> str:
+    return f"planes:vendedor:{id_vendedor}"
+
+
+def calcular_progreso(
+    pedidos: Iterable[dict],
+    *,
+    id_vendedor: str,
+    cliente_obj: str | None,
+    productos_set: set[str],
+) -> tuple[Decimal, int, int, int]:
+    """
+    Agrega los pedidos de un día para un plan.
+    Retorna (monto, unidades, clientes, pedidos_contados). Compartido por la
+    versión sync y async del servicio. Solo carga en ColumnasPedidos los ítems
+    del vendedor y productos del plan.
+    """
+    columnas = ColumnasPedidos(pedidos, vendedores={id_vendedor}, productos=productos_set)
+    return columnas.agregar(id_vendedor, cliente_obj, productos_set)
+
+
+def calcular_progreso_y_aportes(
+    pedidos: Iterable[dict],
+    d: date,
+    *,
+    id_plan: str,
+    id_vendedor: str,
+    cliente_obj: str | None,
+    productos_set: set[str],
+) -> tuple[tuple[Decimal, int, int, int], list[dict]]:
+    """calcular_progreso más las filas de AporteProgreso del plan en el día (misma carga de columnas)."""
+    columnas = ColumnasPedidos(pedidos, vendedores={id_vendedor}, productos=productos_set)
+    return (
+        columnas.agregar(id_vendedor, cliente_obj, productos_set),
+        filas_aporte(id_plan, d, columnas.aportes(id_vendedor, cliente_obj, productos_set)),
+    )
+
+
+_INSERTS_CON_CONFLICTO = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+
+def _insert_con_conflicto(dialecto: str):
+    try:
+        return _INSERTS_CON_CONFLICTO[dialecto]
+    except KeyError:
+        raise RuntimeError(f"upsert de progreso no soportado para el dialecto {dialecto}")
+
+
+def stmt_upsert_progresos(dialecto: str, filas: list[dict]) -> Insert:
+    """
+    INSERT ... VALUES (...), (...) ON CONFLICT (id_plan, fecha) DO UPDATE: una
+    sola sentencia por lote, sin carrera entre entregas concurrentes del mismo plan/día.
+    """
+    insertar = _insert_con_conflicto(dialecto)
+    tabla = models.ProgresoPlanDeVentas.__table__
+    stmt = insertar(models.ProgresoPlanDeVentas).values(filas)
+    return stmt.on_conflict_do_update(
+        index_elements=[tabla.c.id_plan, tabla.c.fecha],
+        set_={
+            "monto_actual": stmt.excluded.monto_actual,
+            "unidades_actuales": stmt.excluded.unidades_actuales,
+            "clientes_actuales": stmt.excluded.clientes_actuales,
+            "pedidos_contados": stmt.excluded.pedidos_contados,
+            "actualizado_en": stmt.excluded.actualizado_en,
+        },
+    )
+
+
+def stmt_sumar_progresos(dialecto: str, filas: list[dict]) -> Insert:
+    """
+    Como stmt_upsert_progresos pero sumando: las filas traen deltas y el conflicto
+    hace col = col + delta en la BD (sin leer antes la fila). Lo usan los eventos de pedidos.
+    """
+    insertar = _insert_con_conflicto(dialecto)
+    tabla = models.ProgresoPlanDeVentas.__table__
+    stmt = insertar(models.ProgresoPlanDeVentas).values(filas)
+    return stmt.on_conflict_do_update(
+        index_elements=[tabla.c.id_plan, tabla.c.fecha],
+        set_={
+            "monto_actual": tabla.c.monto_actual + stmt.excluded.monto_actual,
+            "unidades_actuales": tabla.c.unidades_actuales + stmt.excluded.unidades_actuales,
+            "clientes_actuales": tabla.c.clientes_actuales + stmt.excluded.clientes_actuales,
+            "pedidos_contados": tabla.c.pedidos_contados + stmt.excluded.pedidos_contados,
+            "actualizado_en": stmt.excluded.actualizado_en,
+        },
+    )
+
+
+def fila_aporte(
+    id_plan: str,
+    d: date,
+    id_pedido,
+    id_cliente,
+    monto: Decimal,
+    unidades: int,
+    version: str | None = None,
+) -> dict:
+    return {
+        "id_pedido": str(id_pedido),
+        "id_plan": id_plan,
+        "fecha": d,
+        "id_cliente": None if id_cliente is None else str(id_cliente),
+        "monto": monto,
+        "unidades": unidades,
+        "version": version,
+    }
+
+
+def instante_version(valor) -> datetime | None:
+    """
+    actualizado_en de un pedido como datetime UTC: ISO 8601 (con o sin zona,
+    "Z" incluida; sin zona se asume UTC) o epoch en segundos / milisegundos.
+    None si falta o no se entiende.
+    """
+    if valor is None or valor == "":
+        return None
+    try:
+        if isinstance(valor, (int, float)) or str(valor).isdigit():
+            epoch = float(valor)
+            return datetime.fromtimestamp(epoch / 1000 if epoch > 1e11 else epoch, tz=timezone.utc)
+        instante = valor if isinstance(valor, datetime) else datetime.fromisoformat(str(valor).replace("Z", "+00:00"))
+    except (ValueError, OverflowError, OSError):
+        return None
+    if instante.tzinfo is None:
+        return instante.replace(tzinfo=timezone.utc)
+    return instante.astimezone(timezone.utc)
+
+
+def normalizar_version(valor) -> str | None:
+    """Versión guardada en AporteProgreso: ISO UTC de ancho fijo, comparable también como texto."""
+    instante = instante_version(valor)
+    return instante.isoformat(timespec="microseconds") if instante is not None else None
+
+
+def version_pedido(pedido: dict) -> str | None:
+    return normalizar_version(pedido.get("actualizado_en"))
+
+
+def filas_aporte(id_plan: str, d: date, aportes: Iterable[tuple]) -> list[dict]:
+    """
+    Filas de AporteProgreso a partir de ColumnasPedidos.aportes, con la versión
+    del pedido leído; los pedidos sin id no se registran.
+    """
+    return [
+        fila_aporte(id_plan, d, id_pedido, cliente, monto, unidades, normalizar_version(version))
+        for id_pedido, cliente, monto, unidades, version in aportes
+        if id_pedido is not None
+    ]
+
+
+def stmt_upsert_aportes(dialecto: str, filas: list[dict]) -> Insert:
+    insertar = _insert_con_conflicto(dialecto)
+    tabla = models.AporteProgreso.__table__
+    stmt = insertar(models.AporteProgreso).values(filas)
+    return stmt.on_conflict_do_update(
+        index_elements=[tabla.c.id_pedido, tabla.c.id_plan],
+        set_={c: stmt.excluded[c] for c in ("fecha", "id_cliente", "monto", "unidades", "version")},
+    )
+
+
+def stmt_borrar_aportes(ids_plan: Iterable[str], desde: date, hasta: date | None = None) -> Delete:
+    """Aportes de esos planes en el día (o el rango): el recálculo completo los reemplaza."""
+    A = models.AporteProgreso
+    return delete(A).where(A.id_plan.in_(list(ids_plan)), A.fecha.between(desde, hasta or desde))
+
+
+def stmts_reemplazar_aportes(
+    dialecto: str, ids_plan: list[str], desde: date, hasta: date, filas: list[dict]
+) -> list:
+    """
+    Reconciliación del libro de aportes: todo recálculo absoluto del progreso
+    (lote, plan, backfill) reemplaza en la misma transacción los aportes de esos
+    planes y días por los de los pedidos que acaba de leer. Los eventos de
+    pedidos siguientes aplican sus deltas sobre ellos.
+    """
+    if not ids_plan:
+        return []
+    stmts = [stmt_borrar_aportes(ids_plan, desde, hasta)]
+    for i in range(0, len(filas), FILAS_POR_UPSERT):
+        stmts.append(stmt_upsert_aportes(dialecto, filas[i:i + FILAS_POR_UPSERT]))
+    return stmts
+
+
+def stmt_version_progreso(id_plan: str) -> Select:
+    """(filas, último actualizado_en, último id) del progreso de un plan: cambia con cada upsert o alta."""
+    P = models.ProgresoPlanDeVentas
+    return select(func.count(P.id), func.max(P.actualizado_en), func.max(P.id)).where(P.id_plan == id_plan)
+
+
+def etag_progreso(id_plan: str, version: tuple) -> str:
+    return calcular_etag("progreso", id_plan, *version)
+
+
+def stmt_progreso(id_plan: str) -> Select:
+    P = models.ProgresoPlanDeVentas
+    return select(P).where(P.id_plan == id_plan).order_by(P.fecha)
+
+
+def fila_progreso(
+    id_plan: str, d: date, monto: Decimal, unidades: int, clientes: int, pedidos_contados: int
+) -> dict:
+    return {
+        "id_plan": id_plan,
+        "fecha": d,
+        "monto_actual": monto,
+        "unidades_actuales": unidades,
+        "clientes_actuales": clientes,
+        "pedidos_contados": pedidos_contados,
+        # ON CONFLICT DO UPDATE no aplica onupdate: la versión va explícita
+        "actualizado_en": models.ahora_utc(),
+    }
+
+
+def stmt_upsert_progreso(
+    dialecto: str,
+    id_plan: str,
+    d: date,
+    monto: Decimal,
+    unidades: int,
+    clientes: int,
+    pedidos_contados: int,
+) -> Insert:
+    """Upsert de un solo día, devolviendo la fila ORM resultante (RETURNING)."""
+    fila = fila_progreso(id_plan, d, monto, unidades, clientes, pedidos_contados)
+    return stmt_upsert_progresos(dialecto, [fila]).returning(models.ProgresoPlanDeVentas)
+
+
+@dataclass
+class ResultadoBackfill:
+    id_plan: str
+    desde: date
+    hasta: date
+    filas_escritas: int
+    pedidos_leidos: int
+    duracion_ms: float
+    paginas: int = 0
+    lectura_ms: float = 0.0
+
+
+def validar_rango(desde: date, hasta: date) -> None:
+    if hasta < desde:
+        raise ValidationError("hasta debe ser mayor o igual que desde")
+    if (hasta - desde).days + 1 > MAX_DIAS_BACKFILL:
+        raise ValidationError(f"El rango de backfill no puede superar {MAX_DIAS_BACKFILL} días")
+
+
+def params_pedidos_del_rango(desde: date, hasta: date) -> dict:
+    """
+    Parámetros de consulta a ms-pedidos: tipo VENTA + rango de fecha_compromiso.
+    fecha_compromiso_desde/hasta no están confirmados en el contrato de
+    ms-pedidos: ver pedidos_del_rango().
+    """
+    return {
+        "tipo": "VENTA",
+        "fecha_compromiso_desde": desde.isoformat(),
+        "fecha_compromiso_hasta": hasta.isoformat(),
+    }
+
+
+def fecha_de_pedido(pedido: dict) -> date | None:
+    valor = pedido.get("fecha_compromiso")
+    try:
+        return date.fromisoformat(str(valor)[:10]) if valor else None
+    except ValueError:
+        return None
+
+
+def fuera_de_rango(pedido: dict, desde: date, hasta: date) -> bool:
+    f = fecha_de_pedido(pedido)
+    return f is not None and not desde <= f <= hasta
+
+
+def avisar_rango_sin_filtro(pais: str, desde: date, hasta: date) -> None:
+    _metricas.incrementar("rango_sin_filtro", pais)
+    log.warning(
+        "[backfill] ms-pedidos devolvió pedidos fuera de %s..%s (pais=%s): se lee día por día",
+        desde,
+        hasta,
+        pais,
+    )
+
+
+def pedidos_del_rango(lector: LectorPedidos, desde: date, hasta: date) -> list[dict]:
+    """
+    Pedidos VENTA con fecha_compromiso en [desde, hasta] en una sola consulta.
+    Si ms-pedidos ignora el filtro por rango, el primer pedido fuera de él corta
+    la descarga (no se bajan todos los pedidos del país) y se lee día por día con
+    fecha_compromiso, que sí es parte del contrato.
+    """
+    pedidos = []
+    lectura = lector.leer(params_pedidos_del_rango(desde, hasta))
+    try:
+        for p in lectura:
+            if fuera_de_rango(p, desde, hasta):
+                break
+            pedidos.append(p)
+        else:
+            return pedidos
+    finally:
+        lectura.close()
+
+    avisar_rango_sin_filtro(lector.client.pais, desde, hasta)
+    pedidos = []
+    for i in range((hasta - desde).days + 1):
+        pedidos.extend(lector.leer(params_pedidos_del_dia(desde + timedelta(days=i))))
+    return pedidos
+
+
+def progreso_por_dia(
+    pedidos: Iterable[dict],
+    desde: date,
+    hasta: date,
+    *,
+    id_plan: str,
+    id_vendedor: str,
+    cliente_obj: str | None,
+    productos_set: set[str],
+) -> tuple[list[dict], list[dict]]:
+    """
+    Agrupa los pedidos del rango por fecha_compromiso y calcula una fila de
+    progreso por día en una sola pasada. Los días sin pedidos quedan en 0, igual
+    que en el recálculo de un día. Devuelve (filas de progreso, filas de aportes).
+    """
+    por_dia: dict[date, list[dict]] = defaultdict(list)
+    for p in pedidos:
+        f = fecha_de_pedido(p)
+        if f is not None and desde <= f <= hasta:
+            por_dia[f].append(p)
+
+    filas, aportes = [], []
+    for i in range((hasta - desde).days + 1):
+        d = desde + timedelta(days=i)
+        metricas, aportes_dia = calcular_progreso_y_aportes(
+            por_dia.get(d, []),
+            d,
+            id_plan=id_plan,
+            id_vendedor=id_vendedor,
+            cliente_obj=cliente_obj,
+            productos_set=productos_set,
+        )
+        filas.append(fila_progreso(id_plan, d, *metricas))
+        aportes.extend(aportes_dia)
+    return filas, aportes
+
+
+def expirar_progresos(db, ids_plan: set[str]) -> None:
+    """El upsert por lotes no pasa por el identity map: se expiran las filas ya cargadas de esos planes."""
+    for obj in list(db.identity_map.values()):
+        if isinstance(obj, models.ProgresoPlanDeVentas) and obj.id_plan in ids_plan:
+            db.expire(obj)
+
+
+def params_pedidos_del_dia(d: date) -> dict:
+    """Parámetros de consulta a ms-pedidos: tipo VENTA + fecha_compromiso."""
+    return {
+        "tipo": "VENTA",
+        "fecha_compromiso": d.isoformat(),
+    }
+
+
+def filtrar_planes(stmt: Select, filtros: FiltrosPlanes | None) -> Select:
+    if not filtros:
+        return stmt
+    Plan = models.PlanDeVentas
+    if filtros.activo is not None:
+        stmt = stmt.where(Plan.activo == filtros.activo)
+    if filtros.periodo:
+        stmt = stmt.where(Plan.periodo == filtros.periodo)
+    if filtros.territorio:
+        stmt = stmt.where(Plan.territorio == filtros.territorio)
+    if filtros.desde:
+        stmt = stmt.where(Plan.fecha_fin >= filtros.desde)
+    if filtros.hasta:
+        stmt = stmt.where(Plan.fecha_inicio <= filtros.hasta)
+    return stmt
+
+
+# Columnas de PlanDeVentasSalida: los listados no hidratan entidades ORM
+_COLUMNAS_SALIDA = (
+    models.PlanDeVentas.id,
+    models.PlanDeVentas.id_vendedor,
+    models.PlanDeVentas.periodo,
+    models.PlanDeVentas.territorio,
+    models.PlanDeVentas.meta_monto,
+    models.PlanDeVentas.meta_unidades,
+    models.PlanDeVentas.meta_clientes,
+    models.PlanDeVentas.fecha_inicio,
+    models.PlanDeVentas.fecha_fin,
+    models.PlanDeVentas.activo,
+    models.PlanDeVentas.id_cliente_objetivo,
+    models.PlanDeVentas.creado_en,
+)
+
+
+def stmt_salida_planes() -> Select:
+    return select(*_COLUMNAS_SALIDA)
+
+
+def stmt_productos_de_planes(ids_planes: list[str]) -> Select:
+    return select(
+        models.PlanDeVentasProducto.id_plan, models.PlanDeVentasProducto.id_producto
+    ).where(models.PlanDeVentasProducto.id_plan.in_(ids_planes))
+
+
+def armar_salida_planes(filas, productos) -> list[dict]:
+    """
+    Une filas de planes con sus productos (2 consultas en total, sin N+1) en
+    dicts con la forma de PlanDeVentasSalida.
+    """
+    ids_por_plan: dict[str, list[str]] = {}
+    for id_plan, id_producto in productos:
+        ids_por_plan.setdefault(id_plan, []).append(id_producto)
+    return [
+        {
+            "id": f.id,
+            "id_vendedor": f.id_vendedor,
+            "periodo": f.periodo,
+            "territorio": f.territorio,
+            "meta_monto": float(f.meta_monto or 0),
+            "meta_unidades": f.meta_unidades,
+            "meta_clientes": f.meta_clientes,
+            "fecha_inicio": f.fecha_inicio,
+            "fecha_fin": f.fecha_fin,
+            "activo": f.activo,
+            "ids_productos": ids_por_plan.get(f.id, []),
+            "id_cliente_objetivo": f.id_cliente_objetivo,
+        }
+        for f in filas
+    ]
 
 
 class ServicioPlanDeVentas:
     def __init__(self, db: Session, x_country: str):
         self.db = db
+        self.pais = x_country.lower()
         self.client = MsClient(x_country)
+        # páginas / pedidos / duración de la última lectura de ms-pedidos
+        self.ultima_lectura: dict | None = None
 
     def crear(self, payload: PlanDeVentasCrear) -> models.PlanDeVentas:
         plan = models.PlanDeVentas(
@@ -39,116 +495,108 @@ class ServicioPlanDeVentas:
 
         self.db.add(plan)
         self.db.flush()
+        invalidar_respuestas(self.db, self.pais, ESPACIO_PLANES, espacio_planes_vendedor(plan.id_vendedor))
         return plan
 
     def obtener(self, id_plan: str) -> models.PlanDeVentas | None:
         return self.db.get(models.PlanDeVentas, id_plan)
 
-    def obtener_todos(self) -> list[models.PlanDeVentas]:
-        return self.db.execute(select(models.PlanDeVentas)).scalars().all()
+    def etag_progreso(self, id_plan: str) -> str:
+        return etag_progreso(id_plan, tuple(self.db.execute(stmt_version_progreso(id_plan)).one()))
+
+    def obtener_progreso(self, id_plan: str) -> list[models.ProgresoPlanDeVentas]:
+        return list(self.db.execute(stmt_progreso(id_plan)).scalars())
+
+    def listar(
+        self,
+        filtros: FiltrosPlanes | None = None,
+        *,
+        cursor: str | None = None,
+        limite: int = LIMITE_POR_DEFECTO,
+    ) -> Pagina:
+        """Página de planes como dicts de PlanDeVentasSalida."""
+        stmt = filtrar_planes(stmt_salida_planes(), filtros)
+        stmt = aplicar_keyset(stmt, models.PlanDeVentas, cursor, limite)
+        pagina = armar_pagina(self.db.execute(stmt).all(), limite)
+        pagina.items = self._con_productos(pagina.items)
+        return pagina
 
-    def obtener_por_vendedor(self, id_vendedor: str) -> list[models.PlanDeVentas]:
-        return self.db.execute(
-            select(models.PlanDeVentas).where(models.PlanDeVentas.id_vendedor == id_vendedor)
-        ).scalars().all()
+    def listar_por_vendedor(self, id_vendedor: str) -> list[dict]:
+        filas = self.db.execute(
+            stmt_salida_planes().where(models.PlanDeVentas.id_vendedor == id_vendedor)
+        ).all()
+        return self._con_productos(filas)
+
+    def _con_productos(self, filas) -> list[dict]:
+        if not filas:
+            return []
+        productos = self.db.execute(stmt_productos_de_planes([f.id for f in filas])).all()
+        return armar_salida_planes(filas, productos)
 
     def recalcular_para_fecha(self, plan: models.PlanDeVentas, d: date) -> models.ProgresoPlanDeVentas:
         productos_set = {str(p.id_producto) for p in plan.productos}
         cliente_obj = str(plan.id_cliente_objetivo) if plan.id_cliente_objetivo is not None else None
 
-        # Requiere productos definidos; si no, no aporta
-        if not productos_set:
-            # upsert progreso en 0 (útil para dejar registro del día)
-            prog = (
-                self.db.execute(
-                    select(models.ProgresoPlanDeVentas).where(
-                        models.ProgresoPlanDeVentas.id_plan == plan.id,
-                        models.ProgresoPlanDeVentas.fecha == d,
-                    )
-                ).scalar_one_or_none()
+        # Sin productos el plan no aporta: se deja el registro del día en 0
+        (monto, unidades, clientes, pedidos_contados), aportes = (Decimal("0"), 0, 0, 0), []
+        if productos_set:
+            # 1) ms-pedidos (tipo VENTA + fecha_compromiso), todas las páginas
+            lector = LectorPedidos(self.client)
+            (monto, unidades, clientes, pedidos_contados), aportes = calcular_progreso_y_aportes(
+                lector.leer(params_pedidos_del_dia(d)),
+                d,
+                id_plan=plan.id,
+                id_vendedor=str(plan.id_vendedor),
+                cliente_obj=cliente_obj,
+                productos_set=productos_set,
             )
-            if not prog:
-                prog = models.ProgresoPlanDeVentas(id_plan=plan.id, fecha=d)
-                self.db.add(prog)
-            prog.monto_actual = Decimal("0")
-            prog.unidades_actuales = 0
-            prog.clientes_actuales = 0
-            prog.pedidos_contados = 0
-            self.db.flush()
-            return prog
-
-        # 1) Llamada al ms-pedidos: tipo VENTA + fecha_compromiso
-        params = {
-            "tipo": "VENTA",
-            "fecha_compromiso": d.isoformat(),
-            "limit": _MAX_LIMIT,
-            "offset": 0,
-        }
-        pedidos = self.client.get("/v1/pedidos", params=params) or []
-
-        monto = Decimal("0")
-        unidades = 0
-        clientes = set()
-        pedidos_contados = 0
-
-        for p in pedidos:
-            # 2) Filtrar por vendedor del plan
-            if str(p.get("vendedor_id")) != str(plan.id_vendedor):
-                continue
-
-            # 3) Validar cliente objetivo (obligatorio)
-            if cliente_obj and str(p.get("cliente_id")) != cliente_obj:
-                continue
-
-            # 4) Ítems del pedido que pertenecen al plan (por producto)
-            items_plan = []
-            for item in p.get("items", []):
-                if str(item.get("producto_id")) in productos_set:
-                    items_plan.append(item)
-
-            # Debe tener al menos un ítem del plan
-            if not items_plan:
-                continue
-
-            # 5) Sumar monto y unidades solo de los ítems del plan
-            total_pedido_aportado = Decimal("0")
-            unidades_pedido_aportadas = 0
-
-            for it in items_plan:
-                cant = int(it.get("cantidad", 0))
-                pu = _dec(it.get("precio_unitario"))
-                dsc = _dec(it.get("descuento_pct")) / 100
-                imp = _dec(it.get("impuesto_pct")) / 100
-
-                linea = pu * cant
-                neto = linea * (Decimal("1") - dsc)
-                con_impuesto = neto * (Decimal("1") + imp)
-
-                total_pedido_aportado += con_impuesto
-                unidades_pedido_aportadas += cant
-
-            if unidades_pedido_aportadas > 0:
-                pedidos_contados += 1
-                clientes.add(p.get("cliente_id"))
-                monto += total_pedido_aportado
-                unidades += unidades_pedido_aportadas
-
-        # UPSERT progreso (id_plan, fecha)
-        prog = (
-            self.db.execute(
-                select(models.ProgresoPlanDeVentas).where(
-                    models.ProgresoPlanDeVentas.id_plan == plan.id,
-                    models.ProgresoPlanDeVentas.fecha == d,
-                )
-            ).scalar_one_or_none()
+            self.ultima_lectura = lector.estadisticas()
+
+        # 2) aportes del día reemplazados + UPSERT progreso (id_plan, fecha), misma transacción
+        dialecto = self.db.get_bind().dialect.name
+        for stmt in stmts_reemplazar_aportes(dialecto, [plan.id], d, d, aportes):
+            self.db.execute(stmt)
+        stmt = stmt_upsert_progreso(dialecto, plan.id, d, monto, unidades, clientes, pedidos_contados)
+        return self.db.scalars(stmt, execution_options={"populate_existing": True}).one()
+
+    def recalcular_rango(self, plan: models.PlanDeVentas, desde: date, hasta: date) -> ResultadoBackfill:
+        """
+        Backfill de progreso diario: una consulta a ms-pedidos para todo el rango,
+        cálculo de todos los días en memoria y un único upsert por lotes.
+        """
+        validar_rango(desde, hasta)
+        inicio = time.perf_counter()
+        productos_set = {str(p.id_producto) for p in plan.productos}
+        cliente_obj = str(plan.id_cliente_objetivo) if plan.id_cliente_objetivo is not None else None
+
+        lector = LectorPedidos(self.client)
+        pedidos = pedidos_del_rango(lector, desde, hasta) if productos_set else []
+
+        filas, aportes = progreso_por_dia(
+            pedidos,
+            desde,
+            hasta,
+            id_plan=plan.id,
+            id_vendedor=str(plan.id_vendedor),
+            cliente_obj=cliente_obj,
+            productos_set=productos_set,
+        )
+        dialecto = self.db.get_bind().dialect.name
+        self.db.execute(stmt_upsert_progresos(dialecto, filas))
+        for stmt in stmts_reemplazar_aportes(dialecto, [plan.id], desde, hasta, aportes):
+            self.db.execute(stmt)
+        expirar_progresos(self.db, {plan.id})
+
+        duracion_ms = (time.perf_counter() - inicio) * 1000
+        _metricas.incrementar("backfill")
+        _metricas.observar("backfill_ms", duracion_ms)
+        return ResultadoBackfill(
+            id_plan=plan.id,
+            desde=desde,
+            hasta=hasta,
+            filas_escritas=len(filas),
+            pedidos_leidos=lector.pedidos,
+            duracion_ms=round(duracion_ms, 1),
+            paginas=lector.paginas,
+            lectura_ms=lector.duracion_ms,
         )
-        if not prog:
-            prog = models.ProgresoPlanDeVentas(id_plan=plan.id, fecha=d)
-            self.db.add(prog)
-
-        prog.monto_actual = monto
-        prog.unidades_actuales = unidades
-        prog.clientes_actuales = len(clientes)
-        prog.pedidos_contados = pedidos_contados
-        self.db.flush()
-        return prog
@@ -0,0 +1,93 @@
+from __future__ import annotations
+import asyncio
+from uuid import uuid4
+from sqlalchemy.orm import selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.domain import models
+from src.domain.schemas import PlanDeVentasCrear, FiltrosPlanes
+from src.infrastructure.cache import invalidar_respuestas
+from src.services.paginacion import Pagina, LIMITE_POR_DEFECTO, aplicar_keyset, armar_pagina
+from src.services.servicio_plan_ventas import (
+    filtrar_planes,
+    stmt_salida_planes,
+    stmt_productos_de_planes,
+    armar_salida_planes,
+    ESPACIO_PLANES,
+    espacio_planes_vendedor,
+    stmt_version_progreso,
+    etag_progreso,
+    stmt_progreso,
+)
+
+
+class ServicioPlanDeVentasAsync:
+    """
+    Variante async de ServicioPlanDeVentas (engine asyncpg, DB_ASYNC=true).
+    Las relaciones se cargan con selectinload: en AsyncSession no hay lazy-load.
+    El recálculo de progreso no está aquí: lo hacen los handlers de eventos con
+    ServicioPlanDeVentas (sync) en el threadpool.
+    """
+
+    def __init__(self, db: AsyncSession, x_country: str):
+        self.db = db
+        self.pais = x_country.lower()
+
+    async def crear(self, payload: PlanDeVentasCrear) -> models.PlanDeVentas:
+        plan = models.PlanDeVentas(
+            id=str(uuid4()),
+            id_vendedor=payload.id_vendedor,
+            periodo=payload.periodo,
+            territorio=payload.territorio,
+            meta_monto=payload.meta_monto,
+            meta_unidades=payload.meta_unidades,
+            meta_clientes=payload.meta_clientes,
+            fecha_inicio=payload.fecha_inicio,
+            fecha_fin=payload.fecha_fin,
+            id_cliente_objetivo=payload.id_cliente_objetivo,
+            activo=True,
+            productos=[models.PlanDeVentasProducto(id_producto=pid) for pid in payload.ids_productos],
+        )
+        self.db.add(plan)
+        await self.db.flush()
+        # el cliente Redis es sync: va al threadpool
+        await asyncio.to_thread(
+            invalidar_respuestas, self.db, self.pais, ESPACIO_PLANES, espacio_planes_vendedor(plan.id_vendedor)
+        )
+        return plan
+
+    async def obtener(self, id_plan: str) -> models.PlanDeVentas | None:
+        return await self.db.get(
+            models.PlanDeVentas, id_plan, options=[selectinload(models.PlanDeVentas.productos)]
+        )
+
+    async def listar(
+        self,
+        filtros: FiltrosPlanes | None = None,
+        *,
+        cursor: str | None = None,
+        limite: int = LIMITE_POR_DEFECTO,
+    ) -> Pagina:
+        stmt = filtrar_planes(stmt_salida_planes(), filtros)
+        stmt = aplicar_keyset(stmt, models.PlanDeVentas, cursor, limite)
+        pagina = armar_pagina((await self.db.execute(stmt)).all(), limite)
+        pagina.items = await self._con_productos(pagina.items)
+        return pagina
+
+    async def listar_por_vendedor(self, id_vendedor: str) -> list[dict]:
+        filas = (
+            await self.db.execute(stmt_salida_planes().where(models.PlanDeVentas.id_vendedor == id_vendedor))
+        ).all()
+        return await self._con_productos(filas)
+
+    async def _con_productos(self, filas) -> list[dict]:
+        if not filas:
+            return []
+        productos = (await self.db.execute(stmt_productos_de_planes([f.id for f in filas]))).all()
+        return armar_salida_planes(filas, productos)
+
+    async def etag_progreso(self, id_plan: str) -> str:
+        return etag_progreso(id_plan, tuple((await self.db.execute(stmt_version_progreso(id_plan))).one()))
+
+    async def obtener_progreso(self, id_plan: str) -> list[models.ProgresoPlanDeVentas]:
+        res = await self.db.execute(stmt_progreso(id_plan))
+        return list(res.scalars().all())
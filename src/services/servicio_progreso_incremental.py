@@ -0,0 +1,215 @@
+from __future__ import annotations
+import hashlib
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from typing import Iterable
+from sqlalchemy import func, select, text
+from sqlalchemy.orm import Session
+from src.domain import models
+from src.infrastructure.metricas import get_metricas
+from src.services.agregacion import ColumnasPedidos
+from src.services.servicio_plan_ventas import (
+    fecha_de_pedido,
+    fila_aporte,
+    fila_progreso,
+    instante_version,
+    stmt_sumar_progresos,
+    stmt_upsert_aportes,
+    expirar_progresos,
+    version_pedido,
+)
+
+EVENTOS_PEDIDO = ("pedido_creado", "pedido_actualizado", "pedido_cancelado")
+
+_ESTADOS_ANULADOS = {"CANCELADO", "ANULADO"}
+
+_metricas = get_metricas("recalculo")
+
+# Versión que deja pedido_cancelado (el evento trae solo el id, sin actualizado_en):
+# la cancelación es terminal. Es la mayor representable, así que un creado o
+# actualizado tardío del mismo pedido, con o sin versión, se descarta; el recálculo
+# por lote, que lee ms-pedidos, reemplaza la fila al reconciliar.
+VERSION_CANCELADO = datetime.max.replace(tzinfo=timezone.utc).isoformat(timespec="microseconds")
+
+
+def id_lock(clave: str) -> int:
+    """bigint para pg_advisory_*lock a partir de una clave de texto."""
+    return int.from_bytes(hashlib.sha1(clave.encode("utf-8")).digest()[:8], "big", signed=True)
+
+
+def evento_superado(guardada: str | None, instante: datetime | None) -> bool:
+    """La fila ya refleja un estado igual o más nuevo que el del evento (o el pedido se canceló)."""
+    if guardada == VERSION_CANCELADO:
+        return True
+    anterior = instante_version(guardada)
+    return instante is not None and anterior is not None and anterior >= instante
+
+
+def version_mas_nueva(guardada: str | None, entrante: str | None) -> str | None:
+    """Nunca baja la versión de una fila: un evento sin actualizado_en conserva la guardada."""
+    if entrante is None or guardada is None:
+        return entrante or guardada
+    return max(guardada, entrante, key=instante_version)
+
+
+@dataclass
+class ResultadoEvento:
+    id_pedido: str
+    planes: int
+    filas_ajustadas: int
+    descartado: bool = False
+
+
+def pedido_cuenta(evento: str, pedido: dict) -> bool:
+    """Solo cuentan las ventas vigentes (mismo criterio que la consulta tipo=VENTA a ms-pedidos)."""
+    if evento == "pedido_cancelado":
+        return False
+    if str(pedido.get("tipo") or "VENTA").upper() != "VENTA":
+        return False
+    return str(pedido.get("estado") or "").upper() not in _ESTADOS_ANULADOS
+
+
+class ServicioProgresoIncremental:
+    """
+    Aplica un evento de pedido (creado / actualizado / cancelado) al progreso
+    sin volver a leer ms-pedidos: calcula lo que el pedido aporta ahora a cada
+    plan (vendedor + producto + vigencia), lo compara con lo registrado en
+    AporteProgreso y suma la diferencia a las filas (plan, día) afectadas.
+    El recálculo por lote del día reemplaza los aportes y corrige cualquier deriva.
+    Leer aportes y aplicar el delta no es atómico: en Postgres cada evento toma
+    advisory locks de transacción por pedido (dos eventos del mismo pedido no
+    leen ambos el libro vacío) y por cliente (dos pedidos del mismo cliente no lo
+    suman ambos a clientes_actuales); se liberan con el commit.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+        self._bloqueadas: set[str] = set()
+
+    def _bloquear(self, claves: Iterable[str]) -> None:
+        """pg_advisory_xact_lock en orden estable; sin efecto fuera de Postgres."""
+        if self.db.get_bind().dialect.name != "postgresql":
+            return
+        for clave in sorted(set(claves) - self._bloqueadas):
+            self.db.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": id_lock(clave)})
+            self._bloqueadas.add(clave)
+
+    def _planes_candidatos(self, pedido: dict, d: date) -> dict[str, tuple[str, str | None, set[str]]]:
+        """{id_plan: (vendedor, cliente objetivo, productos del plan presentes en el pedido)}."""
+        productos = {str(item.get("producto_id")) for item in pedido.get("items", [])}
+        if not productos:
+            return {}
+        Plan, Producto = models.PlanDeVentas, models.PlanDeVentasProducto
+        filas = self.db.execute(
+            select(Plan.id, Plan.id_vendedor, Plan.id_cliente_objetivo, Producto.id_producto)
+            .join(Producto, Producto.id_plan == Plan.id)
+            .where(
+                Plan.activo.is_(True),
+                Plan.fecha_inicio <= d,
+                Plan.fecha_fin >= d,
+                Plan.id_vendedor == str(pedido.get("vendedor_id")),
+                Producto.id_producto.in_(productos),
+            )
+        ).all()
+        planes: dict[str, tuple[str, str | None, set[str]]] = {}
+        for id_plan, id_vendedor, id_cliente_objetivo, id_producto in filas:
+            cliente_obj = str(id_cliente_objetivo) if id_cliente_objetivo is not None else None
+            planes.setdefault(id_plan, (str(id_vendedor), cliente_obj, set()))[2].add(str(id_producto))
+        return planes
+
+    def _aportes_nuevos(self, evento: str, pedido: dict) -> dict[str, tuple]:
+        """{id_plan: (fecha, cliente, monto, unidades)} del estado del pedido que trae el evento."""
+        d = fecha_de_pedido(pedido)
+        if d is None or not pedido_cuenta(evento, pedido):
+            return {}
+        planes = self._planes_candidatos(pedido, d)
+        if not planes:
+            return {}
+        columnas = ColumnasPedidos([pedido])
+        nuevos = {}
+        for id_plan, (vendedor, cliente_obj, productos) in planes.items():
+            for _, cliente, monto, unidades, _ in columnas.aportes(vendedor, cliente_obj, productos):
+                nuevos[id_plan] = (d, None if cliente is None else str(cliente), monto, unidades)
+        return nuevos
+
+    def _otro_pedido_del_cliente(self, id_plan: str, d: date, cliente: str | None, id_pedido: str) -> bool:
+        A = models.AporteProgreso
+        return bool(
+            self.db.scalar(
+                select(func.count(A.id)).where(
+                    A.id_plan == id_plan,
+                    A.fecha == d,
+                    A.id_cliente == cliente,
+                    A.unidades > 0,
+                    A.id_pedido != id_pedido,
+                )
+            )
+        )
+
+    def aplicar(self, evento: str, pedido: dict) -> ResultadoEvento:
+        inicio = time.perf_counter()
+        if pedido.get("id") is None:
+            raise ValueError(f"id del pedido es obligatorio en {evento}")
+        id_pedido = str(pedido["id"])
+        version = VERSION_CANCELADO if evento == "pedido_cancelado" else version_pedido(pedido)
+        instante = instante_version(version)
+
+        self._bloquear((f"aporte:pedido:{id_pedido}", f"aporte:cliente:{pedido.get('cliente_id')}"))
+        A = models.AporteProgreso
+        viejos = {a.id_plan: a for a in self.db.scalars(select(A).where(A.id_pedido == id_pedido))}
+        # si el pedido cambió de cliente, también el anterior
+        self._bloquear(f"aporte:cliente:{a.id_cliente}" for a in viejos.values())
+        # redelivery o evento fuera de orden: ya se aplicó (o el lote ya leyó) un estado
+        # igual o más nuevo, o el pedido ya se canceló; se comparan instantes, no el texto
+        if any(evento_superado(a.version, instante) for a in viejos.values()):
+            _metricas.incrementar("evento_pedido_descartado", evento)
+            return ResultadoEvento(id_pedido=id_pedido, planes=0, filas_ajustadas=0, descartado=True)
+
+        nuevos = self._aportes_nuevos(evento, pedido)
+
+        # (plan, día) → [monto, unidades, clientes, pedidos]
+        deltas: dict[tuple[str, date], list] = defaultdict(lambda: [Decimal("0"), 0, 0, 0])
+        aportes = []
+        cambiados = 0
+        for id_plan in viejos.keys() | nuevos.keys():
+            v = viejos.get(id_plan)
+            antes = (v.fecha, v.id_cliente, Decimal(v.monto), v.unidades) if v is not None and v.unidades > 0 else None
+            despues = nuevos.get(id_plan)
+            version_fila = version_mas_nueva(v.version if v is not None else None, version)
+            if despues is not None:
+                aportes.append(fila_aporte(id_plan, despues[0], id_pedido, *despues[1:], version_fila))
+            else:
+                aportes.append(fila_aporte(id_plan, v.fecha, id_pedido, v.id_cliente, Decimal("0"), 0, version_fila))
+            if antes == despues:
+                continue
+            cambiados += 1
+            for signo, aporte in ((-1, antes), (1, despues)):
+                if aporte is None:
+                    continue
+                d, cliente, monto, unidades = aporte
+                delta = deltas[(id_plan, d)]
+                delta[0] += signo * monto
+                delta[1] += signo * unidades
+                delta[3] += signo
+                # el cliente entra o sale del conteo solo si ningún otro pedido suyo cuenta ese día
+                if not self._otro_pedido_del_cliente(id_plan, d, cliente, id_pedido):
+                    delta[2] += signo
+
+        filas = [
+            fila_progreso(id_plan, d, *delta)
+            for (id_plan, d), delta in deltas.items()
+            if any(delta)
+        ]
+        dialecto = self.db.get_bind().dialect.name
+        if filas:
+            self.db.execute(stmt_sumar_progresos(dialecto, filas))
+            expirar_progresos(self.db, {f["id_plan"] for f in filas})
+        if aportes:
+            self.db.execute(stmt_upsert_aportes(dialecto, aportes))
+
+        _metricas.incrementar("evento_pedido", evento)
+        _metricas.observar("evento_pedido_ms", (time.perf_counter() - inicio) * 1000)
+        return ResultadoEvento(id_pedido=id_pedido, planes=cambiados, filas_ajustadas=len(filas))
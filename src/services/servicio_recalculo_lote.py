@@ -0,0 +1,105 @@
+from __future__ import annotations
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from src.domain import models
+from src.infrastructure.http import MsClient
+from src.infrastructure.metricas import get_metricas
+from src.services.agregacion import ColumnasPedidos
+from src.services.lector_pedidos import LectorPedidos
+from src.services.servicio_plan_ventas import (
+    FILAS_POR_UPSERT,
+    params_pedidos_del_dia,
+    stmt_productos_de_planes,
+    stmt_upsert_progresos,
+    stmts_reemplazar_aportes,
+    fila_progreso,
+    filas_aporte,
+    expirar_progresos,
+)
+
+_metricas = get_metricas("recalculo")
+
+
+@dataclass
+class ResultadoLote:
+    fecha: date
+    planes: int
+    filas_escritas: int
+    pedidos_leidos: int
+    duracion_ms: float
+    paginas: int = 0
+    lectura_ms: float = 0.0
+
+
+class ServicioRecalculoLote:
+    """
+    Recalcula el progreso de todos los planes activos de un país para un día:
+    una descarga de pedidos, ColumnasPedidos (totales de línea una sola vez,
+    agrupados por plan) y un upsert masivo. Es también la reconciliación
+    periódica del progreso incremental: reemplaza los aportes por pedido del día.
+    """
+
+    def __init__(self, db: Session, x_country: str):
+        self.db = db
+        self.client = MsClient(x_country)
+
+    def _planes_vigentes(self, d: date) -> list[tuple]:
+        Plan = models.PlanDeVentas
+        return self.db.execute(
+            select(Plan.id, Plan.id_vendedor, Plan.id_cliente_objetivo).where(
+                Plan.activo.is_(True), Plan.fecha_inicio <= d, Plan.fecha_fin >= d
+            )
+        ).all()
+
+    def recalcular_fecha(self, d: date) -> ResultadoLote:
+        inicio = time.perf_counter()
+        planes = self._planes_vigentes(d)
+
+        productos: dict[str, set[str]] = defaultdict(set)
+        if planes:
+            for id_plan, id_producto in self.db.execute(stmt_productos_de_planes([p.id for p in planes])):
+                productos[id_plan].add(str(id_producto))
+
+        # las columnas se cargan a medida que llegan las páginas de ms-pedidos,
+        # solo con los ítems de vendedores y productos de algún plan
+        lector = LectorPedidos(self.client)
+        columnas = ColumnasPedidos(
+            lector.leer(params_pedidos_del_dia(d)) if productos else [],
+            vendedores={str(p.id_vendedor) for p in planes},
+            productos=set().union(*productos.values()),
+        )
+
+        filas, aportes = [], []
+        for plan in planes:
+            cliente_obj = str(plan.id_cliente_objetivo) if plan.id_cliente_objetivo is not None else None
+            productos_plan = productos.get(plan.id, set())
+            metricas = columnas.agregar(str(plan.id_vendedor), cliente_obj, productos_plan)
+            filas.append(fila_progreso(plan.id, d, *metricas))
+            aportes.extend(
+                filas_aporte(plan.id, d, columnas.aportes(str(plan.id_vendedor), cliente_obj, productos_plan))
+            )
+
+        dialecto = self.db.get_bind().dialect.name
+        for i in range(0, len(filas), FILAS_POR_UPSERT):
+            self.db.execute(stmt_upsert_progresos(dialecto, filas[i:i + FILAS_POR_UPSERT]))
+        # reconciliación: los aportes del día pasan a ser los de este recálculo
+        for stmt in stmts_reemplazar_aportes(dialecto, [plan.id for plan in planes], d, d, aportes):
+            self.db.execute(stmt)
+        expirar_progresos(self.db, {plan.id for plan in planes})
+
+        duracion_ms = (time.perf_counter() - inicio) * 1000
+        _metricas.incrementar("lote")
+        _metricas.observar("lote_ms", duracion_ms)
+        return ResultadoLote(
+            fecha=d,
+            planes=len(planes),
+            filas_escritas=len(filas),
+            pedidos_leidos=lector.pedidos,
+            duracion_ms=round(duracion_ms, 1),
+            paginas=lector.paginas,
+            lectura_ms=lector.duracion_ms,
+        )
@@ -0,0 +1,109 @@
+from __future__ import annotations
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date
+
+from src.config import settings
+from src.infrastructure.coalescencia import clave_recalculo, get_coalescedor
+from src.infrastructure.infrastructure import resolver_schema, session_for_schema
+from src.infrastructure.metricas import get_metricas
+from src.services.servicio_recalculo_lote import ServicioRecalculoLote
+
+log = logging.getLogger(__name__)
+_metricas = get_metricas("recalculo")
+
+
+@dataclass
+class ResultadoRecalculoPaises:
+    fecha: date
+    paises: list[dict] = field(default_factory=list)
+    planes: int = 0
+    filas_escritas: int = 0
+    pedidos_leidos: int = 0
+    duracion_ms: float = 0.0
+    planes_por_segundo: float = 0.0
+
+    @property
+    def errores(self) -> int:
+        return sum(1 for p in self.paises if p["estado"] == "error")
+
+
+def recalcular_pais(country: str, d: date) -> dict:
+    """
+    Recálculo por lote de un schema: una descarga de pedidos para todos sus
+    planes vigentes el día `d`. Pasa por el coalescedor con la misma clave que
+    el evento recalcular_planes_del_dia: si ya hay uno en vuelo para (país, día),
+    este se fusiona con él y el que corre repite al terminar.
+    """
+    inicio = time.perf_counter()
+    resultado: dict = {}
+
+    def trabajo():
+        with session_for_schema(country) as session:
+            res = ServicioRecalculoLote(session, country).recalcular_fecha(d)
+        resultado.update(
+            planes=res.planes,
+            filas_escritas=res.filas_escritas,
+            pedidos_leidos=res.pedidos_leidos,
+            paginas=res.paginas,
+        )
+
+    try:
+        coalescedor = get_coalescedor()
+        clave = clave_recalculo("recalcular_planes_del_dia", {"fecha": d.isoformat()}, country)
+        if coalescedor is None or coalescedor.ejecutar(clave, trabajo):
+            estado = "ok"
+        else:
+            estado = "coalescido"
+    except Exception as e:
+        _metricas.incrementar("recalculo_paises_error", country)
+        log.error("[recalculo] Error recalculando schema %s fecha=%s: %s", country, d, e)
+        return {"schema": country, "estado": "error", "error": str(e)}
+
+    duracion_ms = (time.perf_counter() - inicio) * 1000
+    _metricas.observar("recalculo_pais_ms", duracion_ms, country)
+    return {"schema": country, "estado": estado, **resultado, "duracion_ms": round(duracion_ms, 1)}
+
+
+def recalcular_paises(
+    d: date | None = None,
+    paises: list[str] | None = None,
+    paralelismo: int | None = None,
+) -> ResultadoRecalculoPaises:
+    """
+    Refresca el progreso de todos los planes activos de cada país el día `d`
+    (por defecto hoy): un lote por schema, a lo sumo `paralelismo` a la vez.
+    Un país que falla no detiene a los demás; queda con estado "error".
+    ValidationError si algún país no está en KNOWN_SCHEMAS.
+    """
+    d = d or date.today()
+    paises = list(dict.fromkeys(resolver_schema(p) for p in paises)) if paises else settings.KNOWN_SCHEMAS
+    paralelismo = max(1, min(paralelismo or settings.RECALCULO_PAISES_PARALELISMO, len(paises) or 1))
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=paralelismo, thread_name_prefix="recalculo") as ex:
+        por_pais = list(ex.map(lambda country: recalcular_pais(country, d), paises))
+    duracion_ms = (time.perf_counter() - inicio) * 1000
+
+    res = ResultadoRecalculoPaises(fecha=d, paises=por_pais, duracion_ms=round(duracion_ms, 1))
+    for p in por_pais:
+        res.planes += p.get("planes", 0)
+        res.filas_escritas += p.get("filas_escritas", 0)
+        res.pedidos_leidos += p.get("pedidos_leidos", 0)
+    res.planes_por_segundo = round(res.planes / (duracion_ms / 1000), 1) if duracion_ms else 0.0
+
+    _metricas.incrementar("recalculo_paises")
+    _metricas.observar("recalculo_paises_ms", duracion_ms)
+    log.info(
+        "[recalculo] fecha=%s paises=%s planes=%s pedidos=%s errores=%s duracion_ms=%s planes_por_segundo=%s",
+        d,
+        len(paises),
+        res.planes,
+        res.pedidos_leidos,
+        res.errores,
+        res.duracion_ms,
+        res.planes_por_segundo,
+    )
+    return res
@@ -4,17 +4,37 @@ from uuid import uuid4
 from datetime import date
 from typing import Optional
 
-from sqlalchemy import select
+from sqlalchemy import Select, select
 from sqlalchemy.orm import Session
 
 from src.domain import models
-from src.domain.schemas import VisitaCrear, DetalleVisitaCrear
+from src.domain.schemas import VisitaCrear, DetalleVisitaCrear, FiltrosVisitas
+from src.services.paginacion import Pagina, LIMITE_POR_DEFECTO, aplicar_keyset, armar_pagina
+from src.services.etags import calcular_etag
+from src.infrastructure.cache import invalidar_respuestas
 from src.infrastructure.loader import CargadorGCS
 from src.config import settings
 from src.errors import NotFoundError
 
 import base64
 
+# Espacio de la caché de respuestas del listado de visitas
+ESPACIO_VISITAS = "visitas"
+
+
+def filtrar_visitas(stmt: Select, filtros: FiltrosVisitas | None) -> Select:
+    if not filtros:
+        return stmt
+    if filtros.id_vendedor:
+        stmt = stmt.where(models.Visita.id_vendedor == filtros.id_vendedor)
+    if filtros.d:
+        stmt = stmt.where(models.Visita.fecha == filtros.d)
+    if filtros.desde:
+        stmt = stmt.where(models.Visita.fecha >= filtros.desde)
+    if filtros.hasta:
+        stmt = stmt.where(models.Visita.fecha <= filtros.hasta)
+    return stmt
+
 
 class ServicioVisitas:
     def __init__(self, db: Session, pais: str | None = None):
@@ -35,19 +55,30 @@ class ServicioVisitas:
         )
         self.db.add(visita)
         self.db.flush()
+        invalidar_respuestas(self.db, self.pais, ESPACIO_VISITAS)
         return visita
 
-    def listar_visitas(self, id_vendedor: Optional[str] = None, d: Optional[date] = None):
-        stmt = select(models.Visita)
-        if id_vendedor:
-            stmt = stmt.where(models.Visita.id_vendedor == id_vendedor)
-        if d:
-            stmt = stmt.where(models.Visita.fecha == d)
-        return list(self.db.execute(stmt).scalars())
+    def listar_visitas(
+        self,
+        filtros: Optional[FiltrosVisitas] = None,
+        *,
+        cursor: Optional[str] = None,
+        limite: int = LIMITE_POR_DEFECTO,
+    ) -> Pagina:
+        stmt = aplicar_keyset(filtrar_visitas(select(models.Visita), filtros), models.Visita, cursor, limite)
+        return armar_pagina(list(self.db.execute(stmt).scalars()), limite)
+
+    # --- ETag de la visita: solo lee la fila, sin detalle ni foto ---
+    def etag_visita(self, id_visita: str, incluir_foto: bool = True) -> str:
+        visita = self.db.get(models.Visita, id_visita)
+        if not visita:
+            raise NotFoundError("Visita no encontrada")
+        # agregar_detalle toca actualizado_en: cubre detalle y foto
+        return calcular_etag("visita", visita.id, visita.actualizado_en.isoformat(), incluir_foto)
 
     # --- Obtener visita por id, con detalle y foto en formato iOS (data URI) ---
     def obtener_visita_con_detalle(
-        self, id_visita: str
+        self, id_visita: str, incluir_foto: bool = True
     ) -> tuple[models.Visita, models.DetalleVisita | None, str | None]:
         visita = self.db.get(models.Visita, id_visita)
         if not visita:
@@ -58,7 +89,7 @@ class ServicioVisitas:
         ).scalar_one_or_none()
 
         foto_ios: str | None = None
-        if detalle and detalle.url_foto:
+        if incluir_foto and detalle and detalle.url_foto:
             # Ahora 'url_foto' almacena la RUTA del objeto en GCS (no la URL).
             try:
                 carg = CargadorGCS(self.pais)
@@ -118,5 +149,8 @@ class ServicioVisitas:
 
         # Al guardar/actualizar detalle, la visita queda finalizada
         visita.estado = "finalizada"
+        # explícito: si ya estaba finalizada no habría UPDATE y el ETag no cambiaría
+        visita.actualizado_en = models.ahora_utc()
         self.db.flush()
+        invalidar_respuestas(self.db, self.pais, ESPACIO_VISITAS)
         return detalle
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+from uuid import uuid4
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.domain import models
+from src.domain.schemas import VisitaCrear, DetalleVisitaCrear, FiltrosVisitas
+from src.services.paginacion import Pagina, LIMITE_POR_DEFECTO, aplicar_keyset, armar_pagina
+from src.services.servicio_visitas import filtrar_visitas, ESPACIO_VISITAS
+from src.services.etags import calcular_etag
+from src.infrastructure.cache import invalidar_respuestas
+from src.infrastructure.loader import CargadorGCS
+from src.config import settings
+from src.errors import NotFoundError
+
+
+class ServicioVisitasAsync:
+    """
+    Variante async de ServicioVisitas (engine asyncpg, DB_ASYNC=true).
+    Las llamadas a GCS son bloqueantes y se ejecutan con asyncio.to_thread.
+    """
+
+    def __init__(self, db: AsyncSession, pais: str | None = None):
+        self.db = db
+        self.pais = (pais or settings.DEFAULT_SCHEMA).lower()
+
+    async def crear_visita(self, payload: VisitaCrear) -> models.Visita:
+        visita = models.Visita(
+            id=str(uuid4()),
+            id_vendedor=payload.id_vendedor,
+            id_cliente=payload.id_cliente,
+            direccion=payload.direccion,
+            ciudad=payload.ciudad,
+            contacto=payload.contacto,
+            fecha=payload.fecha,
+            estado="pendiente",
+        )
+        self.db.add(visita)
+        await self.db.flush()
+        await asyncio.to_thread(invalidar_respuestas, self.db, self.pais, ESPACIO_VISITAS)
+        return visita
+
+    async def listar_visitas(
+        self,
+        filtros: Optional[FiltrosVisitas] = None,
+        *,
+        cursor: Optional[str] = None,
+        limite: int = LIMITE_POR_DEFECTO,
+    ) -> Pagina:
+        stmt = aplicar_keyset(filtrar_visitas(select(models.Visita), filtros), models.Visita, cursor, limite)
+        return armar_pagina(list((await self.db.execute(stmt)).scalars()), limite)
+
+    async def _detalle(self, id_visita: str) -> models.DetalleVisita | None:
+        res = await self.db.execute(
+            select(models.DetalleVisita).where(models.DetalleVisita.id_visita == id_visita)
+        )
+        return res.scalar_one_or_none()
+
+    async def etag_visita(self, id_visita: str, incluir_foto: bool = True) -> str:
+        visita = await self.db.get(models.Visita, id_visita)
+        if not visita:
+            raise NotFoundError("Visita no encontrada")
+        return calcular_etag("visita", visita.id, visita.actualizado_en.isoformat(), incluir_foto)
+
+    async def obtener_visita_con_detalle(
+        self, id_visita: str, incluir_foto: bool = True
+    ) -> tuple[models.Visita, models.DetalleVisita | None, str | None]:
+        visita = await self.db.get(models.Visita, id_visita)
+        if not visita:
+            raise NotFoundError("Visita no encontrada")
+
+        detalle = await self._detalle(id_visita)
+
+        foto_ios: str | None = None
+        if incluir_foto and detalle and detalle.url_foto:
+            try:
+                carg = CargadorGCS(self.pais)
+                bytes_img, ctype = await asyncio.to_thread(carg.descargar_bytes_y_tipo, detalle.url_foto)
+                b64 = base64.b64encode(bytes_img).decode("utf-8")
+                foto_ios = f"data:{ctype};base64,{b64}"
+            except Exception:
+                foto_ios = None
+
+        return visita, detalle, foto_ios
+
+    async def agregar_detalle(
+        self,
+        id_visita: str,
+        payload: DetalleVisitaCrear,
+        *,
+        foto_bytes: bytes | None = None,
+        nombre_archivo: str | None = None,
+        content_type: str | None = None,
+    ) -> models.DetalleVisita:
+        visita = await self.db.get(models.Visita, id_visita)
+        if not visita:
+            raise NotFoundError("Visita no encontrada")
+
+        detalle = await self._detalle(id_visita)
+        if detalle:
+            detalle.id_cliente = payload.id_cliente
+            detalle.atendido_por = payload.atendido_por
+            detalle.hallazgos = payload.hallazgos
+            detalle.sugerencias_producto = payload.sugerencias_producto
+        else:
+            detalle = models.DetalleVisita(
+                id_visita=id_visita,
+                id_cliente=payload.id_cliente,
+                atendido_por=payload.atendido_por,
+                hallazgos=payload.hallazgos,
+                sugerencias_producto=payload.sugerencias_producto,
+            )
+            self.db.add(detalle)
+
+        if foto_bytes:
+            cargador = CargadorGCS(self.pais)
+            detalle.url_foto = await asyncio.to_thread(
+                cargador.subir_foto_visita,
+                id_visita,
+                nombre_archivo or "foto.jpg",
+                foto_bytes,
+                content_type or "image/jpeg",
+            )
+
+        visita.estado = "finalizada"
+        visita.actualizado_en = models.ahora_utc()
+        await self.db.flush()
+        await asyncio.to_thread(invalidar_respuestas, self.db, self.pais, ESPACIO_VISITAS)
+        return detalle
@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+
+from google.cloud import pubsub_v1
+from google.cloud.pubsub_v1.subscriber.scheduler import ThreadScheduler
+
+from src.config import settings
+from src.infrastructure.bootstrap import inicializar_schemas
+from src.infrastructure.http import cerrar_http_session
+from src.infrastructure.infrastructure import cerrar_publisher
+from src.infrastructure.metricas import get_metricas
+from src.services.eventos import cerrar_despachador, decodificar_evento, get_despachador
+
+log = logging.getLogger(__name__)
+_metricas = get_metricas("worker")
+
+
+class Worker:
+    """
+    Consume la suscripción de ventas-crm con streaming pull en lugar de push:
+    sin un request HTTP por mensaje y con paralelismo propio (WORKER_HILOS)
+    acotado por el control de flujo (mensajes / bytes sin ack).
+    Con PUBSUB_EMULATOR_HOST definido, el cliente se conecta al emulador;
+    en pruebas se le puede pasar cualquier objeto con subscribe().
+    Los callbacks del cliente entregan cada mensaje al Despachador, que corre en
+    un event loop propio del worker: los límites de concurrencia por tipo de
+    evento se comparten entre todos los hilos.
+    """
+
+    def __init__(
+        self,
+        suscripcion: str | None = None,
+        *,
+        subscriber: Any = None,
+        max_mensajes: int | None = None,
+        max_bytes: int | None = None,
+        hilos: int | None = None,
+    ):
+        self.suscripcion = suscripcion or settings.PUBSUB_SUSCRIPCION_VENTAS_CRM
+        if not self.suscripcion:
+            raise ValueError("PUBSUB_SUSCRIPCION_VENTAS_CRM no configurada")
+        self.subscriber = subscriber
+        self.max_mensajes = max_mensajes or settings.WORKER_MAX_MENSAJES
+        self.max_bytes = max_bytes or settings.WORKER_MAX_BYTES
+        self.hilos = hilos or settings.WORKER_HILOS
+        self.futuro: Optional[Any] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
+
+    def _loop_despacho(self) -> asyncio.AbstractEventLoop:
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="worker-despacho", daemon=True).start()
+            return self._loop
+
+    def procesar(self, mensaje: Any) -> None:
+        """
+        Callback del streaming pull: mismo despacho que /pubsub. Siempre hace ack,
+        como el 204 del push: los errores se registran y no provocan reentregas.
+        """
+        inicio = time.perf_counter()
+        try:
+            event = decodificar_evento(mensaje.data)
+        except Exception as e:
+            log.warning("[worker] 'data' no es JSON válido: %s", e)
+            _metricas.incrementar("invalidos")
+        else:
+            despacho = get_despachador().despachar(event, mensaje.message_id, "worker")
+            try:
+                asyncio.run_coroutine_threadsafe(despacho, self._loop_despacho()).result()
+            except Exception as e:
+                log.error("[worker] Error despachando %s: %s", event.get("event"), e)
+            _metricas.incrementar("mensajes", event.get("event") or "sin_tipo")
+        finally:
+            mensaje.ack()
+            _metricas.observar("mensaje_ms", (time.perf_counter() - inicio) * 1000)
+
+    def iniciar(self):
+        if self.subscriber is None:
+            self.subscriber = pubsub_v1.SubscriberClient()
+        executor = ThreadPoolExecutor(max_workers=self.hilos, thread_name_prefix="worker")
+        self.futuro = self.subscriber.subscribe(
+            self.suscripcion,
+            callback=self.procesar,
+            flow_control=pubsub_v1.types.FlowControl(
+                max_messages=self.max_mensajes,
+                max_bytes=self.max_bytes,
+            ),
+            scheduler=ThreadScheduler(executor),
+            # al detener se esperan los callbacks en curso (ack incluido)
+            await_callbacks_on_shutdown=True,
+        )
+        log.info(
+            "[worker] Escuchando %s (max_mensajes=%s max_bytes=%s hilos=%s)",
+            self.suscripcion,
+            self.max_mensajes,
+            self.max_bytes,
+            self.hilos,
+        )
+        return self.futuro
+
+    def detener(self) -> None:
+        if self.futuro is not None:
+            self.futuro.cancel()
+
+    def _cerrar_loop(self) -> None:
+        with self._loop_lock:
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._loop = None
+
+    def ejecutar(self) -> None:
+        """Bloquea hasta SIGTERM/SIGINT (Cloud Run / Ctrl+C) o un error fatal del stream."""
+        futuro = self.iniciar()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, lambda *_: self.detener())
+        try:
+            futuro.result()
+        except Exception as e:
+            if not futuro.cancelled():
+                log.error("[worker] Streaming pull terminó con error: %s", e)
+                raise
+        finally:
+            self._cerrar_loop()
+            cerrar_despachador()
+            cerrar_publisher()
+            cerrar_http_session()
+            close = getattr(self.subscriber, "close", None)
+            if close is not None:
+                close()
+            log.info("🛑 Worker ventas-crm detenido")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Worker de streaming pull de ventas-crm")
+    parser.add_argument("--suscripcion", default=settings.PUBSUB_SUSCRIPCION_VENTAS_CRM)
+    parser.add_argument("--max-mensajes", type=int, default=settings.WORKER_MAX_MENSAJES)
+    parser.add_argument("--max-bytes", type=int, default=settings.WORKER_MAX_BYTES)
+    parser.add_argument("--hilos", type=int, default=settings.WORKER_HILOS)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+        handlers=[logging.StreamHandler(sys.stdout)],
+    )
+    for r in inicializar_schemas(settings.KNOWN_SCHEMAS):
+        if r["estado"] == "error":
+            log.error(f"❌ Error creando tablas en schema {r['schema']}: {r['error']}")
+
+    Worker(
+        args.suscripcion,
+        max_mensajes=args.max_mensajes,
+        max_bytes=args.max_bytes,
+        hilos=args.hilos,
+    ).ejecutar()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
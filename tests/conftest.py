@@ -1,13 +1,16 @@
 import os
 import tempfile
+import time
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from src.app import app
-from src.dependencies import get_session
+from src.dependencies import Lectura, get_lectura, get_session, get_read_session
 from src.domain.models import Base
 from contextlib import contextmanager
+from src.config import settings
+from src.infrastructure.metricas import get_metricas
 
 # --- 1) Motor de pruebas AISLADO (SQLite) ---
 # Opción A: en memoria (más rápido, pero cada conexión es una DB distinta sin pool especial)
@@ -36,7 +39,7 @@ def _patch_infrastructure():
     original_session_for_schema = getattr(infra, "session_for_schema", None)
 
     @contextmanager
-    def session_for_schema_test(_schema: str):
+    def session_for_schema_test(_schema: str, solo_lectura: bool = False):
         """Ignora el schema y devuelve sesión SQLite de test como context manager."""
         db = SessionLocalTest()
         try:
@@ -66,12 +69,33 @@ def db_session():
         db.rollback()
         db.close()
 
+class LecturaTest(Lectura):
+    """Lectura perezosa sobre la sesión de la prueba; anota si se abrió y contra qué."""
+
+    def __init__(self, db):
+        super().__init__("test", replica=True)
+        self.db = db
+        self.aperturas: list[bool] = []
+
+    @contextmanager
+    def sesion(self, primario: bool = False):
+        self.aperturas.append(primario)
+        yield self.db
+
+
+@pytest.fixture()
+def lectura(db_session):
+    return LecturaTest(db_session)
+
+
 @pytest.fixture(autouse=True)
-def _override_get_session(db_session):
+def _override_get_session(db_session, lectura):
     # Asegura que TODOS los endpoints usen la sesión SQLite de pruebas
     def _get_session_override():
         return db_session
     app.dependency_overrides[get_session] = _get_session_override
+    app.dependency_overrides[get_read_session] = _get_session_override
+    app.dependency_overrides[get_lectura] = lambda: lectura
     yield
     app.dependency_overrides.clear()
 
@@ -85,3 +109,107 @@ def client():
 def headers():
     from src.config import settings
     return {settings.COUNTRY_HEADER: settings.DEFAULT_SCHEMA}
+
+
+# --- 6) Contador de sentencias SQL (para vigilar N+1) ---
+@pytest.fixture()
+def contar_queries():
+    sentencias: list[str] = []
+
+    def _antes(conn, cursor, statement, parameters, context, executemany):
+        sentencias.append(statement)
+
+    event.listen(engine_test, "before_cursor_execute", _antes)
+    yield sentencias
+    event.remove(engine_test, "before_cursor_execute", _antes)
+
+
+# --- 7) Redis: caches apagadas por defecto; fake_redis las enciende en memoria ---
+class FakeRedis:
+    """Subconjunto de redis.Redis (sin decode_responses) suficiente para las cachés."""
+
+    def __init__(self):
+        self.datos: dict[str, bytes] = {}
+        self.vence: dict[str, float] = {}
+
+    def _vigente(self, clave):
+        if clave in self.vence and self.vence[clave] <= time.monotonic():
+            self.datos.pop(clave, None)
+            self.vence.pop(clave, None)
+        return clave in self.datos
+
+    def get(self, clave):
+        return self.datos.get(clave) if self._vigente(clave) else None
+
+    def set(self, clave, valor, ex=None, px=None, nx=False):
+        if nx and self._vigente(clave):
+            return None
+        self.datos[clave] = valor if isinstance(valor, bytes) else str(valor).encode()
+        self.vence.pop(clave, None)
+        if ex is not None or px is not None:
+            self.vence[clave] = time.monotonic() + (ex if ex is not None else px / 1000)
+        return True
+
+    def delete(self, *claves):
+        n = 0
+        for clave in claves:
+            if self._vigente(clave):
+                n += 1
+            self.datos.pop(clave, None)
+            self.vence.pop(clave, None)
+        return n
+
+    def exists(self, clave):
+        return int(self._vigente(clave))
+
+    def incr(self, clave):
+        valor = int(self.get(clave) or 0) + 1
+        self.datos[clave] = str(valor).encode()
+        return valor
+
+    def eval(self, script, numkeys, *args):
+        # único script que usa el código: compare-and-delete de un lock
+        from src.infrastructure.infrastructure import SOLTAR_LOCK_SI_ES_PROPIO
+
+        assert script == SOLTAR_LOCK_SI_ES_PROPIO and numkeys == 1
+        clave, token = args
+        if self.get(clave) == (token if isinstance(token, bytes) else str(token).encode()):
+            return self.delete(clave)
+        return 0
+
+    def ttl(self, clave):
+        if not self._vigente(clave):
+            return -2
+        return int(self.vence[clave] - time.monotonic()) if clave in self.vence else -1
+
+
+@pytest.fixture(autouse=True)
+def _sin_redis(monkeypatch):
+    monkeypatch.setattr("src.infrastructure.cache.get_redis_binario", lambda: None)
+    monkeypatch.setattr("src.infrastructure.deduplicacion.get_redis_binario", lambda: None)
+    # marcas de de-duplicación de /pubsub en memoria: nuevas en cada test
+    monkeypatch.setattr("src.infrastructure.deduplicacion._registro", None)
+    monkeypatch.setattr("src.infrastructure.coalescencia.get_redis_binario", lambda: None)
+    monkeypatch.setattr("src.infrastructure.coalescencia._coalescedor", None)
+    monkeypatch.setattr("src.infrastructure.coalescencia._ventanas", None)
+    monkeypatch.setattr("src.services.eventos._despachador", None)
+    # la caché de respuestas tiene L1 en proceso: apagada salvo en sus tests
+    monkeypatch.setattr(settings, "CACHE_RESPUESTAS", False)
+
+
+@pytest.fixture()
+def fake_redis(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr("src.infrastructure.cache.get_redis_binario", lambda: fake)
+    monkeypatch.setattr("src.infrastructure.deduplicacion.get_redis_binario", lambda: fake)
+    monkeypatch.setattr("src.infrastructure.coalescencia.get_redis_binario", lambda: fake)
+    return fake
+
+
+@pytest.fixture()
+def cache_respuestas(monkeypatch, fake_redis):
+    """Caché de respuestas encendida, con L1 vacía y Redis en memoria."""
+    monkeypatch.setattr(settings, "CACHE_RESPUESTAS", True)
+    monkeypatch.setattr("src.infrastructure.cache._cache_respuestas", None)
+    get_metricas("cache_respuestas").reiniciar()
+    return fake_redis
@@ -0,0 +1,100 @@
+import random
+from decimal import Decimal, ROUND_HALF_UP
+
+from src.services.agregacion import ColumnasPedidos, _fijo
+from src.services.servicio_plan_ventas import calcular_progreso
+
+
+def _dec(v, d="0"):
+    return Decimal(str(v if v is not None else d))
+
+
+def _calcular_progreso_item_por_item(pedidos, *, id_vendedor, cliente_obj, productos_set):
+    """Recorrido original con Decimal por ítem: referencia de paridad."""
+    monto = Decimal("0")
+    unidades = 0
+    clientes = set()
+    pedidos_contados = 0
+    for p in pedidos:
+        if str(p.get("vendedor_id")) != id_vendedor:
+            continue
+        if cliente_obj and str(p.get("cliente_id")) != cliente_obj:
+            continue
+        items_plan = [it for it in p.get("items", []) if str(it.get("producto_id")) in productos_set]
+        if not items_plan:
+            continue
+        total_pedido_aportado = Decimal("0")
+        unidades_pedido_aportadas = 0
+        for it in items_plan:
+            cant = int(it.get("cantidad", 0))
+            pu = _dec(it.get("precio_unitario"))
+            dsc = _dec(it.get("descuento_pct")) / 100
+            imp = _dec(it.get("impuesto_pct")) / 100
+            total_pedido_aportado += pu * cant * (Decimal("1") - dsc) * (Decimal("1") + imp)
+            unidades_pedido_aportadas += cant
+        if unidades_pedido_aportadas > 0:
+            pedidos_contados += 1
+            clientes.add(p.get("cliente_id"))
+            monto += total_pedido_aportado
+            unidades += unidades_pedido_aportadas
+    return monto, unidades, len(clientes), pedidos_contados
+
+
+def _valor(rnd, decimales):
+    # mismos valores en los formatos que puede mandar ms-pedidos: int, float, str, None
+    entero = rnd.randint(0, 5000)
+    frac = rnd.randint(0, 10 ** decimales - 1) if decimales else 0
+    texto = f"{entero}.{frac:0{decimales}d}" if decimales else str(entero)
+    return rnd.choice([texto, float(texto), None if rnd.random() < 0.05 else texto, entero])
+
+
+def _pedidos(semilla, n=400):
+    rnd = random.Random(semilla)
+    pedidos = []
+    for _ in range(n):
+        pedidos.append({
+            "vendedor_id": rnd.choice(["V1", "V2", "V3"]),
+            "cliente_id": rnd.choice(["C1", "C2", "C3", 7]),
+            "items": [
+                {
+                    "producto_id": rnd.choice(["P1", "P2", "P3", "P4", 5]),
+                    "cantidad": rnd.choice([0, 1, 2, 3, 10, 250, "4"]),
+                    "precio_unitario": _valor(rnd, rnd.choice([0, 2, 4])),
+                    "descuento_pct": _valor(rnd, 1) if rnd.random() < 0.5 else None,
+                    "impuesto_pct": rnd.choice([19, "16", 0, "12.5", None]),
+                }
+                for _ in range(rnd.randint(0, 6))
+            ],
+        })
+    return pedidos
+
+
+def test_fijo_lee_igual_que_decimal():
+    for v in [None, 0, 12, "12.50", "-0.5", ".25", "3.", 1.1, 1e-05, "2E+3", " 7 "]:
+        mantisa, decimales = _fijo(v)
+        assert Decimal(mantisa).scaleb(-decimales) == _dec(v)
+
+
+def test_paridad_con_recorrido_item_por_item():
+    planes = [
+        ("V1", "C1", {"P1"}),
+        ("V1", "C2", {"P1", "P2", "P3"}),
+        ("V2", None, {"P2", "5"}),
+        ("V3", "7", {"P4", "P1"}),
+        ("V9", "C1", {"P1"}),
+        ("V1", "C1", set()),
+    ]
+    for semilla in range(5):
+        pedidos = _pedidos(semilla)
+        columnas = ColumnasPedidos(pedidos)
+        for vendedor, cliente, productos in planes:
+            esperado = _calcular_progreso_item_por_item(
+                pedidos, id_vendedor=vendedor, cliente_obj=cliente, productos_set=productos
+            )
+            for obtenido in (
+                columnas.agregar(vendedor, cliente, productos),
+                calcular_progreso(pedidos, id_vendedor=vendedor, cliente_obj=cliente, productos_set=productos),
+            ):
+                assert obtenido == esperado
+                centavos = Decimal("0.01")
+                assert obtenido[0].quantize(centavos, ROUND_HALF_UP) == esperado[0].quantize(centavos, ROUND_HALF_UP)
@@ -0,0 +1,152 @@
+# tests/test_async.py
+import tempfile
+import threading
+from datetime import date
+
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from contextlib import asynccontextmanager
+
+from src.dependencies import Lectura, get_async_session, get_async_read_session, get_lectura
+from src.domain.models import Base
+from src.domain.schemas import PlanDeVentasCrear
+from src.routes.planes_async import router as planes_async_router
+from src.routes.visitas_async import router as visitas_async_router
+from src.services.servicio_plan_ventas_async import ServicioPlanDeVentasAsync
+
+# BD SQLite propia para la ruta async (aiosqlite), con el mismo esquema que la sync
+_tmp = tempfile.NamedTemporaryFile(prefix="msvcrm_async_", suffix=".db", delete=False)
+Base.metadata.create_all(bind=create_engine(f"sqlite:///{_tmp.name}"))
+engine_async = create_async_engine(f"sqlite+aiosqlite:///{_tmp.name}")
+AsyncSessionTest = async_sessionmaker(bind=engine_async, autoflush=False, expire_on_commit=False)
+
+
+def _app_async() -> FastAPI:
+    app = FastAPI()
+    app.include_router(planes_async_router)
+    app.include_router(visitas_async_router)
+
+    async def _get_async_session_override():
+        async with AsyncSessionTest() as session:
+            yield session
+            await session.commit()
+
+    class _Lectura(Lectura):
+        @asynccontextmanager
+        async def sesion_async(self, primario=False):
+            async with AsyncSessionTest() as session:
+                yield session
+
+    app.dependency_overrides[get_async_session] = _get_async_session_override
+    app.dependency_overrides[get_async_read_session] = _get_async_session_override
+    app.dependency_overrides[get_lectura] = lambda: _Lectura("co", replica=True)
+    return app
+
+
+@pytest.mark.asyncio
+async def test_servicio_async_crear_y_obtener():
+    async with AsyncSessionTest() as db:
+        svc = ServicioPlanDeVentasAsync(db, "co")
+        plan = await svc.crear(PlanDeVentasCrear(
+            id_vendedor="VEN-A",
+            fecha_inicio=date(2025, 1, 1),
+            fecha_fin=date(2025, 12, 31),
+            ids_productos=["P1"],
+            id_cliente_objetivo="CLI-A",
+        ))
+        plan = await svc.obtener(plan.id)
+
+        assert plan.id_vendedor == "VEN-A"
+        assert [p.id_producto for p in plan.productos] == ["P1"]
+        assert await svc.obtener_progreso(plan.id) == []
+        await db.rollback()
+
+
+@pytest.mark.asyncio
+async def test_rutas_async_planes_y_visitas():
+    transport = ASGITransport(app=_app_async())
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        r = await ac.post("/v1/ventas/planes", json={
+            "id_vendedor": "seller-async",
+            "fecha_inicio": "2025-10-01",
+            "fecha_fin": "2025-10-31",
+            "ids_productos": ["PX", "PY"],
+            "id_cliente_objetivo": "CLI-X",
+        })
+        assert r.status_code == 200, r.text
+        assert sorted(r.json()["ids_productos"]) == ["PX", "PY"]
+
+        r = await ac.get("/v1/ventas/planes/vendedor/seller-async")
+        assert r.status_code == 200
+        assert [p["id_vendedor"] for p in r.json()] == ["seller-async"]
+
+        visita = {
+            "id_vendedor": "seller-async",
+            "id_cliente": "cli-async",
+            "direccion": "Calle 9",
+            "ciudad": "Quito",
+            "contacto": "Sofía",
+            "fecha": "2025-10-25",
+        }
+        r1 = await ac.post("/v1/visitas", json=visita)
+        assert r1.status_code == 200, r1.text
+        r2 = await ac.post("/v1/visitas", json=visita)
+        assert r2.status_code == 400
+
+        r3 = await ac.get(f"/v1/visitas/{r1.json()['id']}")
+        assert r3.status_code == 200
+        assert r3.json()["estado"] == "pendiente"
+
+        r4 = await ac.get("/v1/visitas/no-existe")
+        assert r4.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_exportar_async_por_lotes(monkeypatch):
+    from contextlib import asynccontextmanager
+    import src.services.exportacion as exportacion
+
+    @asynccontextmanager
+    async def _session(_schema, solo_lectura=False):
+        async with AsyncSessionTest() as session:
+            yield session
+
+    monkeypatch.setattr(exportacion, "async_session_for_schema", _session)
+    monkeypatch.setattr(exportacion, "TAMANO_LOTE", 1)
+
+    transport = ASGITransport(app=_app_async())
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        for i in range(2):
+            r = await ac.post("/v1/ventas/planes", json={
+                "id_vendedor": f"seller-exp-async-{i}",
+                "fecha_inicio": "2025-11-01",
+                "fecha_fin": "2025-11-30",
+                "ids_productos": ["PZ"],
+                "id_cliente_objetivo": "CLI-Z",
+            })
+            assert r.status_code == 200, r.text
+
+        r = await ac.get("/v1/ventas/planes/exportar", params={"formato": "csv"})
+        assert r.status_code == 200
+        lineas = r.text.splitlines()
+        assert lineas[0].startswith("id,")
+        assert sum("seller-exp-async-" in linea for linea in lineas[1:]) == 2
+
+
+@pytest.mark.asyncio
+async def test_recalcular_async_publica_fuera_del_event_loop(monkeypatch):
+    from src.config import settings
+
+    monkeypatch.setattr(settings, "TOPIC_VENTAS_CRM", "projects/test/topics/ventas-crm")
+    hilos = []
+    monkeypatch.setattr("src.routes.planes_async.publish_event", lambda *a: hilos.append(threading.current_thread()))
+
+    transport = ASGITransport(app=_app_async())
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        r = await ac.post("/v1/ventas/planes/recalcular", params={"d": "2025-10-21"})
+    assert r.status_code == 202
+    assert hilos and hilos[0] is not threading.current_thread()
@@ -0,0 +1,75 @@
+# tests/test_bootstrap.py
+from sqlalchemy import create_engine, inspect, text
+
+import src.infrastructure.bootstrap as bootstrap
+
+
+def _engines_sqlite(tmp_path, schemas):
+    return {s: create_engine(f"sqlite:///{tmp_path / f'{s}.db'}") for s in schemas}
+
+
+def test_huella_es_estable():
+    assert bootstrap.huella_metadata() == bootstrap.huella_metadata()
+    assert len(bootstrap.huella_metadata()) == 64
+
+
+def test_bootstrap_paralelo_y_salta_schemas_vigentes(tmp_path, monkeypatch):
+    engines = _engines_sqlite(tmp_path, ["co", "mx"])
+    monkeypatch.setattr(bootstrap, "engine_con_schema", lambda s: engines[s])
+    monkeypatch.setattr(bootstrap, "inicializar_schema", lambda s: None)
+    monkeypatch.setattr(bootstrap, "marcar_schema_listo", lambda s: None)
+
+    primera = bootstrap.inicializar_schemas(["co", "mx"])
+    assert [r["estado"] for r in primera] == ["actualizado", "actualizado"]
+    assert "plan_de_ventas" in inspect(engines["co"]).get_table_names()
+    assert all(r["duracion_ms"] >= 0 for r in primera)
+
+    segunda = bootstrap.inicializar_schemas(["co", "mx"])
+    assert [r["estado"] for r in segunda] == ["vigente", "vigente"]
+
+
+def test_bootstrap_reporta_error_por_schema(tmp_path, monkeypatch):
+    engines = _engines_sqlite(tmp_path, ["co"])
+
+    def _engine(s):
+        if s == "pe":
+            raise RuntimeError("sin conexión")
+        return engines[s]
+
+    monkeypatch.setattr(bootstrap, "engine_con_schema", _engine)
+    monkeypatch.setattr(bootstrap, "inicializar_schema", lambda s: None)
+
+    res = {r["schema"]: r for r in bootstrap.inicializar_schemas(["co", "pe"])}
+    assert res["co"]["estado"] == "actualizado"
+    assert res["pe"]["estado"] == "error"
+    assert "sin conexión" in res["pe"]["error"]
+
+
+def test_bootstrap_elimina_progreso_duplicado_y_agrega_columnas_faltantes(tmp_path, monkeypatch):
+    engines = _engines_sqlite(tmp_path, ["co"])
+    eng = engines["co"]
+    monkeypatch.setattr(bootstrap, "engine_con_schema", lambda s: eng)
+    monkeypatch.setattr(bootstrap, "inicializar_schema", lambda s: None)
+    monkeypatch.setattr(bootstrap, "marcar_schema_listo", lambda s: None)
+
+    # tabla previa al índice único, con dos filas para el mismo plan/día
+    with eng.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE progreso_plan_de_ventas (id INTEGER PRIMARY KEY, id_plan VARCHAR(36), fecha DATE, "
+            "monto_actual NUMERIC(14, 2), unidades_actuales INTEGER, clientes_actuales INTEGER, pedidos_contados INTEGER)"
+        ))
+        conn.execute(text(
+            "INSERT INTO progreso_plan_de_ventas (id, id_plan, fecha, unidades_actuales) VALUES "
+            "(1, 'P', '2025-10-01', 1), (2, 'P', '2025-10-01', 2), (3, 'P', '2025-10-02', 5)"
+        ))
+
+    assert bootstrap.inicializar_schemas(["co"])[0]["estado"] == "actualizado"
+
+    with eng.connect() as conn:
+        filas = conn.execute(text("SELECT id, unidades_actuales FROM progreso_plan_de_ventas ORDER BY id")).all()
+    assert [tuple(f) for f in filas] == [(2, 2), (3, 5)]
+    indices = {i["name"]: i for i in inspect(eng).get_indexes("progreso_plan_de_ventas")}
+    assert indices["uq_progreso_plan_fecha"]["unique"]
+    # columnas nuevas del modelo sobre la tabla existente
+    columnas = {c["name"] for c in inspect(eng).get_columns("progreso_plan_de_ventas")}
+    assert "actualizado_en" in columnas
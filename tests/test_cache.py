@@ -0,0 +1,192 @@
+import threading
+import time
+from datetime import date, timedelta
+
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from src.config import settings
+from src.infrastructure.cache import (
+    LRU,
+    CachePedidos,
+    CacheRespuestas,
+    comprimir,
+    descomprimir,
+    invalidar_respuestas,
+    ratios_cache_respuestas,
+)
+from src.infrastructure.metricas import get_metricas
+from src.services.lector_pedidos import LectorPedidos
+
+
+class _Cliente:
+    pais = "co"
+
+    def __init__(self, pedidos, demora=0.0):
+        self.pedidos = pedidos
+        self.demora = demora
+        self.llamadas = 0
+        self._lock = threading.Lock()
+
+    def get(self, path, params=None):
+        with self._lock:
+            self.llamadas += 1
+        time.sleep(self.demora)
+        return self.pedidos[params["offset"]:params["offset"] + params["limit"]]
+
+
+PARAMS = {"tipo": "VENTA", "fecha_compromiso": "2025-10-21"}
+
+
+def test_clave_ignora_paginacion_y_ttl_por_fecha():
+    assert CachePedidos.clave("co", {**PARAMS, "limit": 200, "offset": 400}) == CachePedidos.clave("co", PARAMS)
+    assert CachePedidos.clave("co", PARAMS) != CachePedidos.clave("mx", PARAMS)
+
+    hoy = date(2025, 10, 21)
+    assert CachePedidos.ttl({"fecha_compromiso": "2025-10-20"}, hoy) == settings.PEDIDOS_CACHE_TTL_PASADO
+    assert CachePedidos.ttl({"fecha_compromiso": "2025-10-21"}, hoy) == settings.PEDIDOS_CACHE_TTL_ACTUAL
+    rango = {"fecha_compromiso_desde": "2025-09-01", "fecha_compromiso_hasta": "2025-10-21"}
+    assert CachePedidos.ttl(rango, hoy) == settings.PEDIDOS_CACHE_TTL_ACTUAL
+
+
+def test_compresion_ida_y_vuelta():
+    pedidos = [{"id": i, "items": [{"producto_id": "P1", "cantidad": 2}]} for i in range(200)]
+    datos = comprimir(pedidos)
+    assert descomprimir(datos) == pedidos
+    assert len(datos) < len(str(pedidos)) / 5
+
+
+def test_lector_read_through_con_fake_redis(fake_redis):
+    client = _Cliente([{"id": i} for i in range(5)])
+    metricas = get_metricas("cache_pedidos")
+    hits_antes = metricas.contador("hit")
+
+    primero = LectorPedidos(client)
+    assert len(list(primero.leer(PARAMS))) == 5
+    assert not primero.desde_cache
+
+    segundo = LectorPedidos(client)
+    assert [p["id"] for p in segundo.leer(PARAMS)] == [0, 1, 2, 3, 4]
+    assert segundo.desde_cache
+    assert segundo.paginas == 0
+    assert client.llamadas == 1
+    assert metricas.contador("hit") == hits_antes + 1
+
+    clave = CachePedidos.clave("co", PARAMS)
+    # fecha pasada → TTL largo; el lock ya se liberó
+    assert fake_redis.ttl(clave) > settings.PEDIDOS_CACHE_TTL_ACTUAL
+    assert not fake_redis.exists(f"{clave}:lock")
+
+
+def test_lector_anti_stampede(fake_redis):
+    client = _Cliente([{"id": i} for i in range(3)], demora=0.2)
+    resultados = []
+
+    def _leer():
+        resultados.append(len(list(LectorPedidos(client).leer(PARAMS))))
+
+    hilos = [threading.Thread(target=_leer) for _ in range(5)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+
+    assert resultados == [3] * 5
+    assert client.llamadas == 1
+
+
+class _RedisCaido:
+    def __getattr__(self, nombre):
+        def _falla(*args, **kwargs):
+            raise RedisConnectionError("sin redis")
+        return _falla
+
+
+def test_lector_degrada_a_origen_si_redis_falla(monkeypatch):
+    monkeypatch.setattr("src.infrastructure.cache.get_redis_binario", lambda: _RedisCaido())
+    client = _Cliente([{"id": 1}])
+    ayer = {"tipo": "VENTA", "fecha_compromiso": (date.today() - timedelta(days=1)).isoformat()}
+
+    assert len(list(LectorPedidos(client).leer(ayer))) == 1
+    assert len(list(LectorPedidos(client).leer(ayer))) == 1
+    assert client.llamadas == 2
+
+
+def test_lru_expulsa_al_menos_usado_y_vence_por_ttl(monkeypatch):
+    lru = LRU(max_items=2, ttl=60)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    lru.get("a")
+    lru.set("c", 3)
+    assert (lru.get("a"), lru.get("b"), lru.get("c")) == (1, None, 3)
+
+    lru = LRU(max_items=2, ttl=0)
+    lru.set("a", 1)
+    assert lru.get("a") is None
+
+
+def test_cache_respuestas_comparte_l2_e_invalida_entre_instancias(cache_respuestas, monkeypatch):
+    monkeypatch.setattr(settings, "CACHE_L1_TTL_GENERACION", 0)
+    a, b = CacheRespuestas(), CacheRespuestas()
+    params = {"activo": True, "limite": 50, "cursor": None}
+
+    clave = a.clave("planes", "co", "planes", params)
+    assert a.leer("planes", clave) is None
+    a.guardar(clave, {"cuerpo": "[]", "cursor": None})
+    assert a.clave("planes", "co", "planes", {**params, "limite": 10}) != clave
+    assert a.clave("planes", "mx", "planes", params) != clave
+
+    # otra instancia: miss en su L1, hit en Redis
+    assert b.leer("planes", b.clave("planes", "co", "planes", params)) == {"cuerpo": "[]", "cursor": None}
+
+    # la escritura en una instancia cambia la generación para todas
+    b.invalidar("co", "planes")
+    assert a.clave("planes", "co", "planes", params) != clave
+    assert a.generacion("co", "planes") == 1
+    assert a.generacion("co", "visitas") == 0
+
+    rutas = ratios_cache_respuestas()
+    assert rutas["planes"] == {"hit_l1": 0, "hit_l2": 1, "miss": 1, "ratio": 0.5}
+
+
+def test_cache_respuestas_sin_redis_usa_l1_y_generaciones_locales(cache_respuestas, monkeypatch):
+    class _RedisCaido:
+        def __getattr__(self, nombre):
+            def _falla(*args, **kwargs):
+                raise RedisConnectionError("caído")
+            return _falla
+
+    monkeypatch.setattr("src.infrastructure.cache.get_redis_binario", lambda: _RedisCaido())
+    cache = CacheRespuestas()
+    clave = cache.clave("visitas", "co", "visitas", {})
+    cache.guardar(clave, {"cuerpo": "[1]", "cursor": None})
+    assert cache.leer("visitas", clave) == {"cuerpo": "[1]", "cursor": None}
+
+    cache.invalidar("co", "visitas")
+    assert cache.clave("visitas", "co", "visitas", {}) != clave
+    assert get_metricas("cache_respuestas").contador("error", "invalidar") == 1
+
+
+def test_invalidar_respuestas_repite_tras_el_commit(cache_respuestas, monkeypatch):
+    import pytest
+    from sqlalchemy import create_engine
+
+    import src.infrastructure.infrastructure as infra
+    from src.dependencies import session_for_schema  # la real: conftest reemplaza la de infra
+    from src.infrastructure.cache import get_cache_respuestas
+
+    monkeypatch.setattr(infra, "engine_para_schema", lambda _schema: create_engine("sqlite://"))
+    cache = get_cache_respuestas()
+    # como en producción: conn.begin() confirma, la sesión nunca llama a commit()
+    with session_for_schema("co") as sesion:
+        invalidar_respuestas(sesion, "co", "planes", "planes:vendedor:v1")
+        assert cache.generacion("co", "planes") == 1
+    # lo cacheado entre la escritura y el commit queda bajo una generación vieja
+    assert cache.generacion("co", "planes") == 2
+    assert cache.generacion("co", "planes:vendedor:v1") == 2
+
+    # con rollback no hay segunda invalidación
+    with pytest.raises(RuntimeError):
+        with session_for_schema("co") as sesion:
+            invalidar_respuestas(sesion, "co", "planes")
+            raise RuntimeError("falla la escritura")
+    assert cache.generacion("co", "planes") == 3
\ No newline at end of file
@@ -0,0 +1,164 @@
+import threading
+
+import pytest
+
+from src.config import settings
+from src.infrastructure import infrastructure
+from src.infrastructure.coalescencia import Coalescedor, LockPostgres, clave_recalculo, reclamar_publicacion
+from src.infrastructure.metricas import get_metricas
+
+
+def _en_vuelo(coalescedor, clave):
+    """Arranca un trabajo que queda bloqueado hasta soltar `liberar`; devuelve (hilo, ejecuciones, liberar)."""
+    ejecuciones = []
+    dentro, liberar = threading.Event(), threading.Event()
+
+    def trabajo():
+        ejecuciones.append(1)
+        dentro.set()
+        liberar.wait(5)
+
+    hilo = threading.Thread(target=coalescedor.ejecutar, args=(clave, trabajo))
+    hilo.start()
+    assert dentro.wait(5)
+    return hilo, ejecuciones, liberar
+
+
+@pytest.mark.parametrize("con_redis", [False, True])
+def test_pedidos_durante_el_vuelo_se_fusionan_en_una_repeticion(con_redis, request):
+    if con_redis:
+        request.getfixturevalue("fake_redis")
+    get_metricas("coalescencia").reiniciar()
+    coalescedor = Coalescedor()
+    clave = "co:recalcular_plan_ventas:PLAN-1:2025-10-21"
+
+    hilo, ejecuciones, liberar = _en_vuelo(coalescedor, clave)
+    # tres entregas mientras el primero recalcula: ninguna ejecuta
+    assert [coalescedor.ejecutar(clave, lambda: ejecuciones.append(1)) for _ in range(3)] == [False] * 3
+    # otra clave no espera
+    assert coalescedor.ejecutar("co:recalcular_plan_ventas:PLAN-2:2025-10-21", lambda: None)
+
+    liberar.set()
+    hilo.join(5)
+    # una sola pasada extra por lo que llegó durante el vuelo
+    assert len(ejecuciones) == 2
+    metricas = get_metricas("coalescencia")
+    assert metricas.contador("fusionados") == 3
+    assert metricas.contador("repeticiones") == 1
+
+
+@pytest.mark.parametrize("con_redis", [False, True])
+def test_pedido_que_marca_despues_de_que_el_otro_termina_no_se_pierde(con_redis, request):
+    if con_redis:
+        request.getfixturevalue("fake_redis")
+    coalescedor = Coalescedor()
+    clave = "co:recalcular_plan_ventas:PLAN-1:2025-10-22"
+    hilo, ejecuciones, liberar = _en_vuelo(coalescedor, clave)
+    marcar = coalescedor._marcar_sucia
+
+    def marcar_tarde(c):
+        # la entrega no pudo tomar el lock; antes de marcar, el dueño suelta,
+        # hace su última comprobación (sin marca) y termina
+        liberar.set()
+        hilo.join(5)
+        marcar(c)
+
+    coalescedor._marcar_sucia = marcar_tarde
+    assert coalescedor.ejecutar(clave, lambda: ejecuciones.append(1))
+    assert len(ejecuciones) == 2
+
+
+def test_ventana_de_publicacion_se_libera_al_atender_el_evento():
+    event = {"event": "recalcular_plan_ventas", "plan_id": "PLAN-1", "fecha": "2025-10-21", "ctx": {"country": "co"}}
+    clave = clave_recalculo("recalcular_plan_ventas", event, "co")
+    assert reclamar_publicacion(event)
+    # otro clic con el evento aún en camino: se omite
+    assert not reclamar_publicacion(event)
+
+    Coalescedor().ejecutar(clave, lambda: None)
+    # el evento ya se atendió: un clic nuevo vuelve a publicar
+    assert reclamar_publicacion(event)
+
+
+def test_repeticiones_acotadas(monkeypatch):
+    monkeypatch.setattr(settings, "COALESCER_MAX_REPETICIONES", 2)
+    coalescedor = Coalescedor()
+    clave = "co:recalcular_planes_del_dia:2025-10-21"
+    ejecuciones = []
+
+    def trabajo():
+        ejecuciones.append(1)
+        # cada pasada recibe otro pedido concurrente
+        assert not coalescedor.ejecutar(clave, lambda: None)
+
+    assert coalescedor.ejecutar(clave, trabajo)
+    assert len(ejecuciones) == 3
+
+
+def test_error_suelta_el_lock(fake_redis):
+    coalescedor = Coalescedor()
+
+    def falla():
+        raise RuntimeError("ms-pedidos caído")
+
+    with pytest.raises(RuntimeError):
+        coalescedor.ejecutar("co:x", falla)
+    assert not fake_redis.exists("coal:lock:co:x")
+    assert coalescedor.ejecutar("co:x", lambda: None)
+
+
+def test_clave_recalculo():
+    assert clave_recalculo("recalcular_plan_ventas", {"plan_id": "P", "fecha": "2025-10-21"}, "co") == (
+        "co:recalcular_plan_ventas:P:2025-10-21"
+    )
+    assert clave_recalculo("recalcular_plan_ventas", {"plan_id": "P", "desde": "2025-10-01", "hasta": "2025-10-31"}, "mx") == (
+        "mx:recalcular_plan_ventas:P:2025-10-01..2025-10-31"
+    )
+    assert clave_recalculo("pedido_creado", {}, "co") is None
+
+
+def test_lock_redis_no_suelta_el_lock_de_otro(fake_redis):
+    from src.infrastructure.coalescencia import LockRedis
+
+    lock = LockRedis(fake_redis)
+    vencido = lock.tomar("co:x")
+    # el lock propio expiró y otro lo tomó: soltar con el token viejo no lo borra
+    fake_redis.delete("coal:lock:co:x")
+    actual = lock.tomar("co:x")
+    lock.soltar("co:x", vencido)
+    assert fake_redis.get("coal:lock:co:x") == actual.encode()
+    lock.soltar("co:x", actual)
+    assert not fake_redis.exists("coal:lock:co:x")
+
+
+def test_lock_postgres_no_usa_el_pool_de_trabajo(monkeypatch):
+    monkeypatch.setattr(infrastructure, "_locks_engine", None)
+    eng = infrastructure.get_locks_engine()
+    assert type(eng.pool).__name__ == "NullPool"
+    assert eng.get_execution_options()["isolation_level"] == "AUTOCOMMIT"
+
+    usadas = []
+    monkeypatch.setattr(infrastructure, "get_locks_engine", lambda: usadas.append(1) or _EngineLock())
+    lock = LockPostgres()
+    conn = lock.tomar("co:recalcular_planes_del_dia:2025-10-21")
+    lock.soltar("co:recalcular_planes_del_dia:2025-10-21", conn)
+    assert usadas == [1] and conn.cerrada
+    assert infrastructure.engine.pool.checkedout() == 0
+
+
+class _EngineLock:
+    def connect(self):
+        return _ConexionLock()
+
+
+class _ConexionLock:
+    cerrada = False
+
+    def scalar(self, *_a, **_k):
+        return True
+
+    def execute(self, *_a, **_k):
+        return None
+
+    def close(self):
+        self.cerrada = True
@@ -0,0 +1,128 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.config import settings
+from src.infrastructure.metricas import get_metricas
+from src.services.eventos import Despachador, Handler, _HANDLERS
+
+
+def _evento(tipo, n, country="co"):
+    return {"event": tipo, "n": n, "ctx": {"country": country}}
+
+
+def test_handlers_registrados_por_tipo():
+    assert {"recalcular_plan_ventas", "recalcular_planes_del_dia", "pedido_creado", "pedido_cancelado"} <= set(_HANDLERS)
+    assert _HANDLERS["pedido_creado"].funcion is _HANDLERS["pedido_actualizado"].funcion
+
+
+@pytest.mark.asyncio
+async def test_rafaga_de_un_tipo_no_bloquea_a_los_demas():
+    liberar = threading.Event()
+    lock = threading.Lock()
+    en_curso = {"lento": 0, "max": 0}
+    rapidos = []
+
+    def lento(event_type, event, country, log_prefix):
+        with lock:
+            en_curso["lento"] += 1
+            en_curso["max"] = max(en_curso["max"], en_curso["lento"])
+        liberar.wait(5)
+        with lock:
+            en_curso["lento"] -= 1
+
+    def rapido(event_type, event, country, log_prefix):
+        rapidos.append(event["n"])
+
+    despachador = Despachador({
+        "lento": Handler("lento", lento, max_concurrencia=2),
+        "rapido": Handler("rapido", rapido),
+    })
+    rafaga = [asyncio.create_task(despachador.despachar(_evento("lento", n), f"l-{n}", "test")) for n in range(6)]
+    await asyncio.sleep(0.05)
+
+    # con los hilos del tipo lento ocupados, el otro tipo se atiende igual
+    await asyncio.wait_for(despachador.despachar(_evento("rapido", 1), "r-1", "test"), timeout=1)
+    assert rapidos == [1]
+    assert despachador.estado()["lento"]["en_curso"] == 2
+
+    liberar.set()
+    await asyncio.gather(*rafaga)
+    assert en_curso["max"] == 2
+    assert get_metricas("pubsub").snapshot()["histogramas"]["espera_ms"]["lento"]["total"] == 6
+
+
+@pytest.mark.asyncio
+async def test_errores_y_latencia_por_tipo():
+    metricas = get_metricas("pubsub")
+    metricas.reiniciar()
+
+    def negocio(event_type, event, country, log_prefix):
+        raise ValueError("plan inexistente")
+
+    def roto(event_type, event, country, log_prefix):
+        raise RuntimeError("BD caída")
+
+    despachador = Despachador({
+        "negocio": Handler("negocio", negocio),
+        "roto": Handler("roto", roto),
+    })
+    # nunca propaga: el mensaje se da por atendido
+    await despachador.despachar(_evento("negocio", 1), "n-1", "test")
+    await despachador.despachar(_evento("roto", 1), "r-1", "test")
+    await despachador.despachar(_evento("desconocido", 1), "d-1", "test")
+
+    assert metricas.contador("errores_negocio", "negocio") == 1
+    assert metricas.contador("errores", "roto") == 1
+    assert metricas.contador("ignorados", "desconocido") == 1
+    duracion = metricas.snapshot()["histogramas"]["duracion_ms"]
+    assert duracion["negocio"]["total"] == duracion["roto"]["total"] == 1
+    assert despachador.estado()["roto"]["en_curso"] == 0
+
+
+@pytest.mark.asyncio
+async def test_tipo_saturado_no_deja_sin_hilos_a_los_demas():
+    # executor por defecto del loop (el de asyncio.to_thread) de 1 hilo y ocupado
+    loop = asyncio.get_running_loop()
+    por_defecto = ThreadPoolExecutor(max_workers=1)
+    loop.set_default_executor(por_defecto)
+    liberar = threading.Event()
+    ocupado = asyncio.ensure_future(asyncio.to_thread(liberar.wait, 5))
+
+    hilos = []
+
+    def lento(event_type, event, country, log_prefix):
+        liberar.wait(5)
+
+    def pedido(event_type, event, country, log_prefix):
+        hilos.append(threading.current_thread().name)
+
+    despachador = Despachador({
+        "lento": Handler("lento", lento, max_concurrencia=3),
+        "pedido_creado": Handler("pedido_creado", pedido, max_concurrencia=1),
+    })
+    try:
+        rafaga = [asyncio.create_task(despachador.despachar(_evento("lento", n), f"l-{n}", "test")) for n in range(5)]
+        await asyncio.sleep(0.05)
+        assert despachador.estado()["lento"]["en_curso"] == 3
+
+        await asyncio.wait_for(despachador.despachar(_evento("pedido_creado", 1), "p-1", "test"), timeout=1)
+        assert hilos and hilos[0].startswith("evento-pedido_creado")
+    finally:
+        liberar.set()
+        await asyncio.gather(ocupado, *rafaga)
+        despachador.cerrar()
+        por_defecto.shutdown()
+
+
+def test_limite_configurable_por_entorno(monkeypatch):
+    monkeypatch.setattr(settings, "EVENTOS_CONCURRENCIA", "recalcular_plan_ventas=1, pedido_creado=16")
+    monkeypatch.setattr(settings, "EVENTOS_CONCURRENCIA_DEFECTO", 3)
+    despachador = Despachador()
+
+    assert despachador.limite("recalcular_plan_ventas") == 1
+    assert despachador.limite("pedido_creado") == 16
+    assert despachador.limite("recalcular_planes_del_dia") == 2
+    assert despachador.limite("otro") == 3
@@ -1,5 +1,13 @@
 # tests/test_http_client.py
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import patch, MagicMock
+
+import pytest
+
+import src.infrastructure.http as http
+from src.config import settings
 from src.infrastructure.http import MsClient
 
 class _Resp:
@@ -13,16 +21,16 @@ class _Resp:
     def json(self):
         return self._json
 
-@patch("src.infrastructure.http.requests.get")
-def test_msclient_get_ok(mock_get):
-    mock_get.return_value = _Resp(status=200, json={"ok": True})
+@patch("src.infrastructure.http.get_http_session")
+def test_msclient_get_ok(mock_session):
+    mock_session.return_value.get.return_value = _Resp(status=200, json={"ok": True})
     c = MsClient("co")
     out = c.get("/v1/ping")
     assert out == {"ok": True}
 
-@patch("src.infrastructure.http.requests.post")
-def test_msclient_post_error_lanza(mock_post):
-    mock_post.return_value = _Resp(status=422, json=None, text="bad", method="POST", url="http://gw/v1/x")
+@patch("src.infrastructure.http.get_http_session")
+def test_msclient_post_error_lanza(mock_session):
+    mock_session.return_value.post.return_value = _Resp(status=422, json=None, text="bad", method="POST", url="http://gw/v1/x")
     c = MsClient("co")
     try:
         c.post("/v1/x", json={"a": 1})
@@ -30,3 +38,87 @@ def test_msclient_post_error_lanza(mock_post):
     except ValueError as e:
         assert "HTTP 422" in str(e)
         assert "/v1/x" in str(e)
+
+
+
+class _Gateway(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    fallos_pendientes = 0
+    retry_after: str | None = None
+    peticiones: list[str] = []
+
+    def _responder(self):
+        _Gateway.peticiones.append(self.command)
+        if _Gateway.fallos_pendientes:
+            _Gateway.fallos_pendientes -= 1
+            status, body = 503, b"ocupado"
+        else:
+            status, body = 200, json.dumps({"ok": True}).encode()
+        self.send_response(status)
+        if status == 503 and _Gateway.retry_after:
+            self.send_header("Retry-After", _Gateway.retry_after)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._responder()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self._responder()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture()
+def gateway(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Gateway)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    _Gateway.fallos_pendientes = 0
+    _Gateway.retry_after = None
+    _Gateway.peticiones = []
+    monkeypatch.setattr(settings, "GATEWAY_BASE_URL", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setattr(settings, "HTTP_BACKOFF", 0.001)
+    monkeypatch.setattr(settings, "HTTP_BACKOFF_JITTER", 0.0)
+    http.cerrar_http_session()
+    yield _Gateway
+    http.cerrar_http_session()
+    server.shutdown()
+    server.server_close()
+
+
+def test_msclient_reutiliza_conexion_keep_alive(gateway):
+    c = MsClient("co")
+    for _ in range(5):
+        assert c.get("/v1/ping") == {"ok": True}
+
+    estado = http.estado_http()
+    assert estado["peticiones"] == 5
+    assert estado["conexiones_nuevas"] == 1
+    assert estado["reutilizadas"] == 4
+
+
+def test_msclient_get_reintenta_503_y_post_no(gateway):
+    gateway.fallos_pendientes = 2
+    assert MsClient("co").get("/v1/pedidos") == {"ok": True}
+    assert gateway.peticiones == ["GET", "GET", "GET"]
+
+    gateway.peticiones = []
+    gateway.fallos_pendientes = 1
+    with pytest.raises(ValueError, match="HTTP 503"):
+        MsClient("co").post("/v1/x", json={"a": 1})
+    assert gateway.peticiones == ["POST"]
+
+
+def test_retry_after_acotado(gateway, monkeypatch):
+    import time
+
+    monkeypatch.setattr(settings, "HTTP_RETRY_AFTER_MAXIMO", 0.01)
+    gateway.fallos_pendientes = 1
+    gateway.retry_after = "3600"
+    inicio = time.perf_counter()
+    assert MsClient("co").get("/v1/pedidos") == {"ok": True}
+    assert time.perf_counter() - inicio < 2
+
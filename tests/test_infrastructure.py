@@ -0,0 +1,208 @@
+# tests/test_infrastructure.py
+import asyncio
+import json
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import String, create_engine, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import DeclarativeBase, Mapped, Session, mapped_column
+from sqlalchemy.pool import StaticPool
+
+import src.infrastructure.infrastructure as infra
+from src.dependencies import get_schema
+from src.errors import ValidationError
+
+
+def test_resolver_schema_normaliza_y_valida():
+    assert infra.resolver_schema(" CO ") == "co"
+    assert infra.resolver_schema(None) == infra.settings.DEFAULT_SCHEMA
+    with pytest.raises(ValidationError):
+        infra.resolver_schema("zz")
+
+
+def test_get_schema_pais_desconocido_400():
+    with pytest.raises(HTTPException) as exc:
+        get_schema("zz")
+    assert exc.value.status_code == 400
+
+
+def test_schema_se_inicializa_una_sola_vez(monkeypatch):
+    fake_engine = MagicMock()
+    monkeypatch.setattr(infra, "engine", fake_engine)
+    monkeypatch.setattr(infra, "_schemas_listos", set())
+    monkeypatch.setattr(infra, "_engines_por_schema", {})
+
+    eng1 = infra.engine_para_schema("mx")
+    eng2 = infra.engine_para_schema("mx")
+
+    assert eng1 is eng2
+    fake_engine.begin.assert_called_once()
+    fake_engine.execution_options.assert_called_once_with(schema_translate_map={None: "mx"})
+
+
+def test_engine_para_schema_rechaza_desconocido(monkeypatch):
+    fake_engine = MagicMock()
+    monkeypatch.setattr(infra, "engine", fake_engine)
+    monkeypatch.setattr(infra, "_engines_por_schema", {})
+    with pytest.raises(ValidationError):
+        infra.engine_para_schema("xx")
+    fake_engine.begin.assert_not_called()
+
+
+def _request(method: str, user: str = "u-1"):
+    from starlette.requests import Request
+    return Request({
+        "type": "http",
+        "method": method,
+        "headers": [(b"x-user-id", user.encode())],
+        "client": ("10.0.0.1", 1234),
+    })
+
+
+def test_registro_escrituras_ventana():
+    reg = infra.RegistroEscrituras(max_claves=2)
+    reg.registrar("co:a")
+    assert reg.escritura_reciente("co:a", ventana=60)
+    assert not reg.escritura_reciente("co:a", ventana=0)
+    reg.registrar("co:b")
+    reg.registrar("co:c")
+    # LRU acotado: la clave más antigua se descarta
+    assert not reg.escritura_reciente("co:a", ventana=60)
+
+
+class _BaseNotas(DeclarativeBase):
+    pass
+
+
+class _Nota(_BaseNotas):
+    __tablename__ = "notas"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    texto: Mapped[str] = mapped_column(String(20))
+
+
+def _usar(dependencia, trabajo=lambda session: None):
+    """Recorre una dependencia con yield como FastAPI: abre, usa la sesión y cierra."""
+    session = next(dependencia)
+    trabajo(session)
+    next(dependencia, None)
+
+
+def test_read_session_usa_replica_salvo_escritura_reciente(monkeypatch):
+    import src.dependencies as deps
+
+    eng = create_engine("sqlite://", poolclass=StaticPool)
+    _BaseNotas.metadata.create_all(eng)
+    llamadas = []
+
+    @contextmanager
+    def _session_for_schema(schema, solo_lectura=False):
+        # como session_for_schema: commit al salir de conn.begin() y después tras_commit
+        llamadas.append((schema, solo_lectura))
+        with eng.connect() as conn:
+            with conn.begin():
+                with Session(bind=conn) as session:
+                    info = session.info
+                    yield session
+            infra.ejecutar_tras_commit(info)
+
+    monkeypatch.setattr(deps, "session_for_schema", _session_for_schema)
+    monkeypatch.setattr(deps, "registro_escrituras", infra.RegistroEscrituras())
+
+    # GET sin escrituras previas → réplica
+    _usar(deps.get_read_session(_request("GET", "lector"), "co"))
+    assert llamadas[-1] == ("co", True)
+
+    # un POST que solo lee (p. ej. /recalcular) no manda sus lecturas al primario
+    _usar(deps.get_session(_request("POST", "lector"), "co"), lambda s: s.execute(select(_Nota)).all())
+    _usar(deps.get_read_session(_request("GET", "lector"), "co"))
+    assert llamadas[-1] == ("co", True)
+
+    # un POST que escribe (flush del ORM) sí → las lecturas siguientes van al primario
+    _usar(deps.get_session(_request("POST", "lector"), "co"), lambda s: (s.add(_Nota(id=1, texto="a")), s.flush()))
+    _usar(deps.get_read_session(_request("GET", "lector"), "co"))
+    assert llamadas[-1] == ("co", False)
+
+    # Otro llamante sigue leyendo de la réplica
+    _usar(deps.get_read_session(_request("GET", "otro"), "co"))
+    assert llamadas[-1] == ("co", True)
+
+    # DML explícito (upserts) también cuenta como escritura
+    _usar(
+        deps.get_session(_request("POST", "otro"), "co"),
+        lambda s: s.execute(sqlite_insert(_Nota).values(id=1, texto="b").on_conflict_do_nothing()),
+    )
+    _usar(deps.get_read_session(_request("GET", "otro"), "co"))
+    assert llamadas[-1] == ("co", False)
+
+
+def test_sin_replica_configurada_no_hay_engine_de_lectura(monkeypatch):
+    monkeypatch.setattr(infra.settings, "SQLALCHEMY_REPLICA_DATABASE_URI", None)
+    monkeypatch.setattr(infra, "_replica_engines_por_schema", {})
+    assert infra.replica_para_schema("co") is None
+
+
+class _PublisherFalso:
+    def __init__(self):
+        self.futuros = []
+        self.detenido = False
+
+    def publish(self, topic, data):
+        futuro = Future()
+        self.futuros.append((topic, data, futuro))
+        return futuro
+
+    def stop(self):
+        self.detenido = True
+
+
+@pytest.fixture()
+def publisher_falso(monkeypatch):
+    falso = _PublisherFalso()
+    monkeypatch.setattr(infra, "_publisher", falso)
+    monkeypatch.setattr(infra, "_publicaciones_pendientes", set())
+    infra.get_metricas("publicacion").reiniciar()
+    return falso
+
+
+def test_publish_event_devuelve_futuro_y_registra_resultado(publisher_falso):
+    ok = infra.publish_event({"event": "x"}, "projects/p/topics/ventas")
+    falla = infra.publish_event({"event": "y"}, "projects/p/topics/ventas")
+    assert infra.publicaciones_pendientes() == 2
+
+    ok.set_result("id-1")
+    falla.set_exception(RuntimeError("sin permisos"))
+
+    metricas = infra.get_metricas("publicacion")
+    assert metricas.contador("publicados", "ventas") == 1
+    assert metricas.contador("fallidos", "ventas") == 1
+    assert metricas.snapshot()["histogramas"]["publicacion_ms"]["ventas"]["total"] == 2
+    assert infra.publicaciones_pendientes() == 0
+    assert json.loads(publisher_falso.futuros[0][1]) == {"event": "x"}
+
+
+def test_publicar_confirmado_espera_el_message_id(publisher_falso):
+    threading.Timer(0.01, lambda: publisher_falso.futuros[0][2].set_result("id-7")).start()
+    assert infra.publicar_confirmado({"event": "x"}, "projects/p/topics/t", timeout=5) == "id-7"
+
+    async def confirmar():
+        threading.Timer(0.01, lambda: publisher_falso.futuros[1][2].set_result("id-8")).start()
+        return await infra.publicar_confirmado_async({"event": "y"}, "projects/p/topics/t", timeout=5)
+
+    assert asyncio.run(confirmar()) == "id-8"
+
+
+def test_cerrar_publisher_envia_y_espera_lo_pendiente(publisher_falso):
+    confirmado = infra.publish_event({"event": "x"}, "projects/p/topics/t")
+    colgado = infra.publish_event({"event": "y"}, "projects/p/topics/t")
+    threading.Timer(0.01, lambda: confirmado.set_result("id-1")).start()
+
+    assert infra.cerrar_publisher(timeout=0.5) == 1
+    assert publisher_falso.detenido
+    assert infra._publisher is None
+    assert not colgado.done()
+    assert infra.cerrar_publisher() == 0
@@ -0,0 +1,59 @@
+import threading
+import time
+
+from src.services.lector_pedidos import LectorPedidos
+
+
+class _ClientePaginado:
+    """Simula /v1/pedidos con limit/offset y registra la concurrencia observada."""
+
+    def __init__(self, total: int, demora: float = 0.01):
+        self.pedidos = [{"id": i} for i in range(total)]
+        self.demora = demora
+        self.llamadas = []
+        self.en_vuelo = 0
+        self.max_en_vuelo = 0
+        self._lock = threading.Lock()
+
+    def get(self, path, params=None):
+        with self._lock:
+            self.llamadas.append(params["offset"])
+            self.en_vuelo += 1
+            self.max_en_vuelo = max(self.max_en_vuelo, self.en_vuelo)
+        time.sleep(self.demora)
+        with self._lock:
+            self.en_vuelo -= 1
+        return self.pedidos[params["offset"]:params["offset"] + params["limit"]]
+
+
+def test_lee_todas_las_paginas_con_fan_out_acotado():
+    client = _ClientePaginado(950)
+    lector = LectorPedidos(client, tamano_pagina=100, paralelismo=3)
+
+    ids = [p["id"] for p in lector.leer({"tipo": "VENTA"})]
+
+    assert sorted(ids) == list(range(950))
+    assert client.max_en_vuelo <= 3
+    assert client.max_en_vuelo > 1
+    # 10 páginas con datos + a lo sumo las que ya estaban en vuelo tras la corta
+    assert 10 <= lector.paginas <= 12
+    assert lector.estadisticas()["pedidos"] == 950
+    assert lector.duracion_ms > 0
+
+
+def test_primera_pagina_corta_hace_una_sola_llamada():
+    client = _ClientePaginado(30)
+    lector = LectorPedidos(client, tamano_pagina=100, paralelismo=4)
+
+    assert len(list(lector.leer({}))) == 30
+    assert client.llamadas == [0]
+    assert lector.paginas == 1
+
+
+def test_multiplo_exacto_del_tamano_termina_con_pagina_vacia():
+    client = _ClientePaginado(200)
+    lector = LectorPedidos(client, tamano_pagina=100, paralelismo=1)
+
+    assert len(list(lector.leer({}))) == 200
+    assert client.llamadas == [0, 100, 200]
+
@@ -0,0 +1,38 @@
+# tests/test_metricas.py
+from sqlalchemy import text
+
+import src.infrastructure.infrastructure as infra
+from src.infrastructure.metricas import Metricas, get_metricas
+
+
+def test_histograma_y_contadores():
+    m = Metricas("test")
+    m.incrementar("checkouts", "co")
+    m.incrementar("checkouts", "co")
+    m.observar("espera_ms", 3, "co")
+    m.observar("espera_ms", 700, "co")
+
+    snap = m.snapshot()
+    assert snap["contadores"]["checkouts"]["co"] == 2
+    hist = snap["histogramas"]["espera_ms"]["co"]
+    assert hist["total"] == 2
+    assert hist["buckets"]["le_5"] == 1
+    assert hist["buckets"]["le_1000"] == 1
+    assert hist["max_ms"] == 700
+
+
+def test_conexion_medida_registra_checkout_por_schema():
+    m = get_metricas("pool")
+    antes = m.contador("checkouts", "pe")
+    with infra._conexion_medida(infra.engine, "pe") as conn:
+        assert conn.execute(text("SELECT 1")).scalar() == 1
+    assert m.contador("checkouts", "pe") == antes + 1
+    assert m.snapshot()["histogramas"]["espera_checkout_ms"]["pe"]["total"] >= 1
+
+
+def test_endpoint_metricas_pool(client):
+    r = client.get("/metrics/pool")
+    assert r.status_code == 200
+    body = r.json()
+    assert body["pools"]["sync"]["tipo"]
+    assert "contadores" in body and "histogramas" in body
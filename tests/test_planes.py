@@ -1,4 +1,10 @@
+import csv
+import io
+import json
+from contextlib import contextmanager
+from decimal import Decimal
 from unittest.mock import patch
+import pytest
 from src.config import settings
 from datetime import date
 
@@ -89,7 +95,11 @@ def test_recalcular_plan_sin_fecha_usa_hoy(mock_publish, client, headers, monkey
     assert r.status_code == 200, r.text
     plan_id = r.json()["id"]
 
-    r2 = client.post(f"/v1/ventas/planes/{plan_id}/recalcular", headers=headers)
+    # el país del evento sale normalizado por get_schema, no tal cual llega en el header
+    r2 = client.post(
+        f"/v1/ventas/planes/{plan_id}/recalcular",
+        headers={settings.COUNTRY_HEADER: f" {settings.DEFAULT_SCHEMA.upper()} "},
+    )
     assert r2.status_code == 202
 
     mock_publish.assert_called_once()
@@ -98,6 +108,7 @@ def test_recalcular_plan_sin_fecha_usa_hoy(mock_publish, client, headers, monkey
     # Fecha debe ser "hoy" en isoformat
     assert event_dict["fecha"] == date.today().isoformat()
     assert event_dict["plan_id"] == plan_id
+    assert event_dict["ctx"]["country"] == settings.DEFAULT_SCHEMA
 
 
 def test_recalcular_plan_not_found(client, headers, monkeypatch):
@@ -106,4 +117,279 @@ def test_recalcular_plan_not_found(client, headers, monkeypatch):
     r = client.post(f"/v1/ventas/planes/{fake_id}/recalcular", headers=headers)
     assert r.status_code == 404
     body = r.json()
-    assert body["detail"] == "Plan de ventas no encontrado"
\ No newline at end of file
+    assert body["detail"] == "Plan de ventas no encontrado"
+
+def test_listar_planes_paginacion_keyset_y_filtros(client, headers):
+    for i in range(3):
+        payload = {
+            "id_vendedor": f"seller-keyset-{i}",
+            "periodo": "trimestral",
+            "territorio": "Zona Keyset",
+            "fecha_inicio": "2025-07-01",
+            "fecha_fin": "2025-09-30",
+            "ids_productos": ["P-K"],
+            "id_cliente_objetivo": "CLI-K",
+        }
+        assert client.post("/v1/ventas/planes", json=payload, headers=headers).status_code == 200
+
+    params = {"territorio": "Zona Keyset", "limite": 2}
+    r1 = client.get("/v1/ventas/planes", params=params, headers=headers)
+    assert r1.status_code == 200
+    assert len(r1.json()) == 2
+    cursor = r1.headers["X-Next-Cursor"]
+
+    r2 = client.get("/v1/ventas/planes", params={**params, "cursor": cursor}, headers=headers)
+    assert r2.status_code == 200
+    assert len(r2.json()) == 1
+    assert "X-Next-Cursor" not in r2.headers
+    ids = {p["id"] for p in r1.json()} | {p["id"] for p in r2.json()}
+    assert len(ids) == 3
+
+    # Vigencia fuera del rango pedido → sin resultados
+    r3 = client.get(
+        "/v1/ventas/planes",
+        params={"territorio": "Zona Keyset", "desde": "2025-10-01", "hasta": "2025-10-31"},
+        headers=headers,
+    )
+    assert r3.json() == []
+
+    r4 = client.get("/v1/ventas/planes", params={"cursor": "no-es-un-cursor"}, headers=headers)
+    assert r4.status_code == 400
+
+
+def test_listados_de_planes_sin_n_mas_1(client, headers, contar_queries):
+    for i in range(4):
+        payload = {
+            "id_vendedor": "seller-n1",
+            "periodo": "mensual",
+            "fecha_inicio": f"2025-0{i + 1}-01",
+            "fecha_fin": f"2025-0{i + 1}-28",
+            "ids_productos": [f"P-{i}-A", f"P-{i}-B"],
+            "id_cliente_objetivo": "CLI-N1",
+        }
+        assert client.post("/v1/ventas/planes", json=payload, headers=headers).status_code == 200
+
+    contar_queries.clear()
+    r = client.get("/v1/ventas/planes/vendedor/seller-n1", headers=headers)
+    assert r.status_code == 200
+    assert len(r.json()) == 4
+    assert all(len(p["ids_productos"]) == 2 for p in r.json())
+    # planes + productos, sin importar cuántos planes haya
+    assert len(contar_queries) == 2
+
+    contar_queries.clear()
+    r = client.get("/v1/ventas/planes", params={"limite": 3}, headers=headers)
+    assert r.status_code == 200
+    assert len(r.json()) == 3
+    assert len(contar_queries) == 2
+
+
+@pytest.fixture()
+def exportar_en_db_session(db_session, monkeypatch):
+    # El export abre su propia sesión; se apunta a la sesión de la prueba
+    @contextmanager
+    def _session(_schema, solo_lectura=False):
+        yield db_session
+
+    monkeypatch.setattr("src.services.exportacion.session_for_schema", _session)
+
+
+def test_exportar_planes_ndjson_y_progreso_csv(client, headers, db_session, exportar_en_db_session):
+    from src.domain.models import ProgresoPlanDeVentas
+
+    payload = {
+        "id_vendedor": "seller-export",
+        "periodo": "mensual",
+        "fecha_inicio": "2025-05-01",
+        "fecha_fin": "2025-05-31",
+        "ids_productos": ["P-E"],
+        "id_cliente_objetivo": "CLI-E",
+    }
+    plan_id = client.post("/v1/ventas/planes", json=payload, headers=headers).json()["id"]
+    db_session.add(ProgresoPlanDeVentas(id_plan=plan_id, fecha=date(2025, 5, 2), monto_actual=Decimal("12.50")))
+    db_session.flush()
+
+    r = client.get("/v1/ventas/planes/exportar", params={"formato": "ndjson"}, headers=headers)
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    filas = [json.loads(linea) for linea in r.text.splitlines()]
+    fila = next(f for f in filas if f["id"] == plan_id)
+    assert fila["fecha_inicio"] == "2025-05-01"
+    assert fila["id_vendedor"] == "seller-export"
+
+    r = client.get("/v1/ventas/planes/exportar", params={"entidad": "progreso", "formato": "csv"}, headers=headers)
+    assert r.status_code == 200
+    assert 'filename="progreso-co.csv"' in r.headers["content-disposition"]
+    filas = list(csv.DictReader(io.StringIO(r.text)))
+    fila = next(f for f in filas if f["id_plan"] == plan_id)
+    assert fila["fecha"] == "2025-05-02"
+    assert Decimal(fila["monto_actual"]) == Decimal("12.50")
+
+    assert client.get("/v1/ventas/planes/exportar", params={"entidad": "visitas"}, headers=headers).status_code == 422
+
+
+@patch("src.routes.planes.publish_event")
+def test_recalcular_plan_rango_publica_backfill(mock_publish, client, headers, monkeypatch):
+    monkeypatch.setattr(settings, "TOPIC_VENTAS_CRM", "projects/test/topics/ventas-crm")
+    payload = {
+        "id_vendedor": "seller-backfill",
+        "periodo": "mensual",
+        "fecha_inicio": "2025-10-01",
+        "fecha_fin": "2025-10-31",
+        "ids_productos": ["P-B"],
+        "id_cliente_objetivo": "CLI-B",
+    }
+    plan_id = client.post("/v1/ventas/planes", json=payload, headers=headers).json()["id"]
+
+    url = f"/v1/ventas/planes/{plan_id}/recalcular"
+    r = client.post(url, params={"desde": "2025-10-01", "hasta": "2025-10-31"}, headers=headers)
+    assert r.status_code == 202
+    assert r.json()["desde"] == "2025-10-01"
+    event_dict, _ = mock_publish.call_args.args
+    assert (event_dict["desde"], event_dict["hasta"]) == ("2025-10-01", "2025-10-31")
+    assert "fecha" not in event_dict
+
+    assert client.post(url, params={"desde": "2025-10-01"}, headers=headers).status_code == 400
+    assert client.post(url, params={"desde": "2025-10-31", "hasta": "2025-10-01"}, headers=headers).status_code == 400
+    assert client.post(url, params={"desde": "2024-01-01", "hasta": "2025-10-01"}, headers=headers).status_code == 400
+    assert mock_publish.call_count == 1
+
+
+@patch("src.routes.planes.publish_event")
+def test_recalcular_repetido_se_publica_una_vez(mock_publish, client, headers, monkeypatch):
+    monkeypatch.setattr(settings, "TOPIC_VENTAS_CRM", "projects/test/topics/ventas-crm")
+    payload = {
+        "id_vendedor": "seller-clics",
+        "periodo": "mensual",
+        "fecha_inicio": "2025-10-01",
+        "fecha_fin": "2025-10-31",
+        "ids_productos": ["P-C"],
+        "id_cliente_objetivo": "CLI-C",
+    }
+    plan_id = client.post("/v1/ventas/planes", json=payload, headers=headers).json()["id"]
+
+    url = f"/v1/ventas/planes/{plan_id}/recalcular"
+    respuestas = [client.post(url, params={"d": "2025-10-21"}, headers=headers) for _ in range(3)]
+    otro_dia = client.post(url, params={"d": "2025-10-22"}, headers=headers)
+
+    assert [r.status_code for r in respuestas] == [202] * 3
+    assert [r.json().get("coalescido", False) for r in respuestas] == [False, True, True]
+    assert not otro_dia.json().get("coalescido", False)
+    assert mock_publish.call_count == 2
+
+
+@patch("src.routes.planes.publish_event")
+def test_recalcular_todos_publica_un_evento(mock_publish, client, headers, monkeypatch):
+    monkeypatch.setattr(settings, "TOPIC_VENTAS_CRM", "projects/test/topics/ventas-crm")
+    r = client.post("/v1/ventas/planes/recalcular", params={"d": "2025-10-21"}, headers=headers)
+    assert r.status_code == 202
+    event_dict, topic_path = mock_publish.call_args.args
+    assert event_dict["event"] == "recalcular_planes_del_dia"
+    assert event_dict["fecha"] == "2025-10-21"
+    assert event_dict["ctx"]["country"] == settings.DEFAULT_SCHEMA
+
+
+@patch("src.routes.planes.reclamar_publicacion")
+@patch("src.routes.planes.publish_event")
+def test_recalcular_todos_valida_el_pais_antes_de_publicar(mock_publish, mock_reclamar, client, monkeypatch):
+    monkeypatch.setattr(settings, "TOPIC_VENTAS_CRM", "projects/test/topics/ventas-crm")
+    r = client.post("/v1/ventas/planes/recalcular", headers={settings.COUNTRY_HEADER: "zz"})
+    assert r.status_code == 400
+    mock_reclamar.assert_not_called()
+    mock_publish.assert_not_called()
+
+
+def test_listados_de_planes_cacheados_e_invalidados_al_crear(client, headers, contar_queries, cache_respuestas):
+    def crear(vendedor, mes):
+        payload = {
+            "id_vendedor": vendedor,
+            "periodo": "mensual",
+            "fecha_inicio": f"2025-{mes:02d}-01",
+            "fecha_fin": f"2025-{mes:02d}-28",
+            "ids_productos": ["P-C"],
+            "id_cliente_objetivo": "CLI-C",
+        }
+        assert client.post("/v1/ventas/planes", json=payload, headers=headers).status_code == 200
+
+    crear("seller-c1", 1)
+    crear("seller-c2", 1)
+    assert len(client.get("/v1/ventas/planes", headers=headers).json()) == 2
+    assert len(client.get("/v1/ventas/planes/vendedor/seller-c2", headers=headers).json()) == 1
+
+    # mismas queries: salen de la caché sin tocar la BD
+    contar_queries.clear()
+    assert len(client.get("/v1/ventas/planes", headers=headers).json()) == 2
+    assert len(client.get("/v1/ventas/planes/vendedor/seller-c2", headers=headers).json()) == 1
+    assert contar_queries == []
+    # otros parámetros, otra clave
+    assert len(client.get("/v1/ventas/planes", params={"limite": 1}, headers=headers).json()) == 1
+
+    # un plan de seller-c1 invalida el listado general y el de seller-c1, no el de seller-c2
+    crear("seller-c1", 2)
+    assert len(client.get("/v1/ventas/planes", headers=headers).json()) == 3
+    assert len(client.get("/v1/ventas/planes/vendedor/seller-c1", headers=headers).json()) == 2
+    contar_queries.clear()
+    client.get("/v1/ventas/planes/vendedor/seller-c2", headers=headers)
+    assert contar_queries == []
+
+    rutas = client.get("/metrics/cache").json()["rutas"]
+    assert rutas["planes_vendedor"] == {"hit_l1": 2, "hit_l2": 0, "miss": 2, "ratio": 0.5}
+    assert rutas["planes"]["hit_l1"] == 1 and rutas["planes"]["miss"] == 3
+
+
+def test_cache_de_listados_solo_guarda_lecturas_del_primario(client, headers, lectura, cache_respuestas):
+    payload = {
+        "id_vendedor": "seller-r1",
+        "periodo": "mensual",
+        "fecha_inicio": "2025-03-01",
+        "fecha_fin": "2025-03-28",
+        "ids_productos": ["P-R"],
+        "id_cliente_objetivo": "CLI-R",
+    }
+    assert client.post("/v1/ventas/planes", json=payload, headers=headers).status_code == 200
+
+    # miss: se lee del primario (lo que se guarda no puede venir de una réplica atrasada)
+    client.get("/v1/ventas/planes/vendedor/seller-r1", headers=headers)
+    assert lectura.aperturas == [True]
+    # hit: ni siquiera se abre la sesión
+    client.get("/v1/ventas/planes/vendedor/seller-r1", headers=headers)
+    assert lectura.aperturas == [True]
+
+
+def test_listado_sin_cache_lee_de_la_replica(client, headers, lectura):
+    assert client.get("/v1/ventas/planes", headers=headers).status_code == 200
+    assert lectura.aperturas == [False]
+
+
+def test_progreso_con_etag_y_304(client, headers, db_session):
+    from src.services.servicio_plan_ventas import fila_progreso, stmt_upsert_progresos
+
+    payload = {
+        "id_vendedor": "seller-etag",
+        "periodo": "mensual",
+        "fecha_inicio": "2025-10-01",
+        "fecha_fin": "2025-10-31",
+        "ids_productos": ["P-E"],
+        "id_cliente_objetivo": "CLI-E",
+    }
+    plan_id = client.post("/v1/ventas/planes", json=payload, headers=headers).json()["id"]
+    url = f"/v1/ventas/planes/{plan_id}/progreso"
+
+    def upsert(unidades):
+        fila = fila_progreso(plan_id, date(2025, 10, 1), Decimal("10"), unidades, 1, 1)
+        db_session.execute(stmt_upsert_progresos("sqlite", [fila]))
+
+    upsert(1)
+    r1 = client.get(url, headers=headers)
+    etag = r1.headers["ETag"]
+    assert r1.json()[0]["unidades_actuales"] == 1
+
+    r2 = client.get(url, headers={**headers, "If-None-Match": f'W/{etag}, "otro"'})
+    assert r2.status_code == 304 and r2.content == b""
+
+    # el recálculo del mismo día actualiza la versión de la fila
+    upsert(5)
+    r3 = client.get(url, headers={**headers, "If-None-Match": etag})
+    assert r3.status_code == 200
+    assert r3.json()[0]["unidades_actuales"] == 5
+    assert r3.headers["ETag"] != etag
@@ -6,14 +6,14 @@ from unittest.mock import patch, MagicMock, ANY
 from src.config import settings
 
 
-def _encode_event(event: dict) -> dict:
+def _encode_event(event: dict, message_id: str = "msg-1") -> dict:
     """Helper para construir el envelope estándar de Pub/Sub."""
     raw = json.dumps(event).encode("utf-8")
     data_b64 = base64.b64encode(raw).decode("ascii")
     return {
         "message": {
             "data": data_b64,
-            "messageId": "msg-1",
+            "messageId": message_id,
             "publishTime": "2025-10-21T00:00:00Z",
         },
         "subscription": "projects/test/subscriptions/sub-1",
@@ -80,8 +80,8 @@ def test_pubsub_event_tipo_desconocido(client):
     assert r.status_code == 204
 
 
-@patch("src.routes.pubsub.session_for_schema")
-@patch("src.routes.pubsub.ServicioPlanDeVentas")
+@patch("src.services.eventos.session_for_schema")
+@patch("src.services.eventos.ServicioPlanDeVentas")
 def test_pubsub_recalcular_plan_ok(
     mock_svc_cls,
     mock_session_for_schema,
@@ -150,8 +150,8 @@ def test_pubsub_recalcular_plan_sin_plan_id_negocio(client):
     assert r.status_code == 204
 
 
-@patch("src.routes.pubsub.session_for_schema")
-@patch("src.routes.pubsub.ServicioPlanDeVentas")
+@patch("src.services.eventos.session_for_schema")
+@patch("src.services.eventos.ServicioPlanDeVentas")
 def test_pubsub_recalcular_plan_no_encontrado_lanza_value_error(
     mock_svc_cls,
     mock_session_for_schema,
@@ -177,8 +177,8 @@ def test_pubsub_recalcular_plan_no_encontrado_lanza_value_error(
     assert r.status_code == 204
 
 
-@patch("src.routes.pubsub.session_for_schema")
-@patch("src.routes.pubsub.ServicioPlanDeVentas")
+@patch("src.services.eventos.session_for_schema")
+@patch("src.services.eventos.ServicioPlanDeVentas")
 def test_pubsub_recalcular_plan_error_inesperado(
     mock_svc_cls,
     mock_session_for_schema,
@@ -203,4 +203,164 @@ def test_pubsub_recalcular_plan_error_inesperado(
     }
     body = _encode_event(event)
     r = client.post("/pubsub", json=body)
-    assert r.status_code == 204
\ No newline at end of file
+    assert r.status_code == 204
+
+@patch("src.services.eventos.session_for_schema")
+@patch("src.services.eventos.ServicioPlanDeVentas")
+def test_pubsub_recalcular_plan_rango_hace_backfill(mock_svc_cls, mock_session_for_schema, client):
+    cm = MagicMock()
+    cm.__enter__.return_value = MagicMock()
+    cm.__exit__.return_value = False
+    mock_session_for_schema.return_value = cm
+
+    mock_svc = mock_svc_cls.return_value
+    fake_plan = MagicMock()
+    mock_svc.obtener.return_value = fake_plan
+
+    event = {
+        "event": "recalcular_plan_ventas",
+        "plan_id": "PLAN-1",
+        "desde": "2025-10-01",
+        "hasta": "2025-10-31",
+        "ctx": {"country": "co"},
+    }
+    r = client.post("/pubsub", json=_encode_event(event))
+    assert r.status_code == 204
+
+    mock_svc.recalcular_rango.assert_called_once_with(fake_plan, date(2025, 10, 1), date(2025, 10, 31))
+    mock_svc.recalcular_para_fecha.assert_not_called()
+
+
+@patch("src.services.eventos.session_for_schema")
+@patch("src.services.eventos.ServicioRecalculoLote")
+def test_pubsub_recalcular_planes_del_dia(mock_svc_cls, mock_session_for_schema, client):
+    cm = MagicMock()
+    cm.__enter__.return_value = MagicMock()
+    cm.__exit__.return_value = False
+    mock_session_for_schema.return_value = cm
+
+    event = {"event": "recalcular_planes_del_dia", "fecha": "2025-10-21", "ctx": {"country": "co"}}
+    r = client.post("/pubsub", json=_encode_event(event))
+    assert r.status_code == 204
+
+    mock_svc_cls.return_value.recalcular_fecha.assert_called_once_with(date(2025, 10, 21))
+
+
+@patch("src.services.eventos.session_for_schema")
+@patch("src.services.eventos.ServicioProgresoIncremental")
+def test_pubsub_eventos_de_pedido_aplican_deltas(mock_svc_cls, mock_session_for_schema, client):
+    cm = MagicMock()
+    cm.__enter__.return_value = MagicMock()
+    cm.__exit__.return_value = False
+    mock_session_for_schema.return_value = cm
+
+    pedido = {"id": "PED-1", "vendedor_id": "V1", "items": []}
+    for i, event in enumerate((
+        {"event": "pedido_actualizado", "pedido": pedido, "ctx": {"country": "co"}},
+        {"event": "pedido_cancelado", "pedido_id": "PED-2", "ctx": {"country": "co"}},
+    )):
+        r = client.post("/pubsub", json=_encode_event(event, f"msg-{i}"))
+        assert r.status_code == 204
+
+    llamadas = [c.args for c in mock_svc_cls.return_value.aplicar.call_args_list]
+    assert llamadas == [("pedido_actualizado", pedido), ("pedido_cancelado", {"id": "PED-2"})]
+
+
+def _lote_mockeado(mock_svc_cls, mock_session_for_schema):
+    cm = MagicMock()
+    cm.__enter__.return_value = MagicMock()
+    cm.__exit__.return_value = False
+    mock_session_for_schema.return_value = cm
+    res = mock_svc_cls.return_value.recalcular_fecha.return_value
+    res.planes = res.filas_escritas = res.pedidos_leidos = res.paginas = res.duracion_ms = 0
+
+
+@patch("src.services.eventos.session_for_schema")
+@patch("src.services.eventos.ServicioRecalculoLote")
+def test_pubsub_reentrega_del_mismo_message_id_se_omite(mock_svc_cls, mock_session_for_schema, client):
+    from src.infrastructure.metricas import get_metricas
+
+    _lote_mockeado(mock_svc_cls, mock_session_for_schema)
+    get_metricas("pubsub").reiniciar()
+    event = {"event": "recalcular_planes_del_dia", "fecha": "2025-10-21", "ctx": {"country": "co"}}
+
+    for _ in range(3):
+        assert client.post("/pubsub", json=_encode_event(event, "msg-dup")).status_code == 204
+
+    mock_svc_cls.return_value.recalcular_fecha.assert_called_once_with(date(2025, 10, 21))
+    metricas = get_metricas("pubsub")
+    assert metricas.contador("procesados", "recalcular_planes_del_dia") == 1
+    assert metricas.contador("duplicados", "message_id") == 2
+
+
+@patch("src.services.eventos.session_for_schema")
+@patch("src.services.eventos.ServicioRecalculoLote")
+def test_pubsub_mismo_recalculo_publicado_dos_veces_se_omite_sin_coalescedor(
+    mock_svc_cls, mock_session_for_schema, client, fake_redis, monkeypatch
+):
+    from src.config import settings
+
+    monkeypatch.setattr(settings, "COALESCER_RECALCULO", False)
+    _lote_mockeado(mock_svc_cls, mock_session_for_schema)
+    event = {"event": "recalcular_planes_del_dia", "fecha": "2025-10-21", "ctx": {"country": "co"}}
+    otro_dia = {**event, "fecha": "2025-10-22"}
+
+    client.post("/pubsub", json=_encode_event(event, "msg-a"))
+    client.post("/pubsub", json=_encode_event(event, "msg-b"))  # otro messageId, mismo (evento, fecha)
+    client.post("/pubsub", json=_encode_event(otro_dia, "msg-c"))
+
+    llamadas = [c.args for c in mock_svc_cls.return_value.recalcular_fecha.call_args_list]
+    assert llamadas == [(date(2025, 10, 21),), (date(2025, 10, 22),)]
+    # las marcas viven en Redis: compartidas entre instancias
+    assert fake_redis.exists("dedup:msg:msg-a")
+    assert fake_redis.exists("dedup:evt:co:recalcular_planes_del_dia:2025-10-21")
+
+
+@patch("src.services.eventos.session_for_schema")
+@patch("src.services.eventos.ServicioRecalculoLote")
+def test_pubsub_recalculo_repetido_con_coalescedor_no_se_pierde(mock_svc_cls, mock_session_for_schema, client):
+    import threading
+
+    from src.services.eventos import procesar_mensaje
+
+    _lote_mockeado(mock_svc_cls, mock_session_for_schema)
+    recalcular = mock_svc_cls.return_value.recalcular_fecha
+    en_curso, liberar = threading.Event(), threading.Event()
+    ok = recalcular.return_value
+
+    def recalcular_fecha(_d):
+        if recalcular.call_count == 1:
+            en_curso.set()
+            liberar.wait(5)
+        return ok
+
+    recalcular.side_effect = recalcular_fecha
+    event = {"event": "recalcular_planes_del_dia", "fecha": "2025-10-21", "ctx": {"country": "co"}}
+
+    hilo = threading.Thread(target=procesar_mensaje, args=("msg-a", event["event"], event, "co", "[test]"))
+    hilo.start()
+    assert en_curso.wait(5)
+    # llega mientras el primero está en vuelo: marca la clave y el primero repite
+    client.post("/pubsub", json=_encode_event(event, "msg-b"))
+    liberar.set()
+    hilo.join(5)
+    assert recalcular.call_count == 2
+
+    # y uno que llega después de terminar vuelve a recalcular
+    client.post("/pubsub", json=_encode_event(event, "msg-c"))
+    assert recalcular.call_count == 3
+
+
+@patch("src.services.eventos.session_for_schema")
+@patch("src.services.eventos.ServicioRecalculoLote")
+def test_pubsub_fallo_libera_las_marcas_para_reintentar(mock_svc_cls, mock_session_for_schema, client):
+    _lote_mockeado(mock_svc_cls, mock_session_for_schema)
+    recalcular = mock_svc_cls.return_value.recalcular_fecha
+    ok = recalcular.return_value
+    recalcular.side_effect = [RuntimeError("BD caída"), ok]
+    event = {"event": "recalcular_planes_del_dia", "fecha": "2025-10-21", "ctx": {"country": "co"}}
+
+    client.post("/pubsub", json=_encode_event(event, "msg-x"))
+    client.post("/pubsub", json=_encode_event(event, "msg-x"))
+
+    assert recalcular.call_count == 2
@@ -0,0 +1,84 @@
+import json
+import threading
+import time
+from datetime import date
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from src.errors import ValidationError
+from src.recalculo import main
+from src.services.servicio_recalculo_paises import recalcular_paises
+
+
+def _lote_falso(mock_svc_cls, fallar=(), demora=0.0):
+    """ServicioRecalculoLote falso: registra país, fecha y concurrencia máxima."""
+    llamadas, lock = [], threading.Lock()
+    en_curso = {"n": 0, "max": 0}
+
+    def construir(_session, country):
+        def recalcular_fecha(d):
+            with lock:
+                en_curso["n"] += 1
+                en_curso["max"] = max(en_curso["max"], en_curso["n"])
+                llamadas.append((country, d))
+            time.sleep(demora)
+            with lock:
+                en_curso["n"] -= 1
+            if country in fallar:
+                raise RuntimeError("ms-pedidos no responde")
+            return SimpleNamespace(planes=3, filas_escritas=3, pedidos_leidos=10, paginas=1)
+
+        return MagicMock(recalcular_fecha=recalcular_fecha)
+
+    mock_svc_cls.side_effect = construir
+    return llamadas, en_curso
+
+
+@patch("src.services.servicio_recalculo_paises.session_for_schema", MagicMock())
+@patch("src.services.servicio_recalculo_paises.ServicioRecalculoLote")
+def test_un_lote_por_pais_con_paralelismo_acotado(mock_svc_cls):
+    llamadas, en_curso = _lote_falso(mock_svc_cls, fallar={"mx"}, demora=0.02)
+
+    res = recalcular_paises(date(2025, 10, 21), paralelismo=2)
+
+    # una descarga de pedidos por (país, día)
+    assert sorted(llamadas) == [(c, date(2025, 10, 21)) for c in ("co", "ec", "mx", "pe")]
+    assert en_curso["max"] == 2
+    estados = {p["schema"]: p["estado"] for p in res.paises}
+    assert estados == {"co": "ok", "ec": "ok", "mx": "error", "pe": "ok"}
+    assert (res.planes, res.pedidos_leidos, res.errores) == (9, 30, 1)
+    assert res.duracion_ms > 0 and res.planes_por_segundo > 0
+
+
+def test_pais_desconocido_falla_antes_de_empezar():
+    with pytest.raises(ValidationError):
+        recalcular_paises(date(2025, 10, 21), ["co", "xx"])
+
+
+@patch("src.services.servicio_recalculo_paises.session_for_schema", MagicMock())
+@patch("src.services.servicio_recalculo_paises.ServicioRecalculoLote")
+def test_endpoint_devuelve_reporte(mock_svc_cls, client):
+    _lote_falso(mock_svc_cls)
+
+    r = client.post("/jobs/recalculo-progreso", params={"d": "2025-10-21", "paises": "co,MX"})
+    assert r.status_code == 200
+    cuerpo = r.json()
+    assert [p["schema"] for p in cuerpo["paises"]] == ["co", "mx"]
+    assert (cuerpo["planes"], cuerpo["errores"]) == (6, 0)
+    assert "planes_por_segundo" in cuerpo and "duracion_ms" in cuerpo
+
+    assert client.post("/jobs/recalculo-progreso", params={"paises": "zz"}).status_code == 400
+
+
+@patch("src.recalculo.inicializar_schemas", return_value=[])
+@patch("src.services.servicio_recalculo_paises.session_for_schema", MagicMock())
+@patch("src.services.servicio_recalculo_paises.ServicioRecalculoLote")
+def test_cli_imprime_reporte_y_sale_con_error_si_falla_un_pais(mock_svc_cls, _bootstrap, capsys):
+    _lote_falso(mock_svc_cls, fallar={"pe"})
+
+    assert main(["--fecha", "2025-10-21", "--paises", "co,pe"]) == 1
+    reporte = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+    assert reporte["fecha"] == "2025-10-21"
+    assert [p["estado"] for p in reporte["paises"]] == ["ok", "error"]
@@ -3,6 +3,7 @@ from datetime import date
 from decimal import Decimal
 from src.services.servicio_plan_ventas import ServicioPlanDeVentas
 from src.domain import models
+from src.infrastructure.metricas import get_metricas
 
 # Helper para crear un plan en la DB de prueba
 def _crear_plan_basico(db):
@@ -132,3 +133,163 @@ def test_recalcular_con_items_validos(mock_client_cls, db_session):
     assert prog.clientes_actuales == 1
     # Monto = 100*2 * (1-0.10) * (1+0.19) = 238
     assert prog.monto_actual == Decimal("214.2")
+
+
+@patch("src.services.servicio_plan_ventas.MsClient")
+def test_recalcular_dos_veces_actualiza_misma_fila(mock_client_cls, db_session, contar_queries):
+    plan = _crear_plan_basico(db_session)
+    plan.productos.append(models.PlanDeVentasProducto(id_producto="P1"))
+    db_session.flush()
+
+    pedido = {
+        "vendedor_id": "VEN-1",
+        "cliente_id": "CLI-1",
+        "items": [{"producto_id": "P1", "cantidad": 1, "precio_unitario": 50}],
+    }
+    mock_client_cls.return_value.get.return_value = [pedido]
+    svc = ServicioPlanDeVentas(db_session, "co")
+    primero = svc.recalcular_para_fecha(plan, date(2025,10,21))
+    assert primero.unidades_actuales == 1
+
+    mock_client_cls.return_value.get.return_value = [pedido, pedido]
+    contar_queries.clear()
+    segundo = svc.recalcular_para_fecha(plan, date(2025,10,21))
+
+    # reemplazo de aportes (pedidos sin id: solo el borrado) + un único
+    # INSERT ... ON CONFLICT DO UPDATE, sobre la misma fila
+    assert len(contar_queries) == 2
+    assert contar_queries[0].startswith("DELETE FROM aporte_progreso")
+    assert "ON CONFLICT" in contar_queries[1]
+    assert segundo.id == primero.id
+    assert segundo.unidades_actuales == 2
+    assert db_session.query(models.ProgresoPlanDeVentas).filter_by(id_plan=plan.id).count() == 1
+
+
+@patch("src.services.servicio_plan_ventas.MsClient")
+def test_recalcular_rango_una_llamada_y_un_upsert(mock_client_cls, db_session, contar_queries):
+    plan = _crear_plan_basico(db_session)
+    plan.productos.append(models.PlanDeVentasProducto(id_producto="P1"))
+    db_session.flush()
+
+    def _pedido(fecha, cantidad):
+        return {
+            "vendedor_id": "VEN-1",
+            "cliente_id": "CLI-1",
+            "fecha_compromiso": fecha,
+            "items": [{"producto_id": "P1", "cantidad": cantidad, "precio_unitario": 10}],
+        }
+
+    mock_inst = mock_client_cls.return_value
+    mock_inst.get.return_value = [
+        _pedido("2025-10-01", 1),
+        _pedido("2025-10-01T15:00:00", 2),
+        _pedido("2025-10-03", 4),
+        _pedido("2025-10-03", 0),
+    ]
+    svc = ServicioPlanDeVentas(db_session, "co")
+    # un día ya calculado dentro del rango se sobrescribe
+    viejo = svc.recalcular_para_fecha(plan, date(2025,10,3))
+
+    contar_queries.clear()
+    res = svc.recalcular_rango(plan, date(2025,10,1), date(2025,10,3))
+
+    assert res.filas_escritas == 3
+    assert res.pedidos_leidos == 4
+    assert res.duracion_ms >= 0
+    # un upsert de progreso + el reemplazo de aportes del rango
+    assert len(contar_queries) == 2
+    params = mock_inst.get.call_args.kwargs["params"]
+    assert params["fecha_compromiso_desde"] == "2025-10-01"
+    assert params["fecha_compromiso_hasta"] == "2025-10-03"
+
+    filas = {
+        p.fecha: p for p in db_session.query(models.ProgresoPlanDeVentas).filter_by(id_plan=plan.id)
+    }
+    assert sorted(filas) == [date(2025,10,1), date(2025,10,2), date(2025,10,3)]
+    assert (filas[date(2025,10,1)].unidades_actuales, filas[date(2025,10,1)].pedidos_contados) == (3, 2)
+    assert filas[date(2025,10,2)].unidades_actuales == 0
+    assert filas[date(2025,10,3)].unidades_actuales == 4
+    assert viejo.unidades_actuales == 4
+
+
+@patch("src.services.servicio_plan_ventas.MsClient")
+def test_recalcular_rango_sin_filtro_en_ms_pedidos_lee_dia_por_dia(mock_client_cls, db_session):
+    plan = _crear_plan_basico(db_session)
+    plan.productos.append(models.PlanDeVentasProducto(id_producto="P1"))
+    db_session.flush()
+    todos = [
+        {
+            "vendedor_id": "VEN-1",
+            "cliente_id": "CLI-1",
+            "fecha_compromiso": f,
+            "items": [{"producto_id": "P1", "cantidad": 1, "precio_unitario": 10}],
+        }
+        for f in ("2025-10-01", "2025-11-01", "2025-10-02", "2025-10-02")
+    ]
+
+    def _get(path, params):
+        # ms-pedidos que solo entiende fecha_compromiso
+        if "fecha_compromiso" not in params:
+            return todos
+        return [p for p in todos if p["fecha_compromiso"] == params["fecha_compromiso"]]
+
+    mock_client_cls.return_value.get.side_effect = _get
+    mock_client_cls.return_value.pais = "co"
+    svc = ServicioPlanDeVentas(db_session, "co")
+    res = svc.recalcular_rango(plan, date(2025,10,1), date(2025,10,2))
+
+    llamadas = [c.kwargs["params"] for c in mock_client_cls.return_value.get.call_args_list]
+    assert [p.get("fecha_compromiso") for p in llamadas] == [None, "2025-10-01", "2025-10-02"]
+    assert get_metricas("recalculo").contador("rango_sin_filtro", "co") >= 1
+    filas = {p.fecha: p.unidades_actuales for p in db_session.query(models.ProgresoPlanDeVentas).filter_by(id_plan=plan.id)}
+    assert filas == {date(2025,10,1): 1, date(2025,10,2): 2}
+    assert res.filas_escritas == 2
+
+
+def test_recalcular_rango_valida_limites(db_session):
+    import pytest
+    from src.errors import ValidationError
+
+    plan = _crear_plan_basico(db_session)
+    svc = ServicioPlanDeVentas(db_session, "co")
+    with pytest.raises(ValidationError):
+        svc.recalcular_rango(plan, date(2025,10,5), date(2025,10,1))
+    with pytest.raises(ValidationError):
+        svc.recalcular_rango(plan, date(2024,1,1), date(2025,12,31))
+
+
+@patch("src.services.servicio_plan_ventas.MsClient")
+def test_recalculo_de_plan_reconcilia_aportes_y_el_evento_no_duplica(mock_client_cls, db_session):
+    from src.services.servicio_progreso_incremental import ServicioProgresoIncremental
+
+    plan = _crear_plan_basico(db_session)
+    plan.productos.append(models.PlanDeVentasProducto(id_producto="P1"))
+    db_session.flush()
+    pedido = {
+        "id": "PED-Y",
+        "vendedor_id": "VEN-1",
+        "cliente_id": "CLI-1",
+        "fecha_compromiso": "2025-10-21",
+        "actualizado_en": "2025-10-21T10:00:00Z",
+        "items": [{"producto_id": "P1", "cantidad": 2, "precio_unitario": 10}],
+    }
+    mock_client_cls.return_value.get.return_value = [pedido]
+    svc = ServicioPlanDeVentas(db_session, "co")
+    svc.recalcular_rango(plan, date(2025,10,20), date(2025,10,21))
+    prog = svc.recalcular_para_fecha(plan, date(2025,10,21))
+
+    aportes = db_session.query(models.AporteProgreso).filter_by(id_plan=plan.id).all()
+    assert [(a.id_pedido, a.unidades) for a in aportes] == [("PED-Y", 2)]
+
+    # el evento del pedido ya contado llega después: no se suma otra vez
+    ServicioProgresoIncremental(db_session).aplicar("pedido_creado", pedido)
+    db_session.refresh(prog)
+    assert (prog.unidades_actuales, prog.pedidos_contados) == (2, 1)
+
+
+def test_upsert_de_progreso_en_dialecto_no_soportado():
+    import pytest
+    from src.services.servicio_plan_ventas import stmt_upsert_progresos
+
+    with pytest.raises(RuntimeError, match="mysql"):
+        stmt_upsert_progresos("mysql", [])
@@ -0,0 +1,184 @@
+from unittest.mock import patch
+from datetime import date
+from decimal import Decimal
+from src.domain import models
+from src.services.servicio_progreso_incremental import ServicioProgresoIncremental
+from src.services.servicio_recalculo_lote import ServicioRecalculoLote
+
+DIA = date(2025, 10, 21)
+
+
+def _plan(db, id_plan, vendedor, cliente, productos):
+    db.add(models.PlanDeVentas(
+        id=id_plan,
+        id_vendedor=vendedor,
+        periodo="mensual",
+        fecha_inicio=date(2025, 1, 1),
+        fecha_fin=date(2025, 12, 31),
+        id_cliente_objetivo=cliente,
+        activo=True,
+        productos=[models.PlanDeVentasProducto(id_producto=p) for p in productos],
+    ))
+    db.flush()
+
+
+def _pedido(id_pedido, cliente, *items, fecha="2025-10-21", version=None):
+    return {
+        "id": id_pedido,
+        "vendedor_id": "V1",
+        "cliente_id": cliente,
+        "fecha_compromiso": fecha,
+        "actualizado_en": version,
+        "items": [{"producto_id": p, "cantidad": c, "precio_unitario": 10, "impuesto_pct": 19} for p, c in items],
+    }
+
+
+def _progreso(db, id_plan, d=DIA):
+    p = db.query(models.ProgresoPlanDeVentas).filter_by(id_plan=id_plan, fecha=d).one_or_none()
+    if p is None:
+        return None
+    return p.monto_actual, p.unidades_actuales, p.clientes_actuales, p.pedidos_contados
+
+
+def test_crear_actualizar_y_cancelar_aplican_deltas(db_session):
+    _plan(db_session, "I-1", "V1", "C1", ["P1"])
+    _plan(db_session, "I-2", "V1", "C2", ["P1"])  # otro cliente objetivo: no cuenta
+    svc = ServicioProgresoIncremental(db_session)
+
+    svc.aplicar("pedido_creado", _pedido("PED-1", "C1", ("P1", 2), ("P9", 5)))
+    svc.aplicar("pedido_creado", _pedido("PED-2", "C1", ("P1", 1)))
+    assert _progreso(db_session, "I-1") == (Decimal("35.70"), 3, 1, 2)
+    assert _progreso(db_session, "I-2") is None
+
+    res = svc.aplicar("pedido_actualizado", _pedido("PED-1", "C1", ("P1", 4)))
+    assert (res.planes, res.filas_ajustadas) == (1, 1)
+    assert _progreso(db_session, "I-1") == (Decimal("59.50"), 5, 1, 2)
+
+    svc.aplicar("pedido_cancelado", {"id": "PED-2"})
+    assert _progreso(db_session, "I-1") == (Decimal("47.60"), 4, 1, 1)
+    svc.aplicar("pedido_cancelado", {"id": "PED-1"})
+    assert _progreso(db_session, "I-1") == (Decimal("0"), 0, 0, 0)
+
+
+def test_creado_tardio_despues_de_cancelar_se_descarta(db_session):
+    _plan(db_session, "I-1", "V1", "C1", ["P1"])
+    svc = ServicioProgresoIncremental(db_session)
+
+    svc.aplicar("pedido_creado", _pedido("PED-1", "C1", ("P1", 2), version="2025-10-21T10:00:00Z"))
+    svc.aplicar("pedido_cancelado", {"id": "PED-1"})
+    assert _progreso(db_session, "I-1") == (Decimal("0"), 0, 0, 0)
+
+    # entregas fuera de orden del mismo pedido, con y sin actualizado_en
+    tardio = svc.aplicar("pedido_creado", _pedido("PED-1", "C1", ("P1", 2), version="2025-10-21T10:00:00Z"))
+    sin_version = svc.aplicar("pedido_actualizado", _pedido("PED-1", "C1", ("P1", 3)))
+    assert tardio.descartado and sin_version.descartado
+    assert _progreso(db_session, "I-1") == (Decimal("0"), 0, 0, 0)
+
+
+def test_evento_sin_version_no_borra_la_guardada(db_session):
+    _plan(db_session, "I-1", "V1", "C1", ["P1"])
+    svc = ServicioProgresoIncremental(db_session)
+
+    svc.aplicar("pedido_creado", _pedido("PED-1", "C1", ("P1", 2), version="2025-10-21T11:00:00Z"))
+    svc.aplicar("pedido_actualizado", _pedido("PED-1", "C1", ("P1", 3)))
+    viejo = svc.aplicar("pedido_actualizado", _pedido("PED-1", "C1", ("P1", 9), version="2025-10-21T10:00:00Z"))
+
+    assert viejo.descartado
+    assert _progreso(db_session, "I-1")[1] == 3
+
+
+def test_cambio_de_fecha_mueve_el_aporte(db_session):
+    _plan(db_session, "I-1", "V1", "C1", ["P1"])
+    svc = ServicioProgresoIncremental(db_session)
+
+    svc.aplicar("pedido_creado", _pedido("PED-1", "C1", ("P1", 2)))
+    svc.aplicar("pedido_actualizado", _pedido("PED-1", "C1", ("P1", 2), fecha="2025-10-22"))
+
+    assert _progreso(db_session, "I-1") == (Decimal("0"), 0, 0, 0)
+    assert _progreso(db_session, "I-1", date(2025, 10, 22)) == (Decimal("23.80"), 2, 1, 1)
+
+
+def test_evento_repetido_o_viejo_se_descarta(db_session):
+    _plan(db_session, "I-1", "V1", "C1", ["P1"])
+    svc = ServicioProgresoIncremental(db_session)
+
+    svc.aplicar("pedido_creado", _pedido("PED-1", "C1", ("P1", 2), version="2025-10-21T10:00:00"))
+    svc.aplicar("pedido_actualizado", _pedido("PED-1", "C1", ("P1", 3), version="2025-10-21T11:00:00"))
+    repetido = svc.aplicar("pedido_actualizado", _pedido("PED-1", "C1", ("P1", 3), version="2025-10-21T11:00:00"))
+    viejo = svc.aplicar("pedido_creado", _pedido("PED-1", "C1", ("P1", 2), version="2025-10-21T10:00:00"))
+
+    assert repetido.descartado and viejo.descartado
+    assert _progreso(db_session, "I-1")[1:] == (3, 1, 1)
+
+
+@patch("src.services.servicio_recalculo_lote.MsClient")
+def test_eventos_despues_de_reconciliar_coinciden_con_recalculo(mock_client_cls, db_session):
+    _plan(db_session, "I-1", "V1", "C1", ["P1", "P2"])
+    _plan(db_session, "I-2", "V1", "C2", ["P1"])
+    pedidos = [
+        _pedido("PED-1", "C1", ("P1", 2), ("P9", 5)),
+        _pedido("PED-2", "C1", ("P2", 1)),
+        _pedido("PED-3", "C2", ("P1", 7)),
+    ]
+    mock_client_cls.return_value.get.return_value = pedidos
+    lote = ServicioRecalculoLote(db_session, "co")
+    lote.recalcular_fecha(DIA)
+    assert db_session.query(models.AporteProgreso).count() == 3
+
+    svc = ServicioProgresoIncremental(db_session)
+    actualizado = _pedido("PED-3", "C2", ("P1", 1), ("P2", 2))
+    nuevo = _pedido("PED-4", "C1", ("P1", 5))
+    svc.aplicar("pedido_cancelado", {"id": "PED-2"})
+    svc.aplicar("pedido_actualizado", actualizado)
+    svc.aplicar("pedido_creado", nuevo)
+    incremental = {p: _progreso(db_session, p) for p in ("I-1", "I-2")}
+
+    mock_client_cls.return_value.get.return_value = [pedidos[0], actualizado, nuevo]
+    lote.recalcular_fecha(DIA)
+    assert {p: _progreso(db_session, p) for p in ("I-1", "I-2")} == incremental
+
+
+def test_versiones_se_comparan_como_instantes(db_session):
+    _plan(db_session, "I-1", "V1", "C1", ["P1"])
+    svc = ServicioProgresoIncremental(db_session)
+
+    # mismo instante en otro formato: repetido; como texto "2025-10-21T09..." < "2025-10-21T10..."
+    svc.aplicar("pedido_creado", _pedido("PED-1", "C1", ("P1", 2), version="2025-10-21T10:00:00Z"))
+    assert svc.aplicar("pedido_creado", _pedido("PED-1", "C1", ("P1", 2), version="2025-10-21T05:00:00-05:00")).descartado
+    # epoch en ms, una hora después: se aplica
+    nuevo = svc.aplicar("pedido_actualizado", _pedido("PED-1", "C1", ("P1", 4), version=1761044400000))
+    assert not nuevo.descartado
+    assert _progreso(db_session, "I-1")[1] == 4
+
+
+@patch("src.services.servicio_recalculo_lote.MsClient")
+def test_lote_guarda_la_version_y_descarta_eventos_ya_leidos(mock_client_cls, db_session):
+    _plan(db_session, "I-1", "V1", "C1", ["P1"])
+    pedido = _pedido("PED-1", "C1", ("P1", 2), version="2025-10-21T10:00:00")
+    mock_client_cls.return_value.get.return_value = [pedido]
+    ServicioRecalculoLote(db_session, "co").recalcular_fecha(DIA)
+
+    aporte = db_session.query(models.AporteProgreso).filter_by(id_pedido="PED-1").one()
+    assert aporte.version == "2025-10-21T10:00:00.000000+00:00"
+    # el evento de ese mismo estado llega después del lote: no se suma otra vez
+    assert ServicioProgresoIncremental(db_session).aplicar("pedido_creado", pedido).descartado
+    assert _progreso(db_session, "I-1")[1:] == (2, 1, 1)
+
+
+def test_en_postgres_serializa_por_pedido_y_cliente(db_session):
+    from unittest.mock import MagicMock
+    from src.services.servicio_progreso_incremental import id_lock
+
+    db = MagicMock()
+    db.get_bind.return_value.dialect.name = "postgresql"
+    db.scalars.return_value = []
+    db.execute.return_value.all.return_value = []
+    ServicioProgresoIncremental(db).aplicar("pedido_creado", _pedido("PED-1", "C1", ("P1", 2)))
+
+    locks = [c.args[1]["id"] for c in db.execute.call_args_list if "pg_advisory_xact_lock" in str(c.args[0])]
+    assert locks == [id_lock("aporte:cliente:C1"), id_lock("aporte:pedido:PED-1")]
+
+    # fuera de Postgres no se emite nada
+    svc = ServicioProgresoIncremental(db_session)
+    svc._bloquear(["aporte:pedido:PED-1"])
+    assert svc._bloqueadas == set()
@@ -0,0 +1,76 @@
+from unittest.mock import patch
+from datetime import date
+from decimal import Decimal
+from src.domain import models
+from src.services.servicio_plan_ventas import calcular_progreso
+from src.services.agregacion import ColumnasPedidos
+from src.services.servicio_recalculo_lote import ServicioRecalculoLote
+
+
+def _plan(db, id_plan, vendedor, cliente, productos, activo=True, fin=date(2025,12,31), periodo="mensual"):
+    plan = models.PlanDeVentas(
+        id=id_plan,
+        id_vendedor=vendedor,
+        periodo=periodo,
+        fecha_inicio=date(2025,1,1),
+        fecha_fin=fin,
+        id_cliente_objetivo=cliente,
+        activo=activo,
+        productos=[models.PlanDeVentasProducto(id_producto=p) for p in productos],
+    )
+    db.add(plan)
+    return plan
+
+
+def _pedido(vendedor, cliente, *items):
+    return {
+        "vendedor_id": vendedor,
+        "cliente_id": cliente,
+        "items": [{"producto_id": p, "cantidad": c, "precio_unitario": 10, "impuesto_pct": 19} for p, c in items],
+    }
+
+
+PEDIDOS = [
+    _pedido("V1", "C1", ("P1", 2), ("P9", 5)),
+    _pedido("V1", "C1", ("P2", 1)),
+    _pedido("V1", "C2", ("P1", 7)),
+    _pedido("V2", "C3", ("P3", 4)),
+    _pedido("V2", "C3", ("P1", 1)),
+]
+
+
+def test_columnas_compartidas_coinciden_con_calculo_por_plan():
+    columnas = ColumnasPedidos(PEDIDOS)
+    for vendedor, cliente, productos in [("V1", "C1", {"P1"}), ("V1", "C2", {"P1", "P2"}), ("V2", "C3", {"P3"}), ("V3", "C1", {"P1"}), ("V1", None, {"P1"})]:
+        esperado = calcular_progreso(PEDIDOS, id_vendedor=vendedor, cliente_obj=cliente, productos_set=productos)
+        assert columnas.agregar(vendedor, cliente, productos) == esperado
+
+
+@patch("src.services.servicio_recalculo_lote.MsClient")
+def test_recalcular_fecha_descarga_una_vez_y_escribe_en_lote(mock_client_cls, db_session, contar_queries):
+    _plan(db_session, "L-1", "V1", "C1", ["P1", "P2"])
+    _plan(db_session, "L-2", "V1", "C2", ["P1"])
+    _plan(db_session, "L-3", "V2", "C3", ["P3"])
+    _plan(db_session, "L-4", "V2", "C3", [], periodo="anual")
+    _plan(db_session, "L-INACTIVO", "V1", "C1", ["P1"], activo=False, periodo="anual")
+    _plan(db_session, "L-VENCIDO", "V1", "C1", ["P1"], fin=date(2025,6,30))
+    db_session.flush()
+    mock_client_cls.return_value.get.return_value = PEDIDOS
+
+    contar_queries.clear()
+    res = ServicioRecalculoLote(db_session, "co").recalcular_fecha(date(2025,10,21))
+
+    mock_client_cls.return_value.get.assert_called_once()
+    # planes + productos + un upsert masivo + reemplazo de aportes (sin ids de pedido no hay alta)
+    assert len(contar_queries) == 4
+    assert res.filas_escritas == res.planes
+    assert res.pedidos_leidos == 5
+
+    prog = {p.id_plan: p for p in db_session.query(models.ProgresoPlanDeVentas).filter_by(fecha=date(2025,10,21))}
+    assert {"L-1", "L-2", "L-3", "L-4"} <= set(prog)
+    assert "L-INACTIVO" not in prog and "L-VENCIDO" not in prog
+    assert (prog["L-1"].unidades_actuales, prog["L-1"].pedidos_contados) == (3, 2)
+    assert prog["L-1"].monto_actual == Decimal("35.70")
+    assert prog["L-2"].unidades_actuales == 7
+    assert prog["L-3"].unidades_actuales == 4
+    assert prog["L-4"].pedidos_contados == 0
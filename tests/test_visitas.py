@@ -101,3 +101,153 @@ def test_obtener_visita_not_found(db_session, headers):
     svc = ServicioVisitas(db_session, pais)
     with pytest.raises(NotFoundError):
         svc.obtener_visita_con_detalle("no-existe")
+
+
+def test_listar_visitas_paginacion_y_rango_fechas(client, headers):
+    for dia in ("2025-11-01", "2025-11-02", "2025-11-03"):
+        payload = {
+            "id_vendedor": "seller-pag",
+            "id_cliente": f"cli-{dia}",
+            "direccion": "Calle 4",
+            "ciudad": "Lima",
+            "contacto": "Rosa",
+            "fecha": dia,
+        }
+        assert client.post("/v1/visitas", json=payload, headers=headers).status_code == 200
+
+    params = {"id_vendedor": "seller-pag", "desde": "2025-11-02", "limite": 1}
+    r1 = client.get("/v1/visitas", params=params, headers=headers)
+    assert r1.status_code == 200
+    assert len(r1.json()) == 1
+    r2 = client.get(
+        "/v1/visitas", params={**params, "cursor": r1.headers["X-Next-Cursor"]}, headers=headers
+    )
+    assert len(r2.json()) == 1
+    assert "X-Next-Cursor" not in r2.headers
+    assert {v["fecha"] for v in r1.json() + r2.json()} == {"2025-11-02", "2025-11-03"}
+
+
+@patch("src.services.servicio_visitas.CargadorGCS")
+def test_exportar_visitas_y_detalles(mock_cls, client, headers, db_session, monkeypatch):
+    import csv
+    import io
+    import json
+    from contextlib import contextmanager
+
+    @contextmanager
+    def _session(_schema, solo_lectura=False):
+        yield db_session
+
+    monkeypatch.setattr("src.services.exportacion.session_for_schema", _session)
+
+    payload = {
+        "id_vendedor": "seller-exp",
+        "id_cliente": "cli-exp",
+        "direccion": "Calle 5",
+        "ciudad": "Quito",
+        "contacto": "Ana",
+        "fecha": "2025-12-01",
+    }
+    visita_id = client.post("/v1/visitas", json=payload, headers=headers).json()["id"]
+    client.post(f"/v1/visitas/{visita_id}/detalle", data={"id_cliente": "cli-exp", "hallazgos": "OK"}, headers=headers)
+
+    r = client.get("/v1/visitas/exportar", headers=headers)
+    assert r.status_code == 200
+    visitas = [json.loads(linea) for linea in r.text.splitlines()]
+    assert any(v["id"] == visita_id and v["estado"] == "finalizada" for v in visitas)
+
+    r = client.get("/v1/visitas/exportar", params={"entidad": "detalles", "formato": "csv"}, headers=headers)
+    assert r.status_code == 200
+    detalles = list(csv.DictReader(io.StringIO(r.text)))
+    assert any(d["id_visita"] == visita_id and d["hallazgos"] == "OK" for d in detalles)
+
+
+@patch("src.services.servicio_visitas.CargadorGCS")
+def test_listado_de_visitas_cacheado_e_invalidado_por_detalle(mock_cls, client, headers, contar_queries, cache_respuestas):
+    payload = {
+        "id_vendedor": "seller-cache",
+        "id_cliente": "cli-cache",
+        "direccion": "Calle 6",
+        "ciudad": "Lima",
+        "contacto": "Eva",
+        "fecha": "2025-12-02",
+    }
+    visita_id = client.post("/v1/visitas", json=payload, headers=headers).json()["id"]
+    params = {"id_vendedor": "seller-cache"}
+    assert client.get("/v1/visitas", params=params, headers=headers).json()[0]["estado"] == "pendiente"
+
+    contar_queries.clear()
+    assert client.get("/v1/visitas", params=params, headers=headers).json()[0]["estado"] == "pendiente"
+    assert contar_queries == []
+
+    client.post(f"/v1/visitas/{visita_id}/detalle", data={"id_cliente": "cli-cache"}, headers=headers)
+    assert client.get("/v1/visitas", params=params, headers=headers).json()[0]["estado"] == "finalizada"
+
+
+@patch("src.services.servicio_visitas.CargadorGCS")
+def test_obtener_visita_con_etag_responde_304_sin_descargar_foto(mock_cls, client, headers):
+    mock_inst = mock_cls.return_value
+    mock_inst.subir_foto_visita.return_value = "visitas/v/foto.jpg"
+    mock_inst.descargar_bytes_y_tipo.return_value = (b"IMG", "image/jpeg")
+    payload = {
+        "id_vendedor": "seller-etag",
+        "id_cliente": "cli-etag",
+        "direccion": "Calle 7",
+        "ciudad": "Quito",
+        "contacto": "Leo",
+        "fecha": "2025-12-03",
+    }
+    visita_id = client.post("/v1/visitas", json=payload, headers=headers).json()["id"]
+    files = {"foto": ("f.jpg", b"BYTES", "image/jpeg")}
+    client.post(f"/v1/visitas/{visita_id}/detalle", data={"id_cliente": "cli-etag"}, files=files, headers=headers)
+
+    r1 = client.get(f"/v1/visitas/{visita_id}", headers=headers)
+    assert r1.status_code == 200
+    etag = r1.headers["ETag"]
+    assert mock_inst.descargar_bytes_y_tipo.call_count == 1
+
+    r2 = client.get(f"/v1/visitas/{visita_id}", headers={**headers, "If-None-Match": etag})
+    assert r2.status_code == 304
+    assert r2.content == b"" and r2.headers["ETag"] == etag
+    assert mock_inst.descargar_bytes_y_tipo.call_count == 1
+
+    # otra representación (sin foto), otro ETag; y tampoco descarga la foto
+    r3 = client.get(f"/v1/visitas/{visita_id}?incluir_foto_ios=false", headers={**headers, "If-None-Match": etag})
+    assert r3.status_code == 200 and r3.headers["ETag"] != etag
+    assert mock_inst.descargar_bytes_y_tipo.call_count == 1
+
+    # actualizar el detalle de una visita ya finalizada cambia el ETag
+    client.post(f"/v1/visitas/{visita_id}/detalle", data={"id_cliente": "cli-etag", "hallazgos": "Nuevo"}, headers=headers)
+    r4 = client.get(f"/v1/visitas/{visita_id}", headers={**headers, "If-None-Match": etag})
+    assert r4.status_code == 200
+    assert r4.json()["detalle"]["hallazgos"] == "Nuevo"
+
+
+@patch("src.services.servicio_visitas.CargadorGCS")
+def test_obtener_visita_sin_etag_si_la_foto_no_se_pudo_descargar(mock_cls, client, headers):
+    mock_inst = mock_cls.return_value
+    mock_inst.subir_foto_visita.return_value = "visitas/v/foto.jpg"
+    mock_inst.descargar_bytes_y_tipo.side_effect = RuntimeError("GCS caído")
+    payload = {
+        "id_vendedor": "seller-etag-gcs",
+        "id_cliente": "cli-etag-gcs",
+        "direccion": "Calle 8",
+        "ciudad": "Quito",
+        "contacto": "Ana",
+        "fecha": "2025-12-04",
+    }
+    visita_id = client.post("/v1/visitas", json=payload, headers=headers).json()["id"]
+    files = {"foto": ("f.jpg", b"BYTES", "image/jpeg")}
+    client.post(f"/v1/visitas/{visita_id}/detalle", data={"id_cliente": "cli-etag-gcs"}, files=files, headers=headers)
+
+    r1 = client.get(f"/v1/visitas/{visita_id}", headers=headers)
+    assert r1.status_code == 200
+    assert r1.json()["foto_ios"] is None
+    assert "ETag" not in r1.headers
+
+    # con GCS de vuelta la respuesta completa sí lleva ETag y la foto
+    mock_inst.descargar_bytes_y_tipo.side_effect = None
+    mock_inst.descargar_bytes_y_tipo.return_value = (b"IMG", "image/jpeg")
+    r2 = client.get(f"/v1/visitas/{visita_id}", headers=headers)
+    assert r2.json()["foto_ios"].startswith("data:image/jpeg;base64,")
+    assert "ETag" in r2.headers
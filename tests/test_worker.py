@@ -0,0 +1,91 @@
+import json
+import threading
+import time
+from concurrent.futures import Future
+from datetime import date
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from src.worker import Worker
+
+
+class _Mensaje:
+    def __init__(self, data, message_id):
+        self.data = data if isinstance(data, bytes) else json.dumps(data).encode("utf-8")
+        self.message_id = message_id
+        self.acks = 0
+
+    def ack(self):
+        self.acks += 1
+
+
+class _SubscriberEnProceso:
+    """Entrega los mensajes a través del scheduler recibido, como el cliente real."""
+
+    def __init__(self, mensajes):
+        self.mensajes = mensajes
+        self.kwargs = None
+
+    def subscribe(self, suscripcion, callback, **kwargs):
+        self.suscripcion, self.kwargs = suscripcion, kwargs
+        scheduler = kwargs["scheduler"]
+        futuro = Future()
+
+        def entregar():
+            for m in self.mensajes:
+                scheduler.schedule(callback, m)
+            # shutdown() descarta lo no iniciado: se espera a que todo tenga ack
+            while not all(m.acks for m in self.mensajes):
+                time.sleep(0.005)
+            scheduler.shutdown(await_msg_callbacks=True)
+            futuro.set_result(None)
+
+        threading.Thread(target=entregar).start()
+        return futuro
+
+
+def _sesion_falsa(mock_session_for_schema):
+    cm = MagicMock()
+    cm.__enter__.return_value = MagicMock()
+    cm.__exit__.return_value = False
+    mock_session_for_schema.return_value = cm
+
+
+@patch("src.services.eventos.session_for_schema")
+@patch("src.services.eventos.ServicioRecalculoLote")
+def test_worker_despacha_con_la_misma_logica_que_push(mock_svc_cls, mock_session_for_schema):
+    _sesion_falsa(mock_session_for_schema)
+    mensajes = [
+        _Mensaje({"event": "recalcular_planes_del_dia", "fecha": "2025-10-21", "ctx": {"country": "co"}}, "m-1"),
+        _Mensaje({"event": "recalcular_planes_del_dia", "fecha": "2025-10-21", "ctx": {"country": "co"}}, "m-1"),
+        _Mensaje({"event": "recalcular_planes_del_dia", "fecha": "2025-10-22", "ctx": {"country": "mx"}}, "m-2"),
+        _Mensaje(b"{no-json", "m-3"),
+    ]
+    subscriber = _SubscriberEnProceso(mensajes)
+    worker = Worker("projects/p/subscriptions/ventas", subscriber=subscriber, max_mensajes=5, max_bytes=1024, hilos=2)
+
+    worker.iniciar().result(timeout=5)
+
+    assert subscriber.suscripcion == "projects/p/subscriptions/ventas"
+    flow = subscriber.kwargs["flow_control"]
+    assert (flow.max_messages, flow.max_bytes) == (5, 1024)
+    # reentrega (mismo messageId) omitida; todos con ack, también el inválido
+    fechas = sorted(c.args[0] for c in mock_svc_cls.return_value.recalcular_fecha.call_args_list)
+    assert fechas == [date(2025, 10, 21), date(2025, 10, 22)]
+    assert [m.acks for m in mensajes] == [1, 1, 1, 1]
+
+
+@patch("src.services.eventos.procesar_mensaje", side_effect=RuntimeError("BD caída"))
+def test_error_inesperado_igual_hace_ack(_procesar):
+    mensaje = _Mensaje({"event": "recalcular_planes_del_dia", "ctx": {"country": "co"}}, "m-9")
+    Worker("projects/p/subscriptions/ventas").procesar(mensaje)
+    assert mensaje.acks == 1
+
+
+def test_worker_exige_suscripcion(monkeypatch):
+    from src.config import settings
+
+    monkeypatch.setattr(settings, "PUBSUB_SUSCRIPCION_VENTAS_CRM", None)
+    with pytest.raises(ValueError):
+        Worker()